@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+import hashlib
+import json
+import os.path
+
+from functions import writeFileAtomically
+from manifest import sourceFingerprint
+
+# Offline translation jobs in the JSONL format of the OpenAI Batch API. Every line of the request file asks for the
+# translation of one key to one language, and the results file returned for it is matched back by custom_id.
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+def batchCustomId(stringsFileName, outputTargetCode, translationTuple):
+    """
+    custom_id of the request translating a key to a language. It stays the same between runs as long as the source
+    of the key does not change, so results of a job exported for an older source are not used.
+    """
+    keyHash = hashlib.sha1((stringsFileName + "\0" + translationTuple['key']).encode("utf-8")).hexdigest()[:16]
+    return "%s-%s-%s" % (outputTargetCode, keyHash, sourceFingerprint(translationTuple)[:8])
+#end def
+
+def batchRequestLine(customId, body):
+    return json.dumps({'custom_id': customId, 'method': "POST", 'url': BATCH_ENDPOINT, 'body': body},
+                      ensure_ascii=False, sort_keys=True)
+#end def
+
+def writeBatchRequests(fileName, requestLines):
+    """
+    Write the request lines of a job as a JSONL file, replacing any previous file.
+
+    :return: number of requests written
+    """
+    writeFileAtomically(os.path.abspath(fileName), "".join(line + "\n" for line in requestLines))
+    return len(requestLines)
+#end def
+
+def readBatchResults(fileName, contentOf):
+    """
+    Read the results file (or error file) of a job.
+
+    :param fileName: JSONL file downloaded from the Batch API
+    :param contentOf: returns the translation found in the body of a chat completion, or None
+    :return: dict of custom_id to (translation, error), with translation None for failed requests
+    """
+    results = {}
+    with open(fileName, "r", encoding="utf-8") as resultsFile:
+        for (lineNumber, line) in enumerate(resultsFile, 1):
+            if len(line.strip()) == 0:
+                continue
+            #end if
+
+            try:
+                result = json.loads(line)
+                customId = result['custom_id']
+            except (ValueError, KeyError, TypeError) as e:
+                print("Ignoring invalid result on line %s of %s: %s" % (lineNumber, fileName, e))
+                continue
+            #end try
+
+            response = result.get('response') or {}
+            if result.get('error'):
+                results[customId] = (None, result['error'].get('message', result['error']))
+            elif response.get('status_code') != 200:
+                results[customId] = (None, "status code %s" % (response.get('status_code')))
+            else:
+                translation = contentOf(response.get('body') or {})
+                results[customId] = (translation, None if translation is not None else "no translation in result")
+            #end if
+        #end for
+    #end with
+
+    return results
+#end def
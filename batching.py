@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+from rate_limiter import RetriesExhaustedError, classifyError, isRequestError
+
+# Request limits of each translator, used to group the strings of a language into as few requests as possible.
+#
+# DeepL accepts up to 50 texts and 128 KiB per request. The Google web endpoint used by googletrans only takes a
+# single text of about 5000 characters, so strings are joined by new lines into one text and split up again.
+# OpenAI completions are sent one string at a time, unless batched prompting is enabled (see OpenAIProvider).
+# LibreTranslate compatible servers take a list of texts.
+DEFAULT_BATCH_LIMITS = {
+    'google': {'maxItems': 50, 'maxChars': 4500},
+    'deepl': {'maxItems': 50, 'maxChars': 100000},
+    'openai': {'maxItems': 1, 'maxChars': 0},
+    'http': {'maxItems': 50, 'maxChars': 20000},
+}
+
+class BatchSizeMismatchError(Exception):
+    """
+    Raised when a translator returns a different number of results than the number of texts sent in a batch.
+    """
+    pass
+#end class
+
+def batchLimitsFor(providerName, maxItems=0):
+    """
+    Return the request limits of a translator.
+
+    :param providerName: translator name
+    :param maxItems: optional override of the maximum number of strings per request (e.g. 1 to disable batching)
+    :return: dict with maxItems and maxChars (0 meaning no character limit)
+    """
+    limits = dict(DEFAULT_BATCH_LIMITS.get(providerName, {'maxItems': 1, 'maxChars': 0}))
+    if maxItems > 0:
+        limits['maxItems'] = maxItems
+    #end if
+
+    return limits
+#end def
+
+def makeBatches(items, maxItems, maxChars=0, sizeOf=len, isolate=None):
+    """
+    Group items into consecutive batches that fit within the given request limits. The order of the items is kept.
+
+    :param items: items to group
+    :param maxItems: maximum number of items in a batch
+    :param maxChars: maximum total characters of the texts in a batch, 0 for no limit. An item larger than the
+                     limit gets a batch of its own.
+    :param sizeOf: returns the number of characters an item adds to a request
+    :param isolate: optional predicate for items that must be sent on their own
+    :return: list of batches (lists of items)
+    """
+    batches = []
+    current = []
+    currentChars = 0
+    maxItems = max(1, maxItems)
+
+    for item in items:
+        itemChars = sizeOf(item)
+
+        if isolate is not None and isolate(item):
+            if current:
+                batches.append(current)
+            #end if
+            batches.append([item])
+            current = []
+            currentChars = 0
+            continue
+        #end if
+
+        if current and (len(current) >= maxItems or (maxChars > 0 and currentChars + itemChars > maxChars)):
+            batches.append(current)
+            current = []
+            currentChars = 0
+        #end if
+
+        current.append(item)
+        currentChars += itemChars
+    #end for
+
+    if current:
+        batches.append(current)
+    #end if
+
+    return batches
+#end def
+
+def translateBatch(texts, requestFn, classify=classifyError):
+    """
+    Translate a batch of texts with a single request. If the request is rejected for its texts or its size, the batch
+    is split in half and each half retried, so a text the translator rejects only fails by itself instead of failing
+    the whole batch. Other errors, such as a wrong key or an exhausted quota, fail the whole batch at once.
+
+    :param texts: list of source texts, or of items describing them, passed as is to requestFn
+    :param requestFn: performs one request for a list of texts and returns the list of translated texts
+    :param classify: returns the kind of an error, see rate_limiter.classifyError
+    :return: list of (translatedText, error) tuples in the order of texts, with error set for failed texts
+    """
+    try:
+        results = requestFn(texts)
+        if results is None or len(results) != len(texts):
+            raise BatchSizeMismatchError("Expected %s translations, got %s" % (
+                len(texts), 0 if results is None else len(results)))
+        #end if
+
+        return [(result, None) for result in results]
+    except Exception as e:
+        # A request that kept being throttled or failing, or that the account may not send, would fail the same way
+        # split in two
+        splittable = isinstance(e, BatchSizeMismatchError) or (
+            not isinstance(e, RetriesExhaustedError) and classify(e)[0] is None and isRequestError(e))
+        if len(texts) == 1 or not splittable:
+            return [(None, e)] * len(texts)
+        #end if
+
+        middle = len(texts) // 2
+        return (translateBatch(texts[:middle], requestFn, classify) +
+                translateBatch(texts[middle:], requestFn, classify))
+    #end try
+#end def
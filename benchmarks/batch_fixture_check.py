@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+import argparse
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+from functions import readTranslations
+from pipeline import TranslationPipeline, readLanguageCodes
+from providers import createProvider
+
+# Checks the OpenAI Batch API export and ingest offline, with the files in fixtures/batch: the requests exported for
+# the source must match batch_requests.jsonl, and ingesting batch_results.jsonl, which has a failed request and a
+# request with an error status, must write exactly the expected keys and report the others as not translated.
+#
+# Usage: python3 benchmarks/batch_fixture_check.py
+#        python3 benchmarks/batch_fixture_check.py -u   (after changing the request format on purpose)
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "batch")
+SOURCE_PATH = os.path.join(FIXTURES_PATH, "en.lproj", "Localizable.strings")
+REQUESTS_PATH = os.path.join(FIXTURES_PATH, "batch_requests.jsonl")
+RESULTS_PATH = os.path.join(FIXTURES_PATH, "batch_results.jsonl")
+
+# Keys written for each output language, and custom_ids reported as not translated
+EXPECTED_TRANSLATIONS = {
+    "es": {"Hello": "Hola", "Goodbye": "Adiós", "Settings": "Ajustes"},
+    "fr": {"Hello": "Bonjour"},
+}
+EXPECTED_FAILURES = {
+    "fr-4edfc69807daf309-e5fe8848": "Rate limit reached for requests",
+    "fr-13a738507a36d6a6-c766c924": "status code 500",
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-u", action="store_true", help="rewrite batch_requests.jsonl with the requests exported now")
+args = parser.parse_args()
+
+def readLines(fileName):
+    with open(fileName, "r", encoding="utf-8") as linesFile:
+        return linesFile.read().splitlines()
+    #end with
+#end def
+
+def createPipeline(workDir, log):
+    provider = createProvider("openai")
+    return TranslationPipeline(provider, readLanguageCodes(os.path.join(FIXTURES_PATH, "LanguageCodes.txt")),
+                               outputPath=os.path.join(workDir, "output"), cacheDir=os.path.join(workDir, "cache"),
+                               log=log)
+#end def
+
+def checkExport(workDir):
+    """
+    :return: list of problems found
+    """
+    exportPath = os.path.join(workDir, "requests.jsonl")
+    with createPipeline(workDir, lambda message: None) as pipeline:
+        pipeline.exportBatchRequests(pipeline.readSources([SOURCE_PATH]), exportPath)
+    #end with
+
+    if args.u:
+        shutil.copyfile(exportPath, REQUESTS_PATH)
+        print("Wrote %s" % (REQUESTS_PATH))
+    #end if
+
+    problems = []
+    (expectedLines, exportedLines) = (readLines(REQUESTS_PATH), readLines(exportPath))
+    if exportedLines != expectedLines:
+        problems.append("exported requests differ from %s: %s lines exported, %s expected" % (
+            os.path.basename(REQUESTS_PATH), len(exportedLines), len(expectedLines)))
+    #end if
+
+    return problems
+#end def
+
+def checkIngest(workDir):
+    """
+    :return: list of problems found
+    """
+    messages = []
+    with createPipeline(workDir, messages.append) as pipeline:
+        pipeline.ingestBatchResults(RESULTS_PATH)
+        results = list(pipeline.translate(pipeline.readSources([SOURCE_PATH])))
+    #end with
+
+    problems = []
+    for result in results:
+        written = dict((translation['key'], translation['value'])
+                       for translation in readTranslations(result['outputPath']))
+        expected = EXPECTED_TRANSLATIONS[result['outputTargetCode']]
+        if written != expected:
+            problems.append("%s: wrote %s, expected %s" % (result['outputTargetCode'], written, expected))
+        #end if
+    #end for
+
+    failures = {}
+    for message in messages:
+        if "No batch result for " in message:
+            (customId, error) = message.split("No batch result for ", 1)[1].split(": ", 1)
+            failures[customId.split(" ")[0]] = error
+        #end if
+    #end for
+    if failures != EXPECTED_FAILURES:
+        problems.append("reported as not translated %s, expected %s" % (failures, EXPECTED_FAILURES))
+    #end if
+
+    return problems
+#end def
+
+workDir = tempfile.mkdtemp(prefix="batch-fixture-check-")
+try:
+    problems = checkExport(workDir) + checkIngest(workDir)
+finally:
+    shutil.rmtree(workDir, ignore_errors=True)
+#end try
+
+for problem in problems:
+    print("FAILED: %s" % (problem))
+#end for
+if problems:
+    sys.exit(1)
+#end if
+print("OK: batch export and ingest match the fixtures")
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+import argparse
+import contextlib
+import json
+import os
+import os.path
+import platform
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+from catalogs import changeValues, generateStrings, writeCatalog
+from fake_providers import installFakeProviders
+from functions import StringsWriter, readTranslations
+from parse_cache import ParseCache
+
+# Benchmarks the parser, the writer and full translate.py runs (all keys, and delta runs with -d) on generated
+# catalogs, with in-process fake translators instead of the network. Results can be saved as JSON and compared with
+# the results of another commit.
+#
+# Usage: python3 benchmarks/benchmark_suite.py -s 1000,10000 -o before.json
+#        python3 benchmarks/benchmark_suite.py -s 1000,10000 -c before.json
+
+TRANSLATE_PATH = os.path.join(ROOT_PATH, "translate.py")
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-s", default="1000,10000,100000", help="set the comma separated numbers of keys of the catalogs")
+parser.add_argument("-l", default="3", help="set the number of languages translated to")
+parser.add_argument("-r", default="3", help="set the number of times each benchmark is run, the best time is compared")
+parser.add_argument("-d", default="0", help="set the latency in seconds of each request to the fake translators")
+parser.add_argument("-p", default="google,deepl,openai", help="set the comma separated translators to benchmark")
+parser.add_argument("-b", default="parse,write,translate,delta",
+                    help="set the comma separated benchmarks to run: parse, write, translate and delta")
+parser.add_argument("-o", default="", help="set the file to save the results to as JSON")
+parser.add_argument("-c", default="", help="set a file of results saved with -o to compare against")
+args = parser.parse_args()
+
+def gitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_PATH,
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    #end try
+#end def
+
+def languageCodeLines(totalLanguages):
+    """
+    Lines of LanguageCodes.txt for the given number of languages, taken from the languages listed in the repository
+    whether they are commented out or not.
+    """
+    lines = []
+    with open(os.path.join(ROOT_PATH, "LanguageCodes.txt"), "r") as languageCodesFile:
+        for line in languageCodesFile:
+            fields = line.strip().lstrip("#").split()
+            if len(fields) == 4:
+                lines.append("\t".join(fields) + "\n")
+            #end if
+        #end for
+    #end with
+
+    return lines[:totalLanguages]
+#end def
+
+def measure(name, keys, fn, setup=None):
+    """
+    Run a benchmark the configured number of times.
+
+    :param fn: code measured
+    :param setup: optional code run before each run, not measured
+    :return: result dict
+    """
+    times = []
+    for _ in range(max(1, int(args.r))):
+        if setup is not None:
+            setup()
+        #end if
+
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    #end for
+
+    result = {'name': name, 'keys': keys, 'seconds': min(times), 'median': statistics.median(times),
+              'runs': len(times)}
+    print("%-32s %10.4fs %10.4fs  %10.0f keys/s" % (name, result['seconds'], result['median'],
+                                                    keys / result['seconds'] if result['seconds'] > 0 else 0))
+    return result
+#end def
+
+def runTranslate(workDir, arguments):
+    """
+    Run translate.py in this process, from workDir, with its output silenced.
+    """
+    previousDir = os.getcwd()
+    previousArgv = sys.argv
+    os.chdir(workDir)
+    sys.argv = [TRANSLATE_PATH] + arguments
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            runpy.run_path(TRANSLATE_PATH, run_name="__main__")
+        #end with
+    finally:
+        sys.argv = previousArgv
+        os.chdir(previousDir)
+    #end try
+#end def
+
+def translateArguments(workDir, translator, sourcePath):
+    arguments = ["-t", translator, "-f", sourcePath, "--no-cache", "--rate", "0",
+                 "--cache-dir", os.path.join(workDir, "cache"), "--metrics", os.path.join(workDir, "metrics.json")]
+    if translator == "deepl":
+        arguments += ["-a", "fake"]
+    elif translator == "openai":
+        arguments += ["--openai-batch"]
+    #end if
+
+    return arguments
+#end def
+
+def benchmarkSize(totalKeys, workDir):
+    results = []
+    benchmarks = [name.strip() for name in args.b.split(",")]
+    translators = [name.strip() for name in args.p.split(",") if name.strip()]
+
+    content = generateStrings(totalKeys)
+    sourcePath = os.path.join(workDir, "en.lproj", "Localizable.strings")
+    writeCatalog(sourcePath, content)
+    utf16Path = os.path.join(workDir, "utf16", "Localizable.strings")
+    writeCatalog(utf16Path, content, encoding="utf-16")
+    with open(os.path.join(workDir, "LanguageCodes.txt"), "w") as languageCodesFile:
+        languageCodesFile.writelines(languageCodeLines(int(args.l)))
+    #end with
+
+    # Files modified within the last seconds are not stored in the parse cache
+    past = time.time() - 60
+    os.utime(sourcePath, (past, past))
+    os.utime(utf16Path, (past, past))
+
+    if "parse" in benchmarks:
+        results.append(measure("parse/utf-8/%s" % (totalKeys), totalKeys, lambda: readTranslations(sourcePath)))
+        results.append(measure("parse/utf-16/%s" % (totalKeys), totalKeys, lambda: readTranslations(utf16Path)))
+
+        parseCache = ParseCache(os.path.join(workDir, "parsed"))
+        readTranslations(sourcePath, parseCache=parseCache)
+        results.append(measure("parse/cached/%s" % (totalKeys), totalKeys,
+                               lambda: readTranslations(sourcePath, parseCache=parseCache)))
+    #end if
+
+    if "write" in benchmarks:
+        translations = readTranslations(sourcePath)
+        outputPath = os.path.join(workDir, "written", "Localizable.strings")
+
+        def writeAll():
+            writer = StringsWriter("Localizable.strings", "fr", fileName=outputPath)
+            for translation in translations:
+                writer.writeTranslation(translation['key'], translation['value'], translation['comment'])
+            #end for
+            writer.close()
+        #end def
+
+        results.append(measure("write/%s" % (totalKeys), totalKeys, writeAll))
+    #end if
+
+    for translator in translators:
+        arguments = translateArguments(workDir, translator, sourcePath)
+        translatedKeys = totalKeys * len(languageCodeLines(int(args.l)))
+
+        if "translate" in benchmarks:
+            results.append(measure("translate/%s/%s" % (translator, totalKeys), translatedKeys,
+                                   lambda: runTranslate(workDir, arguments)))
+        #end if
+
+        if "delta" in benchmarks:
+            # Translate everything once, then edit 1% of the source and only translate what changed
+            existingPath = os.path.join(workDir, "existing")
+            manifestsPath = os.path.join(workDir, "cache", "manifests")
+            shutil.rmtree(manifestsPath, ignore_errors=True)
+            writeCatalog(sourcePath, content)
+            runTranslate(workDir, arguments)
+            shutil.rmtree(existingPath, ignore_errors=True)
+            shutil.copytree(os.path.join(workDir, "output"), existingPath)
+            shutil.copytree(manifestsPath, manifestsPath + ".saved")
+            writeCatalog(sourcePath, changeValues(content, 100))
+
+            def restoreManifests():
+                shutil.rmtree(manifestsPath, ignore_errors=True)
+                shutil.copytree(manifestsPath + ".saved", manifestsPath)
+            #end def
+
+            results.append(measure("delta/%s/%s" % (translator, totalKeys), translatedKeys,
+                                   lambda: runTranslate(workDir, arguments + ["-d", existingPath]),
+                                   setup=restoreManifests))
+
+            writeCatalog(sourcePath, content)
+            shutil.rmtree(manifestsPath + ".saved")
+        #end if
+    #end for
+
+    return results
+#end def
+
+def compareResults(results, previousFileName):
+    with open(previousFileName, "r", encoding="utf-8") as previousFile:
+        previous = json.load(previousFile)
+    #end with
+    previousSeconds = dict((result['name'], result['seconds']) for result in previous['results'])
+
+    print("\nCompared to %s (%s):" % (previousFileName, previous.get('commit') or "unknown commit"))
+    for result in results:
+        if result['name'] not in previousSeconds:
+            continue
+        #end if
+
+        before = previousSeconds[result['name']]
+        change = (result['seconds'] - before) / before * 100 if before > 0 else 0
+        print("%-32s %10.4fs -> %10.4fs  %+7.1f%%" % (result['name'], before, result['seconds'], change))
+    #end for
+#end def
+
+installFakeProviders(float(args.d))
+
+print("%-32s %11s %11s" % ("benchmark", "best", "median"))
+allResults = []
+for totalKeys in [int(size) for size in args.s.split(",") if size.strip()]:
+    workDir = tempfile.mkdtemp(prefix="auto_localize_bench_")
+    try:
+        allResults += benchmarkSize(totalKeys, workDir)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    #end try
+#end for
+
+report = {
+    'version': 1,
+    'commit': gitCommit(),
+    'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'options': {'sizes': args.s, 'languages': int(args.l), 'runs': int(args.r), 'latency': float(args.d),
+                'translators': args.p},
+    'results': allResults,
+}
+
+if len(args.o.strip()) != 0:
+    with open(args.o.strip(), "w", encoding="utf-8") as outputFile:
+        json.dump(report, outputFile, indent=2)
+    #end with
+    print("\nSaved results to %s" % (args.o.strip()))
+#end if
+
+if len(args.c.strip()) != 0:
+    compareResults(allResults, args.c.strip())
+#end if
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+import os
+import os.path
+import random
+
+# Generates synthetic .strings catalogs for the benchmarks: formatters, escapes, property keys, // comments, long
+# comments and repeated values such as "OK", as found in real apps.
+
+WORDS = ["Hello", "world", "settings", "battery", "coins", "delete", "photo", "account", "open", "share"]
+COMMON_VALUES = ["OK", "Cancel", "Done", "Delete", "Settings"]
+
+def generateStrings(totalKeys, longestComment=2000, seed=None):
+    """
+    Generate the contents of a .strings file.
+
+    :param totalKeys: number of keys in the file
+    :param longestComment: length of the longest comments
+    :param seed: random seed, defaults to totalKeys so the same file is generated every time
+    :return: contents of the file
+    """
+    generator = random.Random(totalKeys if seed is None else seed)
+    lines = ["/*\n  Localizable.strings\n  Generated for benchmarking\n*/\n\n"]
+    for index in range(totalKeys):
+        if index % 17 == 0:
+            text = COMMON_VALUES[index % len(COMMON_VALUES)]
+        else:
+            text = " ".join(generator.choice(WORDS) for _ in range(generator.randint(1, 8)))
+        #end if
+        if index % 7 == 0:
+            text = "%d " + text
+        #end if
+        if index % 11 == 0:
+            text = text + " %1$@ \\\"quoted\\\"\\n"
+        #end if
+
+        if index % 50 == 0:
+            lines.append("/* " + ("long comment " * generator.randint(1, max(1, longestComment // 13))) + " */\n")
+        elif index % 5 == 0:
+            lines.append("/* Comment for key %s */\n" % (index))
+        elif index % 13 == 0:
+            lines.append("// Line comment for key %s\n" % (index))
+        #end if
+
+        if index % 97 == 0:
+            lines.append("property_%s = \"%s\";\n\n" % (index, text))
+        else:
+            lines.append("\"key.%s\" = \"%s\";\n\n" % (index, text))
+        #end if
+    #end for
+
+    return "".join(lines)
+#end def
+
+def changeValues(content, every):
+    """
+    Change the value of one key in every given number, as if the source was edited since the last translation.
+    """
+    changed = []
+    for (index, line) in enumerate(content.split("\n")):
+        if line.startswith("\"key.") and index % every == 0:
+            line = line[:-2] + " (edited)\";"
+        #end if
+        changed.append(line)
+    #end for
+
+    return "\n".join(changed)
+#end def
+
+def writeCatalog(fileName, content, encoding="utf-8"):
+    """
+    Write a catalog to a file, creating its directory. UTF-16 files get a byte order mark, like the ones written by
+    Xcode.
+    """
+    directory = os.path.dirname(fileName)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    #end if
+
+    with open(fileName, "w", encoding=encoding) as catalogFile:
+        catalogFile.write(content)
+    #end with
+#end def
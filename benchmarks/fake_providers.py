@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+import json
+import time
+import types
+
+import providers
+
+# In-process stand-ins for the Google, DeepL and OpenAI clients, so translate.py can be benchmarked without network
+# access. Each request sleeps for the configured latency, then "translates" texts by prefixing the target language.
+
+class FakeGoogleClient:
+    def __init__(self, latency):
+        self.latency = latency
+    #end def
+
+    def translate(self, text, src=None, dest=None):
+        time.sleep(self.latency)
+        return types.SimpleNamespace(text="\n".join("[%s] %s" % (dest, line) for line in text.split("\n")))
+    #end def
+#end class
+
+class FakeDeepLClient:
+    def __init__(self, latency):
+        self.latency = latency
+    #end def
+
+    def translate_text(self, texts, source_lang=None, target_lang=None, **options):
+        time.sleep(self.latency)
+        return [types.SimpleNamespace(text="[%s] %s" % (target_lang, text)) for text in texts]
+    #end def
+#end class
+
+class FakeOpenAIClient:
+    def __init__(self, latency):
+        self.Completion = types.SimpleNamespace(create=self.complete)
+        self.ChatCompletion = types.SimpleNamespace(create=self.chat)
+        self.latency = latency
+    #end def
+
+    def complete(self, prompt=None, **options):
+        time.sleep(self.latency)
+        text = prompt.rsplit(": ", 1)[-1].rstrip(".")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(text="[fake] " + text)])
+    #end def
+
+    def chat(self, model=None, messages=None, **options):
+        time.sleep(self.latency)
+        entries = json.loads(messages[-1]['content'])
+        answer = dict((entryId, "[%s] %s" % (model, entry['text'])) for (entryId, entry) in entries.items())
+        message = types.SimpleNamespace(content=json.dumps(answer, ensure_ascii=False))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+    #end def
+#end class
+
+def installFakeProviders(latency=0.0):
+    """
+    Replace the google, deepl and openai providers used by createProvider with fakes answering after the given
+    number of seconds.
+    """
+    fakeClients = {
+        'google': lambda: FakeGoogleClient(latency),
+        'deepl': lambda: FakeDeepLClient(latency),
+        'openai': lambda: FakeOpenAIClient(latency),
+    }
+
+    for (name, createFakeClient) in fakeClients.items():
+        providerClass = providers.providerClass(name)
+        if getattr(providerClass, 'fake', False):
+            providerClass = providerClass.__bases__[0]
+        #end if
+
+        providers.registerProvider(type("Fake" + providerClass.__name__, (providerClass,), {
+            'fake': True,
+            'createClient': lambda self, createFakeClient=createFakeClient: createFakeClient(),
+            'close': providers.TranslationProvider.close,
+        }), name)
+    #end for
+#end def
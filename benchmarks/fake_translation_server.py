@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+import argparse
+import json
+import random
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local LibreTranslate compatible server for trying out the rate limiting and retries of translate.py without a real
+# translator. Texts are "translated" by prefixing them with the target language. Requests over the sustained rate
+# are answered with 429 and a Retry-After, and a share of the others can fail with a 503.
+#
+# Usage: python3 benchmarks/fake_translation_server.py -p 5000 -r 20 -e 0.05
+#        python3 translate.py -t http --http-url http://localhost:5000/translate
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-p", default="5000", help="set the port to listen on")
+parser.add_argument("-r", default="20", help="set the number of requests per second sustained before answering 429")
+parser.add_argument("-b", default="5", help="set the number of requests allowed in a burst above the sustained rate")
+parser.add_argument("-a", default="1", help="set the Retry-After sent with 429 responses, empty to send none")
+parser.add_argument("-e", default="0", help="set the share of requests (0 to 1) failing with a 503")
+parser.add_argument("-l", default="0.01", help="set the seconds each request takes")
+args = parser.parse_args()
+
+class Throttle:
+    """
+    Token bucket deciding which requests are throttled.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updatedAt = time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'translated': 0, 'throttled': 0, 'failed': 0}
+    #end def
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.stats['requests'] += 1
+            self.tokens = min(self.burst, self.tokens + (now - self.updatedAt) * self.rate)
+            self.updatedAt = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            #end if
+
+            self.stats['throttled'] += 1
+            return False
+        #end with
+    #end def
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+        #end with
+    #end def
+#end class
+
+throttle = Throttle(float(args.r), float(args.b))
+
+class TranslateHandler(BaseHTTPRequestHandler):
+    def reply(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        #end for
+        self.end_headers()
+        self.wfile.write(data)
+    #end def
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+
+        if not throttle.allow():
+            self.reply(429, {'error': "Too many requests"}, {'Retry-After': args.a} if args.a else None)
+            return
+        #end if
+
+        time.sleep(float(args.l))
+        if random.random() < float(args.e):
+            throttle.count('failed')
+            self.reply(503, {'error': "Service unavailable"})
+            return
+        #end if
+
+        texts = payload.get('q', [])
+        translate = lambda text: "[%s] %s" % (payload.get('target'), text)
+        throttle.count('translated')
+        self.reply(200, {'translatedText': [translate(text) for text in texts] if isinstance(texts, list)
+                         else translate(texts)})
+    #end def
+
+    def log_message(self, format, *logArgs):
+        pass
+    #end def
+#end class
+
+# Stop cleanly when killed, so the totals are printed
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+server = ThreadingHTTPServer(("127.0.0.1", int(args.p)), TranslateHandler)
+print("Fake translation server on http://127.0.0.1:%s/translate, %s requests per second" % (args.p, args.r),
+      flush=True)
+try:
+    server.serve_forever()
+except (KeyboardInterrupt, SystemExit):
+    pass
+finally:
+    print("Requests: %(requests)s, translated: %(translated)s, throttled: %(throttled)s, failed: %(failed)s" % (
+        throttle.stats))
+#end try
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+import argparse
+import os
+import os.path
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from strings_parser import iterTranslations
+from catalogs import generateStrings
+
+# Compares the streaming .strings parser against the regex based parser it replaced, on a generated file.
+#
+# Usage: python3 benchmarks/parser_benchmark.py -k 20000 -r 5
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-k", default="20000", help="set the number of keys in the generated file")
+parser.add_argument("-r", default="5", help="set the number of times each parser is run, the best time is reported")
+parser.add_argument("-c", default="2000", help="set the length of the longest comments in the generated file")
+args = parser.parse_args()
+
+def readTranslationsRegex(f):
+    """
+    The regex based parser previously used by functions.readTranslations, kept here for comparison.
+    """
+    stringset = []
+    cp = r'(?:/\*(?P<comment>(?:[^*]|(?:\*+[^*/]))*\**)\*/)'
+    p = re.compile(
+        r'(?:%s[ \t]*[\n]|[\r\n]|[\r]){0,1}(?P<line>(("(?P<key>[^"\\]*(?:\\.[^"\\]*)*)")|(?P<property>\w+))\s*=\s*"(?P<value>[^"\\]*(?:\\.[^"\\]*)*)"\s*;)' % cp,
+        re.DOTALL | re.U)
+    c = re.compile(r'//[^\n]*\n|/\*(?:.|[\r\n])*?\*/', re.U)
+    ws = re.compile(r'\s+', re.U)
+    end = 0
+    start = 0
+    for i in p.finditer(f):
+        start = i.start('line')
+        end_ = i.end()
+        key = i.group('key')
+        comment = i.group('comment') or ''
+
+        if not key:
+            key = i.group('property')
+        #end if
+
+        value = i.group('value')
+        while end < start:
+            m = c.match(f, end, start) or ws.match(f, end, start)
+            if not m or m.start() != end:
+                print("Invalid syntax: %s" % f[end:start])
+            #end if
+            end = m.end()
+        #end while
+        end = end_
+        stringset.append({'key': key, 'value': value, 'comment': comment})
+    return stringset
+#end def
+
+def bestTime(fn, runs):
+    best = None
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    #end for
+
+    return (best, result)
+#end def
+
+content = generateStrings(int(args.k), int(args.c))
+print("Generated %s keys, %.1f MB" % (args.k, len(content.encode("utf-8")) / 1024.0 / 1024.0))
+
+(regexTime, regexEntries) = bestTime(lambda: readTranslationsRegex(content), int(args.r))
+(streamingTime, streamingEntries) = bestTime(lambda: list(iterTranslations(content)), int(args.r))
+
+print("regex parser:     %.3fs" % (regexTime))
+print("streaming parser: %.3fs (%.2fx)" % (streamingTime, regexTime / streamingTime))
+
+if regexEntries != streamingEntries:
+    print("ERROR: parsers returned different entries")
+    sys.exit(1)
+#end if
+print("Both parsers returned the same %s entries" % (len(streamingEntries)))
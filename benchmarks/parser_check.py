@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+import os
+import os.path
+import sys
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+from strings_parser import StringsSyntaxError, iterTranslations
+
+# Checks how the .strings parser recovers from invalid syntax: the invalid entry is skipped, and parsing goes on with
+# the next entry, also when the error is only noticed on the line after the invalid entry.
+#
+# Usage: python3 benchmarks/parser_check.py
+
+# Contents of a file, and the (key, value, comment) parsed from it
+CASES = [
+    ('"a" = "b";\n"c" = "d";\n', [("a", "b", ""), ("c", "d", "")]),
+    # Missing ";", noticed at the start of the next entry
+    ('"a" = "b"\n"c" = "d";\n', [("c", "d", "")]),
+    ('"a" = "b"\n/* Comment */\n"c" = "d";\n', [("c", "d", " Comment ")]),
+    ('"a" = "b" "x"\n"c" = "d";\n', [("c", "d", "")]),
+    ('"a" = \n"c" = "d";\n', [("c", "d", "")]),
+    ('junk\n"c" = "d";\n', [("c", "d", "")]),
+    ('"a" = "b";\n"c" = "d"', [("a", "b", "")]),
+    # The value ends at the first quote of the next line, which is then parsed again
+    ('"a" = "b";\n"c" = "unterminated\n"e" = "f";\n', [("a", "b", ""), ("e", "f", "")]),
+    ('"a" = "b";\n"c" = "unterminated\n', [("a", "b", "")]),
+]
+
+def parse(content, strict=False, errors=None):
+    return [(translation['key'], translation['value'], translation['comment'])
+            for translation in iterTranslations(content, strict=strict, errors=errors)]
+#end def
+
+failures = 0
+for (content, expected) in CASES:
+    errors = []
+    parsed = parse(content, errors=errors)
+    if parsed != expected:
+        print("FAILED: %r parsed as %s, expected %s" % (content, parsed, expected))
+        failures += 1
+    #end if
+
+    # Strict parsing raises on the files with errors instead
+    try:
+        parse(content, strict=True)
+        raised = False
+    except StringsSyntaxError:
+        raised = True
+    #end try
+    if raised != bool(errors):
+        print("FAILED: %r %s in strict mode" % (content, "raised" if raised else "did not raise"))
+        failures += 1
+    #end if
+#end for
+
+if failures:
+    sys.exit(1)
+#end if
+print("OK: %s parser recovery cases" % (len(CASES)))
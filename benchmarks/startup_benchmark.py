@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+import argparse
+import os
+import os.path
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+from catalogs import generateStrings, writeCatalog
+
+# Measures the startup cost of translate.py: each run is a new Python process, as for a CI check or a small delta
+# run. The translators' SDKs are only imported once a translator sends a request, each benchmark is compared with
+# the same run importing every SDK up front, as translate.py used to.
+#
+# Usage: python3 benchmarks/startup_benchmark.py -k 200 -r 10
+
+TRANSLATE_PATH = os.path.join(ROOT_PATH, "translate.py")
+SDK_MODULES = ["deepl", "googletrans", "openai", "requests"]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-k", default="200", help="set the number of keys in the generated file")
+parser.add_argument("-l", default="3", help="set the number of languages of the delta run")
+parser.add_argument("-r", default="10", help="set the number of times each benchmark is run")
+args = parser.parse_args()
+
+def languageCodeLines(totalLanguages):
+    """
+    Lines of LanguageCodes.txt for the given number of languages, taken from the languages listed in the repository
+    whether they are commented out or not.
+    """
+    lines = []
+    with open(os.path.join(ROOT_PATH, "LanguageCodes.txt"), "r") as languageCodesFile:
+        for line in languageCodesFile:
+            fields = line.strip().lstrip("#").split()
+            if len(fields) == 4:
+                lines.append("\t".join(fields) + "\n")
+            #end if
+        #end for
+    #end with
+
+    return lines[:totalLanguages]
+#end def
+
+def pythonCommand(code, eager):
+    """
+    Command running Python code in a new process, after importing every SDK if eager.
+    """
+    if eager:
+        code = "import %s\n%s" % (", ".join(SDK_MODULES), code)
+    #end if
+
+    return [sys.executable, "-c", code]
+#end def
+
+def translateCommand(arguments, eager):
+    code = ("import runpy, sys\n"
+            "sys.path.insert(0, %r)\n"
+            "sys.argv = [%r] + %r\n"
+            "runpy.run_path(%r, run_name='__main__')" % (ROOT_PATH, TRANSLATE_PATH, arguments, TRANSLATE_PATH))
+    return pythonCommand(code, eager)
+#end def
+
+def measure(command, workDir):
+    """
+    Run a command the configured number of times.
+
+    :return: (best time, median time) in seconds
+    """
+    times = []
+    for _ in range(max(1, int(args.r))):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=workDir, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    #end for
+
+    return (min(times), statistics.median(times))
+#end def
+
+def report(name, lazyCommand, eagerCommand, workDir):
+    (eagerTime, eagerMedian) = measure(eagerCommand, workDir)
+    (lazyTime, lazyMedian) = measure(lazyCommand, workDir)
+    print("%-10s %10.3fs %10.3fs %10.3fs %10.3fs  %6.2fx" % (name, eagerTime, eagerMedian, lazyTime, lazyMedian,
+                                                          eagerMedian / lazyMedian))
+#end def
+
+workDir = tempfile.mkdtemp(prefix="startup-benchmark-")
+try:
+    sourcePath = os.path.join(workDir, "en.lproj", "Localizable.strings")
+    writeCatalog(sourcePath, generateStrings(int(args.k)))
+    languageLines = languageCodeLines(int(args.l))
+    with open(os.path.join(workDir, "LanguageCodes.txt"), "w") as languageCodesFile:
+        languageCodesFile.writelines(languageLines)
+    #end with
+
+    # Existing translations of every key, so the delta run has nothing to translate
+    existingPath = os.path.join(workDir, "existing")
+    for line in languageLines:
+        shutil.copytree(os.path.dirname(sourcePath), os.path.join(existingPath, line.split()[3] + ".lproj"))
+    #end for
+
+    commonArguments = ["-f", sourcePath, "--no-cache", "--cache-dir", os.path.join(workDir, "cache"),
+                       "--metrics", os.path.join(workDir, "metrics.json")]
+
+    print("%-10s %11s %11s %11s %11s  %7s" % ("", "eager best", "median", "lazy best", "median", "speedup"))
+    report("import", pythonCommand("import sys; sys.path.insert(0, %r); import providers" % (ROOT_PATH), False),
+           pythonCommand("import sys; sys.path.insert(0, %r); import providers" % (ROOT_PATH), True), workDir)
+    report("help", translateCommand(["-h"], False), translateCommand(["-h"], True), workDir)
+    report("emulate", translateCommand(commonArguments + ["-e", "1"], False),
+           translateCommand(commonArguments + ["-e", "1"], True), workDir)
+    report("delta", translateCommand(commonArguments + ["-d", existingPath], False),
+           translateCommand(commonArguments + ["-d", existingPath], True), workDir)
+finally:
+    shutil.rmtree(workDir, ignore_errors=True)
+#end try
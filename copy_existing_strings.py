@@ -1,24 +1,35 @@
 #!/usr/bin/python3
 import argparse
 import os.path
+from concurrent.futures import ThreadPoolExecutor
 
-from functions import readTranslations, clearContentsOfFile, writeTranslationToFile
+from functions import StringsWriter, readTranslations
+from parse_cache import ParseCache
+from translation_cache import DEFAULT_CACHE_DIR
 
 # Copies existing translations from another project / app / location.
 #
 # Use this script when you have another project you wish to copy existing translations from. This will scan all languages
 # specified in LanguageCodes.txt in the other location specified and copy any translation it finds for a given key in the specified
 # base language (en by default).
+#
+# Several locations can be given to merge translations from several projects in one run. When more than one location has
+# a translation for the same key, the location given first wins.
 
 parser = argparse.ArgumentParser()
-parser.add_argument("-c", default="", help="set the path to the root directory where all the localized translations you wish to copy from reside (i.e. directory with `fr.lproj` etc)")
+parser.add_argument("-c", action="append", default=[], help="set the path to the root directory where all the localized translations you wish to copy from reside (i.e. directory with `fr.lproj` etc). Can be given several times, in order of precedence")
 parser.add_argument("-p", default="", help="set the path to the root directory where the target localized translations you wish to copy to reside (i.e. directory with `fr.lproj` etc)")
 parser.add_argument("-f", default="Localizable.strings", help="set the name of the .strings file to look for")
 parser.add_argument("-o", default="en", help="set the origin locale, default is english")
+parser.add_argument("--encoding", default="", help="set the encoding of the .strings files read (e.g. utf-8 or utf-16). Detected from their contents by default")
+parser.add_argument("-j", default="4", help="set the number of languages copied in parallel")
 args = parser.parse_args()
 
+# Cache of the parsed .strings files, shared with the other scripts
+parseCache = ParseCache(os.path.join(DEFAULT_CACHE_DIR, "parsed"))
+
 # Read and cache origin language once
-sourceResourcePath = os.path.expanduser(args.c.strip())
+sourceResourcePaths = [os.path.expanduser(sourceResourcePath.strip()) for sourceResourcePath in args.c]
 targetResourcePath = os.path.expanduser(args.p.strip())
 stringsFileName = os.path.expanduser(args.f.strip())
 originLangKey = args.o.strip()
@@ -29,7 +40,8 @@ if not os.path.exists(targetPath):
     exit(1)
 # endif
 
-targetLines = readTranslations(targetPath)
+targetKeys = set(targetLine['key'] for targetLine in readTranslations(targetPath, encoding=args.encoding or None,
+                                                                     parseCache=parseCache))
 
 # Read languages we must find translations for
 supportedLanguageCodes = []
@@ -50,52 +62,62 @@ with open('LanguageCodes.txt', 'r') as supportedLangCodeFile:
     #end for
 #end with
 
-# Find paths to source translations
-sourceTranslationPaths = []
-for dirpath, dirnames, filenames in os.walk(sourceResourcePath):
-    for dirname in dirnames:
-        if dirname.find(".lproj") != -1:
-            dirLang = dirname.split(os.path.sep)[-1].replace(".lproj", "")
-
-            if dirLang in supportedLanguageCodes:
-                localizablePath = os.path.join(os.path.join(dirpath, dirname), stringsFileName)
-                if not os.path.exists(localizablePath):
-                    continue
-                #end if
-                sourceTranslationPaths.append(localizablePath)
-            #endif
-        #end if
+# Find paths to source translations, grouped by language in order of precedence
+sourceTranslationPaths = {}
+for sourceResourcePath in sourceResourcePaths:
+    for dirpath, dirnames, filenames in os.walk(sourceResourcePath):
+        for dirname in dirnames:
+            if dirname.find(".lproj") != -1:
+                dirLang = dirname.split(os.path.sep)[-1].replace(".lproj", "")
+
+                if dirLang in supportedLanguageCodes:
+                    localizablePath = os.path.join(os.path.join(dirpath, dirname), stringsFileName)
+                    if not os.path.exists(localizablePath):
+                        continue
+                    #end if
+                    sourceTranslationPaths.setdefault(dirLang, []).append(localizablePath)
+                #endif
+            #end if
+        #end for
     #end for
 #end for
 
-# Find translations that exist for a given key
-for sourceTransPath in sourceTranslationPaths:
-    sourceLangName = sourceTransPath.split(os.path.sep)[-2].replace(".lproj", "")
-
-    clearContentsOfFile(stringsFileName, sourceLangName)
-
-    print("Reading %s from source translation '%s' path: %s" % (stringsFileName, sourceLangName, sourceTransPath))
-
-    sourceTransLines = readTranslations(sourceTransPath)
+def copyTranslations(sourceLangName):
+    """
+    Copy the translations of every key found in our target default localization file for one language, and write
+    them out at once.
+
+    :param sourceLangName: language to copy
+    :return: total translations copied
+    """
+    copiedKeys = set()
+    writer = StringsWriter(stringsFileName, sourceLangName)
+    for sourceTransPath in sourceTranslationPaths[sourceLangName]:
+        print("Reading %s from source translation '%s' path: %s" % (stringsFileName, sourceLangName, sourceTransPath))
+
+        # Go over each key
+        for sourceTransString in readTranslations(sourceTransPath, encoding=args.encoding or None,
+                                                  parseCache=parseCache):
+            sourceKey = sourceTransString['key']
+
+            # Copy translation if this key exists in our target default localization file, unless a location with
+            # a higher precedence already had it
+            if sourceKey in targetKeys and sourceKey not in copiedKeys:
+                copiedKeys.add(sourceKey)
+                writer.writeTranslation(sourceKey, sourceTransString['value'], sourceTransString['comment'])
+            # end if
+        #end for
+    #end for
 
-    # Go over each key
-    didCopy = 0
-    for sourceTransString in sourceTransLines:
-        sourceKey = sourceTransString['key']
-        sourceTranslation = sourceTransString['value']
-        sourceComment = sourceTransString['comment']
+    writer.close()
 
-        # Copy translation if this key exists in our target default localization file
-        for targetLine in targetLines:
-            targetKey = targetLine['key']
-            if targetKey == sourceKey:
-                writeTranslationToFile(stringsFileName, sourceKey, sourceTranslation, sourceComment, sourceLangName)
+    return writer.totalTranslations
+#end def
 
-                didCopy += 1
-                break
-            # end if
-        # end for
+# Find translations that exist for a given key
+with ThreadPoolExecutor(max_workers=max(1, int(args.j))) as executor:
+    sourceLangNames = list(sourceTranslationPaths)
+    for (sourceLangName, didCopy) in zip(sourceLangNames, executor.map(copyTranslations, sourceLangNames)):
+        print("... Total existing translations copied for '%s': %s" % (sourceLangName, didCopy))
     #end for
-
-    print("... Total existing translations copied for '%s': %s" % (sourceLangName, didCopy))
-#end for
\ No newline at end of file
+#end with
@@ -1,8 +1,11 @@
 #!/usr/bin/python3
 import argparse
 import os.path
+from concurrent.futures import ThreadPoolExecutor
 
-from functions import readTranslations, clearContentsOfFile, writeTranslationToFile
+from functions import StringsWriter, readTranslations
+from parse_cache import ParseCache
+from translation_cache import DEFAULT_CACHE_DIR
 
 # Finds missing strings, not present in the base / default translation, but exist in other translations. Copies these
 # back to the base translation.
@@ -19,8 +22,14 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-p", default="", help="set the path to the root directory where all the localized translations reside (i.e. directory with `fr.lproj` etc)")
 parser.add_argument("-f", default="Localizable.strings", help="set the name of the .strings file to look for")
 parser.add_argument("-o", default="en", help="set the origin locale for to extract missing translations from, default is english")
+parser.add_argument("--encoding", default="", help="set the encoding of the .strings files read (e.g. utf-8 or utf-16). Detected from their contents by default")
+parser.add_argument("-j", default="4", help="set the number of translation files read in parallel")
+parser.add_argument("-v", default="0", help="Verbose. Lists the keys missing from each translation")
 args = parser.parse_args()
 
+# Cache of the parsed .strings files, shared with the other scripts
+parseCache = ParseCache(os.path.join(DEFAULT_CACHE_DIR, "parsed"))
+
 # Read and cache origin language once
 resourcePath = os.path.expanduser(args.p.strip())
 originLangKey = args.o.strip()
@@ -32,7 +41,7 @@ if not os.path.exists(originPath):
     exit(1)
 # endif
 
-originLines = readTranslations(originPath)
+originLines = readTranslations(originPath, encoding=args.encoding or None, parseCache=parseCache)
 
 # Read languages we must translate to
 supportedLanguageCodes = []
@@ -72,50 +81,51 @@ for dirpath, dirnames, filenames in os.walk(resourcePath):
     #end for
 #end for
 
-# Go over each translation, including the default, and find strings that aren't found in other localization files
-missingLines = []
-missingKeys = []
-for supportedLangPath in supportedLanguagePaths:
-    print("Reading %s from path: %s" % (stringsFileName, supportedLangPath))
-
-    supportedLangLines = readTranslations(supportedLangPath)
-
-    # Go over each key
-    for langString in supportedLangLines:
-        stringName = langString['key']
+# Read every translation, including the default, once
+print("Reading %s from %s translations" % (stringsFileName, len(supportedLanguagePaths)))
+with ThreadPoolExecutor(max_workers=max(1, int(args.j))) as executor:
+    supportedLangLines = list(executor.map(
+        lambda supportedLangPath: readTranslations(supportedLangPath, encoding=args.encoding or None,
+                                                   parseCache=parseCache),
+        supportedLanguagePaths))
+#end with
 
-        # Check if this was seen in every translation
-        for otherLangPath in supportedLanguagePaths:
-            if otherLangPath == supportedLangPath:
-                continue
-            #end if
+# Index the keys of each translation. Keep the first line found for each key, in the order translations were found.
+supportedLangKeys = []
+firstLines = {}
+for langLines in supportedLangLines:
+    langKeys = set()
+    for langString in langLines:
+        langKeys.add(langString['key'])
+        if langString['key'] not in firstLines:
+            firstLines[langString['key']] = langString
+        #end if
+    #end for
+    supportedLangKeys.append(langKeys)
+#end for
 
-            otherLangLines = readTranslations(otherLangPath)
+# Strings that aren't found in every localization file are missing
+allKeys = set(firstLines)
+commonKeys = set.intersection(*supportedLangKeys) if supportedLangKeys else set()
+missingKeys = allKeys - commonKeys
+missingLines = [firstLines[stringName] for stringName in missingKeys]
 
-            didFind = False
-            for otherLangString in otherLangLines:
-                otherStringName = otherLangString['key']
+for (supportedLangPath, langKeys) in zip(supportedLanguagePaths, supportedLangKeys):
+    langMissingKeys = allKeys - langKeys
+    print("Missing in %s: %s" % (supportedLangPath, len(langMissingKeys)))
 
-                if stringName == otherStringName:
-                    didFind = True
-                    break
-                #end if
-            # end for
-
-            if not didFind and stringName not in missingKeys:
-                missingKeys.append(stringName)
-                missingLines.append(langString)
-                break
-            # end if
-        # end for
-    #end for
+    if args.v == "1":
+        for stringName in sorted(langMissingKeys, key = lambda i: str(i).lower()):
+            print("  ... %s" % (stringName))
+        #end for
+    #end if
 #end for
 
 print("Total missing strings found: %s" % (len(missingLines)))
 
-clearContentsOfFile(stringsFileName, originLangKey)
-
 print("Saving missing localizations")
+writer = StringsWriter(stringsFileName, originLangKey)
+originKeys = set(originLine['key'] for originLine in originLines)
 totalLinesWritten = 0
 for missingTrans in sorted(missingLines, key = lambda i: str(i['key']).lower()):
     stringName = missingTrans['key']
@@ -127,22 +137,15 @@ for missingTrans in sorted(missingLines, key = lambda i: str(i['key']).lower()):
     #end if
 
     # ignore if the key already exists in the original locale
-    inOrigin = False
-    for originLine in originLines:
-        originKey = originLine['key']
-        if originKey == stringName:
-            inOrigin = True
-            break
-        #end if
-    #end for
-
-    if inOrigin:
+    if stringName in originKeys:
         continue
     #end if
 
-    writeTranslationToFile(stringsFileName, stringName, stringName, stringComment, originLangKey)
+    writer.writeTranslation(stringName, stringName, stringComment)
 
     totalLinesWritten += 1
 #end for
 
+writer.close()
+
 print("Total lines written: %s, already in origin: %s" % (totalLinesWritten, len(missingLines)-totalLinesWritten))
\ No newline at end of file
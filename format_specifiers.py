@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+import re
+
+# Tokenizes the printf / NSString format specifiers of strings (%d, %1$@, %lld, %.2f, %#@variable@, %arg etc) so the
+# specifiers of a translation can be compared with the ones of its source text, and cleans up the characters
+# translators commonly mangle in them, in a single pass over each string.
+
+SPECIFIER_BODY = r"""
+    (?:
+        \#@(?P<variable>[^@\s]+)@
+      | (?P<argument>arg)
+      | (?P<flags>[-+\#0']*)(?P<width>\d+|\*)?(?:\.(?P<precision>\d+|\*))?
+        (?P<length>hh|h|ll|l|q|L|z|t|j)?(?P<conversion>[@dDiuUxXoOfFeEgGaAcCsSp%])
+    )
+"""
+
+# A '%' not followed by a valid specifier body still matches, as a stray '%'
+FORMAT_SPECIFIER_PATTERN = re.compile(r"%(?:(?P<position>\d+)\$)?" + SPECIFIER_BODY + "?", re.VERBOSE)
+
+# Text masked before being sent to translators: valid format specifiers and escape sequences
+PLACEHOLDER_PATTERN = re.compile(r"\\[nrt\"\\]|%(?:\d+\$)?" + SPECIFIER_BODY, re.VERBOSE)
+
+# Masking styles: XML tags for translators able to leave tags alone (DeepL with tag_handling), numbered sentinels
+# for the others
+PLACEHOLDER_XML = "xml"
+PLACEHOLDER_SENTINEL = "sentinel"
+PLACEHOLDER_TOKENS = {
+    PLACEHOLDER_XML: ('<x id="%d"/>', re.compile(r'<x\s+id\s*=\s*"(\d+)"\s*/>')),
+    PLACEHOLDER_SENTINEL: ("{%d}", re.compile(r"\{\s*(\d+)\s*\}")),
+}
+XML_ESCAPES = [("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")]
+XML_UNESCAPES = [("&lt;", "<"), ("&gt;", ">"), ("&quot;", "\""), ("&apos;", "'"), ("&amp;", "&")]
+
+# Synonyms of conversions, translators may switch between them
+CONVERSION_SYNONYMS = {'i': 'd'}
+
+FORMATTERS_MISMATCH = "Formatters don't match in"
+INVALID_SPACE = "Formatters have an invalid space"
+INVALID_FORMATTER = "Invalid formatter"
+
+# Clean ups applied to the values of .strings files, e.g. by sort_keys.py
+LINT_REPLACEMENTS = [
+    ("（", " ("),
+    ("）", ") "),
+    ("％ @", "%@"),
+    ("％", "%"),
+    ("% @", "%@"),
+    ("\\ n", "\n"),
+]
+
+# Clean ups applied to translations returned by translators. Deepl can produce translations with double quotes, they
+# are escaped whether or not they already were
+TRANSLATION_REPLACEMENTS = [
+    ("\\N", "\\n"),
+    ("\\\"", "\\\""),
+    ("\"", "\\\""),
+] + LINT_REPLACEMENTS
+
+def compileReplacements(replacements):
+    """
+    Compile a list of (text, replacement) into a function applying all of them in one pass over a string. Where
+    several texts match at the same position, the first one listed wins.
+    """
+    lookup = dict(replacements)
+    pattern = re.compile("|".join(re.escape(text) for (text, replacement) in replacements))
+
+    def replace(text):
+        return pattern.sub(lambda match: lookup[match.group(0)], text)
+    #end def
+
+    return replace
+#end def
+
+lintValue = compileReplacements(LINT_REPLACEMENTS)
+_replaceInTranslation = compileReplacements(TRANSLATION_REPLACEMENTS)
+_escapeXml = compileReplacements(XML_ESCAPES)
+_unescapeXml = compileReplacements(XML_UNESCAPES)
+
+def normalizeTranslation(translatedText):
+    """
+    Clean up a translation returned by a translator.
+    """
+    return _replaceInTranslation(translatedText).strip(' ')
+#end def
+
+def formatSpecifiers(text):
+    """
+    Tokenize the format specifiers of a string.
+
+    :param text: string
+    :return: (specifiers, strays) where specifiers is the sorted list of (argument index, specifier) of the arguments
+    the string formats, e.g. [(0, '@'), (1, 'lld')] for "%@ has %lld coins" or "%2$lld coins for %1$@", and strays
+    the list of offsets of '%' not starting a valid specifier
+    """
+    if '%' not in text:
+        return ([], [])
+    #end if
+
+    specifiers = []
+    strays = []
+    nextIndex = 0
+    for match in FORMAT_SPECIFIER_PATTERN.finditer(text):
+        (position, variable, argument, conversion) = match.group('position', 'variable', 'argument', 'conversion')
+        if variable is None and argument is None and conversion is None:
+            strays.append(match.start())
+            continue
+        elif conversion == '%':
+            # Literal %%
+            continue
+        #end if
+
+        if variable is not None:
+            specifier = "#@" + variable + "@"
+        elif argument is not None:
+            # Argument of a substitution of a String Catalog
+            specifier = argument
+        else:
+            specifier = "".join(part or "" for part in match.group('flags', 'width', 'precision', 'length')) + \
+                CONVERSION_SYNONYMS.get(conversion, conversion)
+        #end if
+
+        if position is not None:
+            index = int(position) - 1
+        else:
+            index = nextIndex
+            nextIndex += 1
+        #end if
+        specifiers.append((index, specifier))
+    #end for
+
+    specifiers.sort()
+    return (specifiers, strays)
+#end def
+
+def compareSpecifiers(sourceTokens, translatedText, translatedTokens):
+    """
+    Compare the tokens returned by formatSpecifiers for a source text and its translation.
+    """
+    (sourceSpecifiers, sourceStrays) = sourceTokens
+    (translatedSpecifiers, translatedStrays) = translatedTokens
+
+    if len(translatedStrays) > len(sourceStrays):
+        for offset in translatedStrays:
+            if translatedText[offset + 1:offset + 2] == " ":
+                return INVALID_SPACE
+            #end if
+        #end for
+        return INVALID_FORMATTER
+    #end if
+
+    if sourceSpecifiers != translatedSpecifiers or len(translatedStrays) != len(sourceStrays):
+        return FORMATTERS_MISMATCH
+    #end if
+
+    return None
+#end def
+
+def validateFormat(sourceText, translatedText):
+    """
+    Check a translation kept the format specifiers of its source text. Positional specifiers may be reordered.
+
+    :return: None if they match, otherwise the warning: FORMATTERS_MISMATCH, INVALID_SPACE or INVALID_FORMATTER
+    """
+    if '%' not in sourceText and '%' not in translatedText:
+        return None
+    #end if
+
+    return compareSpecifiers(formatSpecifiers(sourceText), translatedText, formatSpecifiers(translatedText))
+#end def
+
+def validateTranslations(pairs):
+    """
+    Check the format specifiers of many translations at once, e.g. a whole catalog. Each distinct text is only
+    tokenized once.
+
+    :param pairs: iterable of (source text, translation)
+    :return: list of (index in pairs, warning) of the translations whose specifiers don't match
+    """
+    tokensByText = {}
+    problems = []
+    for (index, (sourceText, translatedText)) in enumerate(pairs):
+        if '%' not in sourceText and '%' not in translatedText:
+            continue
+        #end if
+
+        tokens = []
+        for text in (sourceText, translatedText):
+            textTokens = tokensByText.get(text)
+            if textTokens is None:
+                textTokens = formatSpecifiers(text)
+                tokensByText[text] = textTokens
+            #end if
+            tokens.append(textTokens)
+        #end for
+
+        warning = compareSpecifiers(tokens[0], translatedText, tokens[1])
+        if warning is not None:
+            problems.append((index, warning))
+        #end if
+    #end for
+
+    return problems
+#end def
+
+def maskPlaceholders(text, style, keepPlaceholders=False):
+    """
+    Swap the format specifiers and escape sequences of a text for opaque tokens a translator leaves alone, e.g.
+    "%1$@ has %lld coins\\n" becomes "{0} has {1} coins{2}" with the sentinel style.
+
+    :param text: source text
+    :param style: PLACEHOLDER_XML or PLACEHOLDER_SENTINEL
+    :param keepPlaceholders: leave the placeholders in the text, only escaping it for the style
+    :return: (masked text, list of the masked placeholders), placeholders is None if the text can't be masked
+    because it already contains something looking like a token
+    """
+    (tokenFormat, tokenPattern) = PLACEHOLDER_TOKENS[style]
+    if style == PLACEHOLDER_SENTINEL and (keepPlaceholders or tokenPattern.search(text)):
+        return (text, None)
+    #end if
+
+    placeholders = []
+    maskedParts = []
+    end = 0
+    for match in (PLACEHOLDER_PATTERN.finditer(text) if not keepPlaceholders else []):
+        maskedParts.append(text[end:match.start()])
+        maskedParts.append(tokenFormat % (len(placeholders)))
+        placeholders.append(match.group(0))
+        end = match.end()
+    #end for
+    maskedParts.append(text[end:])
+
+    if style == PLACEHOLDER_XML:
+        # Tokens contain no character needing an escape, escape the text around them
+        maskedParts = [part if index % 2 else _escapeXml(part) for (index, part) in enumerate(maskedParts)]
+    #end if
+
+    return ("".join(maskedParts), placeholders)
+#end def
+
+def unmaskPlaceholders(maskedText, placeholders, style):
+    """
+    Put the placeholders masked by maskPlaceholders back into a translation.
+
+    :return: translation, or None if a placeholder was lost, duplicated or made up by the translator
+    """
+    (tokenFormat, tokenPattern) = PLACEHOLDER_TOKENS[style]
+
+    parts = tokenPattern.split(maskedText)
+    restored = []
+    seen = set()
+    for (index, part) in enumerate(parts):
+        if index % 2 == 0:
+            restored.append(_unescapeXml(part) if style == PLACEHOLDER_XML else part)
+            continue
+        #end if
+
+        placeholderIndex = int(part)
+        if placeholderIndex >= len(placeholders) or placeholderIndex in seen:
+            return None
+        #end if
+        seen.add(placeholderIndex)
+        restored.append(placeholders[placeholderIndex])
+    #end for
+
+    if len(seen) != len(placeholders):
+        return None
+    #end if
+
+    return "".join(restored)
+#end def
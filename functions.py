@@ -1,66 +1,92 @@
 #!/usr/bin/python3
-import chardet
 import codecs
 import os
 import os.path
-import re
 import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import RunMetrics
+from strings_parser import iterTranslations
 
 format_encoding = 'UTF-16'
 
-def readTranslations(fileName):
+# Number of bytes checked for the null bytes of UTF-16 text without a byte order mark
+ENCODING_SNIFF_SIZE = 4096
+# Number of bytes handed to chardet when the encoding cannot be told from the contents directly
+CHARDET_SAMPLE_SIZE = 64 * 1024
+
+def readTranslations(fileName, strict=False, encoding=None, parseCache=None, metrics=None):
     """
     Read in a given Localizable.strings file and return a list of key / value pairs read for each line of translation.
 
     :param fileName:
+    :param strict: raise StringsSyntaxError on invalid syntax instead of printing it
+    :param encoding: encoding of the file, detected from its contents when not given
+    :param parseCache: optional ParseCache, the file is parsed every time otherwise
+    :param metrics: optional RunMetrics the timings are collected in
     :return: List of tuples with key / value pairs of each translation found
     """
+    return list(iterTranslationsFromFile(fileName, strict=strict, encoding=encoding, parseCache=parseCache,
+                                         metrics=metrics))
+#end def
+
+def iterTranslationsFromFile(fileName, strict=False, encoding=None, parseCache=None, metrics=None):
+    """
+    Read in a given Localizable.strings file and yield the key / value pair of each line of translation as it is parsed.
+
+    :param fileName:
+    :param strict: raise StringsSyntaxError on invalid syntax instead of printing it
+    :param encoding: encoding of the file, detected from its contents when not given
+    :param parseCache: optional ParseCache, the file is parsed every time otherwise
+    :param metrics: optional RunMetrics the timings are collected in
+    :return: generator of key / value pairs of each translation found
+    """
 
     #print("Reading Localizable.strings from path: %s" % (fileName))
     if not os.path.exists(fileName):
         print(" ... no file found, returning empty translation")
-        return []
+        return
     #endif
 
-    stringset = []
-    f = _get_content_from_file(filename=fileName)
+    if metrics is None:
+        metrics = RunMetrics()
+    #end if
+    if parseCache is not None:
+        with metrics.timed("parseCache"):
+            cachedTranslations = parseCache.load(fileName, encoding=encoding)
+        #end with
+        if cachedTranslations is not None:
+            for translation in cachedTranslations:
+                yield translation
+            #end for
+            return
+        #end if
+    #end if
+
+    f = _get_content_from_file(filename=fileName, encoding=encoding, metrics=metrics)
     if f.startswith(u'\ufeff'):
         f = f.lstrip(u'\ufeff')
     #end if
-    # regex for finding all comments in a file
-    cp = r'(?:/\*(?P<comment>(?:[^*]|(?:\*+[^*/]))*\**)\*/)'
-    p = re.compile(
-        r'(?:%s[ \t]*[\n]|[\r\n]|[\r]){0,1}(?P<line>(("(?P<key>[^"\\]*(?:\\.[^"\\]*)*)")|(?P<property>\w+))\s*=\s*"(?P<value>[^"\\]*(?:\\.[^"\\]*)*)"\s*;)' % cp,
-        re.DOTALL | re.U)
-    # c = re.compile(r'\s*/\*(.|\s)*?\*/\s*', re.U)
-    c = re.compile(r'//[^\n]*\n|/\*(?:.|[\r\n])*?\*/', re.U)
-    ws = re.compile(r'\s+', re.U)
-    end = 0
-    start = 0
-    for i in p.finditer(f):
-        # print("Line: %s" % i)
-        start = i.start('line')
-        end_ = i.end()
-        key = i.group('key')
-        comment = i.group('comment') or ''
-
-        if not key:
-            key = i.group('property')
-        #end if
 
-        value = i.group('value')
-        while end < start:
-            m = c.match(f, end, start) or ws.match(f, end, start)
-            if not m or m.start() != end:
-                print("Invalid syntax: %s" % f[end:start])
-            #end if
-            end = m.end()
-        #end while
-        end = end_
-        #key = _unescape_key(key)
-        # print("Found key: %s, value: %s, comment: %s" % (key, value, comment))
-        stringset.append({'key': key, 'value': value, 'comment': comment})
-    return stringset
+    # Only the time spent parsing is counted, not the time the caller spends between translations
+    translations = []
+    errors = []
+    parseSeconds = 0.0
+    start = time.perf_counter()
+    for translation in iterTranslations(f, fileName=fileName, strict=strict, errors=errors):
+        parseSeconds += time.perf_counter() - start
+        translations.append(translation)
+        yield translation
+        start = time.perf_counter()
+    #end for
+    metrics.addStageTime("parse", parseSeconds + time.perf_counter() - start)
+
+    # Files with syntax errors are parsed again every time, so the errors keep being reported
+    if parseCache is not None and not errors:
+        parseCache.store(fileName, translations, encoding=encoding)
+    #end if
 #end def
 
 def _unescape_key(s):
@@ -73,64 +99,211 @@ def _unescape(s):
     # return s.replace('\\"', '"').replace(r'\n', '\n').replace(r'\r', '\r')
 #end def
 
-def _get_content_from_file(filename, format_encoding='UTF-16'):
-    f = open(filename, 'rb')
+def detectEncoding(content):
+    """
+    Detect the encoding of the raw contents of a .strings file. Byte order marks and the null bytes of UTF-16 text
+    are checked first, then UTF-8. chardet is only run, on the start of the file, when none of these match.
+
+    :param content: raw bytes of the file
+    :return: name of the codec to decode the file with
+    """
+    return _detectEncoding(content)[0]
+#end def
+
+def _detectEncoding(content):
+    """
+    See detectEncoding.
+
+    :return: (name of the codec, decoded contents if they were decoded while checking for UTF-8 or None)
+    """
+    if content.startswith(codecs.BOM_UTF8):
+        return ('utf-8-sig', None)
+    #end if
+    if content.startswith(codecs.BOM_UTF32_LE) or content.startswith(codecs.BOM_UTF32_BE):
+        return ('utf-32', None)
+    #end if
+    if content.startswith(codecs.BOM_UTF16_LE) or content.startswith(codecs.BOM_UTF16_BE):
+        return ('utf-16', None)
+    #end if
+
+    # UTF-16 without a byte order mark: most characters of a .strings file are ASCII, so every other byte is null
+    sample = content[:ENCODING_SNIFF_SIZE]
+    if b'\x00' in sample:
+        evenNulls = sample[0::2].count(0)
+        oddNulls = sample[1::2].count(0)
+        if oddNulls > len(sample) // 4 and oddNulls > evenNulls:
+            return ('utf-16-le', None)
+        #end if
+        if evenNulls > len(sample) // 4 and evenNulls > oddNulls:
+            return ('utf-16-be', None)
+        #end if
+    #end if
+
+    # Most files are UTF-8, the contents decoded by the check are kept rather than decoded again
     try:
-        content = f.read()
-        detected_encoding = chardet.detect(content)['encoding']
-        if detected_encoding and detected_encoding.startswith(format_encoding):
-            encoding = format_encoding
-        else:
-            encoding = 'utf-8'
-        f.close()
-        f = codecs.open(filename, 'r', encoding=encoding)
-        print("Opening file with detected encoding: %s, with format encoding: %s, with encoding: %s" % (detected_encoding, format_encoding, encoding))
-        return f.read()
+        return ('utf-8', content.decode('utf-8'))
+    except UnicodeDecodeError:
+        pass
+    #end try
+
+    import chardet
+    detected_encoding = chardet.detect(content[:CHARDET_SAMPLE_SIZE])['encoding'] or 'utf-8'
+    print("Detected encoding %s with chardet" % (detected_encoding))
+    return (detected_encoding, None)
+#end def
+
+def _get_content_from_file(filename, encoding=None, metrics=None):
+    """
+    Read and decode the contents of a file.
+
+    :param filename: file to read
+    :param encoding: encoding of the file, detected from its contents when not given
+    :param metrics: optional RunMetrics the timings are collected in
+    :return: decoded contents
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    #end if
+    try:
+        with metrics.timed("read"):
+            with open(filename, 'rb') as f:
+                content = f.read()
+            #end with
+        #end with
     except IOError as e:
-        print("Error opening file %s with encoding %s: %s" % (filename, format_encoding, e.message))
-    except Exception as e:
-        print("Unhandled exception: %s" % e.message)
-    finally:
-        f.close()
+        print("Error opening file %s: %s" % (filename, e))
+        raise
     #end try
+
+    with metrics.timed("encoding"):
+        if not encoding:
+            (encoding, decoded) = _detectEncoding(content)
+            if decoded is not None:
+                return decoded
+            #end if
+        #end if
+
+        return content.decode(encoding, errors='replace')
+    #end with
 #end def
 
 def createOutputDirectoryIfNotExists(fileName):
     if not os.path.exists(os.path.dirname(fileName)):
-        os.makedirs(os.path.dirname(fileName))
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
     #end if
 #end def
 
-def writeCommentToFile(stringsFileName, comment, outputTargetCode):
-    outputFileName = os.path.join("output", outputTargetCode + os.path.join(".lproj", stringsFileName))
+def outputPathForTarget(stringsFileName, outputTargetCode):
+    """
+    Path of the output .strings file for a target language.
+    """
+    return os.path.join("output", outputTargetCode + os.path.join(".lproj", stringsFileName))
+#end def
+
+def formatComment(comment):
+    """
+    Format a standalone comment as written to a .strings file.
+    """
+    return "/* " + comment.strip() + " */\n\n"
+#end def
 
-    with open(outputFileName, "a", encoding="utf-8") as myfile:
-        createOutputDirectoryIfNotExists(outputFileName)
-        contentToWrite = "/* " + comment.strip() + " */\n\n"
-        myfile.write(contentToWrite)
-    #end with
+def formatTranslation(sourceText, translatedText, comment):
+    """
+    Format a translation as written to a .strings file, preceded by its comment if any.
+    """
+    contentToWrite = ""
+    if len(comment) != 0:
+        contentToWrite = "/* " + comment.strip() + " */\n"
+    #end if
+    contentToWrite += "\"" + sourceText + "\" = \"" + translatedText + "\";\n\n"
+    return contentToWrite
 #end def
 
-def writeTranslationToFile(stringsFileName, sourceText, translatedText, comment, outputTargetCode):
-    outputFileName = os.path.join("output", outputTargetCode + os.path.join(".lproj", stringsFileName))
+@contextmanager
+def openFileAtomically(fileName, encoding="utf-8"):
+    """
+    Open a temporary file next to a file for writing, and rename it into place once the block is done so readers
+    never see a partially written file. The file is left untouched if the block raises.
+    """
+    createOutputDirectoryIfNotExists(fileName)
 
-    with open(outputFileName, "a", encoding="utf-8") as myfile:
-        createOutputDirectoryIfNotExists(outputFileName)
-        contentToWrite = ""
-        if len(comment) != 0:
-            contentToWrite = "/* " + comment.strip() + " */\n"
+    tempFileName = "%s.%s.%s.tmp" % (fileName, os.getpid(), threading.get_ident())
+    try:
+        with open(tempFileName, "w", encoding=encoding) as myfile:
+            yield myfile
+            myfile.flush()
+            os.fsync(myfile.fileno())
+        #end with
+        os.replace(tempFileName, fileName)
+    except BaseException:
+        if os.path.exists(tempFileName):
+            os.remove(tempFileName)
         #end if
-        contentToWrite += "\"" + sourceText + "\" = \"" + translatedText + "\";\n\n"
-        myfile.write(contentToWrite)
+        raise
+    #end try
+#end def
+
+def writeFileAtomically(fileName, content, encoding="utf-8"):
+    """
+    Write the whole content of a file at once, see openFileAtomically.
+    """
+    with openFileAtomically(fileName, encoding=encoding) as myfile:
+        myfile.write(content)
     #end with
 #end def
 
-def clearContentsOfFile(stringsFileName, target):
-    fileName = os.path.join("output", target + os.path.join(".lproj", stringsFileName))
+class StringsWriter:
+    """
+    Buffers the comments and translations of one output .strings file and writes them all at once when closed.
+    The file is replaced atomically, and left untouched if the writer is discarded or an exception is raised while
+    it is used as a context manager.
+    """
 
-    createOutputDirectoryIfNotExists(fileName)
-    open(fileName, 'w').close()
-#end def
+    def __init__(self, stringsFileName, outputTargetCode, fileName=None, metrics=None):
+        self.fileName = fileName or outputPathForTarget(stringsFileName, outputTargetCode)
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.totalTranslations = 0
+        self._parts = []
+    #end def
+
+    def writeComment(self, comment):
+        self._parts.append(formatComment(comment))
+    #end def
+
+    def writeTranslation(self, sourceText, translatedText, comment, needsReview=False):
+        # .strings files have no review state, needsReview is only kept by String Catalogs
+        self._parts.append(formatTranslation(sourceText, translatedText, comment or ""))
+        self.totalTranslations += 1
+    #end def
+
+    def getvalue(self):
+        return "".join(self._parts)
+    #end def
+
+    def close(self):
+        with self.metrics.timed("write"):
+            writeFileAtomically(self.fileName, self.getvalue())
+        #end with
+        self._parts = []
+    #end def
+
+    def discard(self):
+        self._parts = []
+    #end def
+
+    def __enter__(self):
+        return self
+    #end def
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+        else:
+            self.discard()
+        #end if
+        return False
+    #end def
+#end class
 
 # not used
 def copy_files():
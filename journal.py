@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+import hashlib
+import json
+import os
+import os.path
+import threading
+
+JOURNAL_VERSION = 1
+
+def journalPath(cacheDir, originPath, stringsFileName):
+    """
+    Path of the journal of the runs translating a source file.
+    """
+    originHash = hashlib.sha1(os.path.abspath(originPath).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cacheDir, "journals", originHash, stringsFileName + ".jsonl")
+#end def
+
+class TranslationJournal:
+    """
+    Write-ahead journal of the translations completed during a run, so a run that was interrupted can be resumed
+    without translating them again. Each line is a JSON object with the target language, source text and context
+    of a string and the result it was translated to, appended and synced to disk as soon as its request finished.
+    The first line records the translator and origin language, a journal left by a run with other ones is ignored.
+    A line cut short by a crash is skipped when reading.
+    """
+
+    def __init__(self, path, translatorName, sourceLang):
+        self.path = path
+        self.header = {'version': JOURNAL_VERSION, 'translator': translatorName, 'sourceLang': sourceLang}
+        self.totalRecorded = 0
+        self._file = None
+        self._lock = threading.Lock()
+    #end def
+
+    def load(self):
+        """
+        Read the results recorded by a previous run.
+
+        :return: dict of (target code, source text, context) to (translation, success, warning)
+        """
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        #end if
+
+        with open(self.path, "r", encoding="utf-8") as journalFile:
+            for (lineNumber, line) in enumerate(journalFile):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                #end try
+
+                if lineNumber == 0:
+                    if entry != self.header:
+                        print("Ignoring journal %s written by a run with other options" % (self.path))
+                        return {}
+                    #end if
+                    continue
+                #end if
+
+                try:
+                    results[(entry['target'], entry['text'], entry['context'])] = \
+                        (entry['translation'], True, entry['warning'])
+                except (KeyError, TypeError):
+                    continue
+                #end try
+            #end for
+        #end with
+
+        return results
+    #end def
+
+    def start(self, previousResults=None):
+        """
+        Start a new journal, keeping the given results of a previous run in it.
+        """
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        #end if
+
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+        for (workKey, result) in (previousResults or {}).items():
+            self._file.write(self._line(workKey, result))
+        #end for
+        self._sync()
+    #end def
+
+    def _line(self, workKey, result):
+        (translateTargetCode, sourceText, context) = workKey
+        (translation, success, warning) = result
+        return json.dumps({'target': translateTargetCode, 'text': sourceText, 'context': context,
+                           'translation': translation, 'warning': warning}, ensure_ascii=False) + "\n"
+    #end def
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    #end def
+
+    def record(self, workKeys, results):
+        """
+        Append the successful results of a finished request.
+
+        :param workKeys: list of (target code, source text, context) translated by the request
+        :param results: list of (translation, success, warning), in the same order
+        """
+        lines = [self._line(workKey, result) for (workKey, result) in zip(workKeys, results) if result[1]]
+        if not lines:
+            return
+        #end if
+
+        with self._lock:
+            if self._file is None:
+                return
+            #end if
+            self._file.write("".join(lines))
+            self._sync()
+            self.totalRecorded += len(lines)
+        #end with
+    #end def
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            #end if
+        #end with
+    #end def
+
+    def remove(self):
+        """
+        Close and delete the journal, once every language of the run was written.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        #end if
+    #end def
+#end class
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+import hashlib
+import json
+import os.path
+
+from functions import writeFileAtomically
+
+def sourceFingerprint(translationTuple):
+    """
+    Fingerprint of the source value and comment of a key, used to notice when the source of an existing translation
+    has changed.
+    """
+    comment = (translationTuple['comment'] or "").strip()
+    return hashlib.sha1((translationTuple['value'] + "\0" + comment).encode("utf-8")).hexdigest()
+#end def
+
+def manifestPath(cacheDir, originPath, stringsFileName, outputTargetCode):
+    """
+    Path of the manifest for a target language. Manifests are kept per source file, so several projects can share
+    the same cache directory.
+    """
+    originHash = hashlib.sha1(os.path.abspath(originPath).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cacheDir, "manifests", originHash, outputTargetCode + ".lproj", stringsFileName + ".json")
+#end def
+
+class TranslationManifest:
+    """
+    Records the fingerprint of the source of every key at the time it was translated for a target language, the
+    translation that was written for it, and the outdated translation it replaced when its source changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fingerprints = {}
+        self.values = {}
+        self.outdated = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as manifestFile:
+                    manifest = json.load(manifestFile)
+                #end with
+                self.fingerprints = manifest.get('fingerprints', {})
+                self.values = manifest.get('values', {})
+                self.outdated = manifest.get('outdated', {})
+            except (IOError, ValueError) as e:
+                print("Ignoring unreadable manifest %s: %s" % (path, e))
+            #end try
+        #end if
+    #end def
+
+    def fingerprintOf(self, key):
+        """
+        :return: fingerprint of the source the key was translated from, or None if unknown
+        """
+        return self.fingerprints.get(key)
+    #end def
+
+    def sourceChanged(self, translationTuple):
+        """
+        Whether the source of a key changed since it was translated. Keys translated before the manifest existed
+        are assumed to be unchanged.
+        """
+        fingerprint = self.fingerprintOf(translationTuple['key'])
+        return fingerprint is not None and fingerprint != sourceFingerprint(translationTuple)
+    #end def
+
+    def isOutdated(self, key, existingValue):
+        """
+        Whether an existing translation is the outdated one the last translation of the key replaced, e.g. the output
+        of the last run was not copied into the existing translations. Any other existing translation, edited by hand
+        or not, is up to date.
+        """
+        return key in self.values and key in self.outdated and self.outdated[key] == existingValue
+    #end def
+
+    def upToDateValue(self, key, existingValue):
+        """
+        :return: translation recorded for the key if the existing one is outdated, see isOutdated, otherwise the
+                 existing one
+        """
+        return self.values[key] if self.isOutdated(key, existingValue) else existingValue
+    #end def
+
+    def save(self, fingerprints, values=None, outdated=None):
+        """
+        Replace the manifest with the given fingerprints of the keys present in the output.
+
+        :param fingerprints: dict of key to fingerprint
+        :param values: dict of key to the translation written to the output
+        :param outdated: dict of key to the existing translation replaced because the source of the key changed
+        """
+        self.fingerprints = dict(fingerprints)
+        self.values = dict(values or {})
+        self.outdated = dict(outdated or {})
+
+        writeFileAtomically(self.path, json.dumps({'version': 1, 'fingerprints': self.fingerprints,
+                                                   'values': self.values, 'outdated': self.outdated},
+                                                  ensure_ascii=False, sort_keys=True))
+    #end def
+#end class
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+import json
+import os
+import os.path
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in milliseconds of the buckets of the request latency histograms
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+REPORT_VERSION = 1
+
+def _percentile(sortedValues, fraction):
+    if not sortedValues:
+        return None
+    #end if
+
+    return sortedValues[min(len(sortedValues) - 1, int(round(fraction * (len(sortedValues) - 1))))]
+#end def
+
+class RunMetrics:
+    """
+    Timings and counters collected while a script runs, shared by all threads: time spent in each stage (reading,
+    encoding detection, parsing, post-processing, writing...), the latency of every request sent to a translator,
+    and the strings translated for each language. report() returns everything as a dict ready to be saved as JSON.
+    """
+
+    def __init__(self):
+        self.startedAt = time.time()
+        self._started = time.perf_counter()
+        self._stages = {}
+        self._requests = {}
+        self._languages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+    #end def
+
+    def addStageTime(self, stage, seconds, count=1):
+        with self._lock:
+            stats = self._stages.setdefault(stage, {'count': 0, 'seconds': 0.0, 'maxSeconds': 0.0})
+            stats['count'] += count
+            stats['seconds'] += seconds
+            stats['maxSeconds'] = max(stats['maxSeconds'], seconds)
+        #end with
+    #end def
+
+    @contextmanager
+    def timed(self, stage):
+        """
+        Time the enclosed block as part of a stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addStageTime(stage, time.perf_counter() - start)
+        #end try
+    #end def
+
+    def recordRequest(self, providerName, seconds, items, succeeded):
+        """
+        Record one request sent to a translator.
+
+        :param items: number of strings sent in the request
+        :param succeeded: whether the translator answered, False for errors and throttling
+        """
+        with self._lock:
+            stats = self._requests.setdefault(providerName, {'latencies': [], 'items': 0, 'failed': 0})
+            stats['latencies'].append(seconds)
+            stats['items'] += items
+            if not succeeded:
+                stats['failed'] += 1
+            #end if
+        #end with
+    #end def
+
+    def recordLanguage(self, translateTargetCode, strings, start, end):
+        """
+        Record strings translated for a language by a request started and finished at the given perf_counter times.
+        """
+        with self._lock:
+            stats = self._languages.setdefault(translateTargetCode, {'strings': 0, 'requests': 0, 'start': start,
+                                                                     'end': end})
+            stats['strings'] += strings
+            stats['requests'] += 1
+            stats['start'] = min(stats['start'], start)
+            stats['end'] = max(stats['end'], end)
+        #end with
+    #end def
+
+    def setCounter(self, name, value):
+        with self._lock:
+            self._counters[name] = value
+        #end with
+    #end def
+
+    def addCounter(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        #end with
+    #end def
+
+    def report(self):
+        """
+        :return: dict with every metric collected so far
+        """
+        with self._lock:
+            stages = {}
+            for (stage, stats) in self._stages.items():
+                stages[stage] = {'count': stats['count'], 'seconds': round(stats['seconds'], 6),
+                                 'maxSeconds': round(stats['maxSeconds'], 6)}
+            #end for
+
+            requests = {}
+            for (providerName, stats) in self._requests.items():
+                latencies = sorted(stats['latencies'])
+
+                # Requests per latency bucket, the last bucket (maxMs None) holds the slower ones
+                histogram = [{'maxMs': bucket, 'count': 0} for bucket in LATENCY_BUCKETS_MS + [None]]
+                for latency in latencies:
+                    position = next((position for (position, bucket) in enumerate(LATENCY_BUCKETS_MS)
+                                     if latency * 1000 <= bucket), len(LATENCY_BUCKETS_MS))
+                    histogram[position]['count'] += 1
+                #end for
+
+                requests[providerName] = {
+                    'requests': len(latencies),
+                    'failed': stats['failed'],
+                    'strings': stats['items'],
+                    'seconds': round(sum(latencies), 6),
+                    'p50Seconds': _percentile(latencies, 0.5),
+                    'p95Seconds': _percentile(latencies, 0.95),
+                    'maxSeconds': latencies[-1] if latencies else None,
+                    'histogram': histogram,
+                }
+            #end for
+
+            languages = {}
+            for (translateTargetCode, stats) in self._languages.items():
+                seconds = stats['end'] - stats['start']
+                languages[translateTargetCode] = {
+                    'strings': stats['strings'],
+                    'requests': stats['requests'],
+                    'seconds': round(seconds, 6),
+                    'stringsPerSecond': round(stats['strings'] / seconds, 3) if seconds > 0 else None,
+                }
+            #end for
+
+            return {
+                'version': REPORT_VERSION,
+                'startedAt': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.startedAt)),
+                'totalSeconds': round(time.perf_counter() - self._started, 6),
+                'stages': stages,
+                'requests': requests,
+                'languages': languages,
+                'counters': dict(self._counters),
+            }
+        #end with
+    #end def
+
+    def writeReport(self, fileName, extra=None):
+        """
+        Save the report as JSON.
+
+        :param extra: optional dict of additional fields, e.g. the options of the run
+        """
+        report = self.report()
+        report.update(extra or {})
+
+        directory = os.path.dirname(os.path.abspath(fileName))
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        #end if
+
+        with open(fileName, "w", encoding="utf-8") as reportFile:
+            json.dump(report, reportFile, ensure_ascii=False, indent=2, sort_keys=True)
+        #end with
+    #end def
+#end class
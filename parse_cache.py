@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+import hashlib
+import marshal
+import os
+import os.path
+import struct
+import sys
+import threading
+import time
+
+from strings_parser import PARSER_VERSION
+
+# Bumped whenever the layout of the cached entries changes
+PARSE_CACHE_FORMAT = 1
+
+# Files modified this recently are not cached, as a later change within the resolution of the file system clock could
+# leave the same modification time and size
+MIN_FILE_AGE_SECS = 2
+
+class ParseCache:
+    """
+    On-disk cache of parsed .strings files, so unchanged files are neither decoded nor parsed again.
+
+    Each file gets an entry stored with marshal, keyed by its absolute path: the length of the header, the header and
+    the keys, values and comments of the file. An entry is only used when the modification time and size of the file,
+    the encoding it was read with and the parser version all match, otherwise it is replaced. Entries of files that
+    changed or no longer exist are removed the first time the cache is written to in a run, and only the most recently
+    used maxEntries are kept.
+    """
+
+    def __init__(self, directory, maxEntries=2000):
+        self.directory = directory
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self._swept = False
+        self._lock = threading.Lock()
+    #end def
+
+    def _header(self, absPath, fileStat, encoding):
+        return (PARSE_CACHE_FORMAT, PARSER_VERSION, tuple(sys.version_info[:2]), absPath, fileStat.st_mtime_ns,
+                fileStat.st_size, encoding or "")
+    #end def
+
+    def _entryPath(self, absPath):
+        return os.path.join(self.directory, hashlib.sha1(absPath.encode("utf-8")).hexdigest() + ".bin")
+    #end def
+
+    def load(self, fileName, encoding=None):
+        """
+        Return the cached translations of a file, or None if the file is not cached or changed since.
+        """
+        absPath = os.path.abspath(fileName)
+        try:
+            header = self._header(absPath, os.stat(absPath), encoding)
+            with open(self._entryPath(absPath), "rb") as entryFile:
+                data = entryFile.read()
+            #end with
+
+            headerLength = struct.unpack_from("<I", data)[0]
+            if marshal.loads(data[4:4 + headerLength]) != header:
+                self.misses += 1
+                return None
+            #end if
+            (keys, values, comments) = marshal.loads(memoryview(data)[4 + headerLength:])
+        except (OSError, EOFError, ValueError, TypeError, struct.error):
+            self.misses += 1
+            return None
+        #end try
+
+        # Mark the entry as recently used
+        try:
+            os.utime(self._entryPath(absPath))
+        except OSError:
+            pass
+        #end try
+
+        self.hits += 1
+        return [{'key': key, 'value': value, 'comment': comment}
+                for (key, value, comment) in zip(keys, values, comments)]
+    #end def
+
+    def store(self, fileName, translations, encoding=None):
+        """
+        Cache the translations parsed from a file.
+        """
+        absPath = os.path.abspath(fileName)
+        try:
+            fileStat = os.stat(absPath)
+        except OSError:
+            return
+        #end try
+
+        if time.time() - fileStat.st_mtime < MIN_FILE_AGE_SECS:
+            return
+        #end if
+
+        self._sweepOnce()
+
+        entryPath = self._entryPath(absPath)
+        tempPath = "%s.%s.%s.tmp" % (entryPath, os.getpid(), threading.get_ident())
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory, exist_ok=True)
+            #end if
+
+            header = marshal.dumps(self._header(absPath, fileStat, encoding))
+            body = marshal.dumps((tuple(translation['key'] for translation in translations),
+                                  tuple(translation['value'] for translation in translations),
+                                  tuple(translation['comment'] for translation in translations)))
+            with open(tempPath, "wb") as entryFile:
+                entryFile.write(struct.pack("<I", len(header)) + header + body)
+            #end with
+            os.replace(tempPath, entryPath)
+        except OSError as e:
+            print("Could not cache parsed file %s: %s" % (fileName, e))
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            #end if
+        #end try
+    #end def
+
+    def _sweepOnce(self):
+        with self._lock:
+            if self._swept:
+                return
+            #end if
+            self._swept = True
+        #end with
+
+        self.evictStale()
+    #end def
+
+    def evictStale(self):
+        """
+        Remove entries whose file changed or no longer exists, then the least recently used entries over maxEntries.
+
+        :return: number of entries removed
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        #end if
+
+        removed = 0
+        remaining = []
+        for entryName in os.listdir(self.directory):
+            entryPath = os.path.join(self.directory, entryName)
+            if not entryName.endswith(".bin"):
+                continue
+            #end if
+
+            try:
+                with open(entryPath, "rb") as entryFile:
+                    headerLength = struct.unpack("<I", entryFile.read(4))[0]
+                    header = marshal.loads(entryFile.read(headerLength))
+                #end with
+                fileStat = os.stat(header[3])
+                stale = header[:3] != self._header(header[3], fileStat, "")[:3] \
+                    or header[4] != fileStat.st_mtime_ns or header[5] != fileStat.st_size
+            except (OSError, EOFError, ValueError, TypeError, IndexError, struct.error):
+                stale = True
+            #end try
+
+            if stale:
+                try:
+                    os.remove(entryPath)
+                    removed += 1
+                except OSError:
+                    pass
+                #end try
+            else:
+                remaining.append((os.path.getmtime(entryPath), entryPath))
+            #end if
+        #end for
+
+        for (modified, entryPath) in sorted(remaining)[:max(0, len(remaining) - self.maxEntries)]:
+            try:
+                os.remove(entryPath)
+                removed += 1
+            except OSError:
+                pass
+            #end try
+        #end for
+
+        return removed
+    #end def
+#end class
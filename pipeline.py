@@ -0,0 +1,1203 @@
+#!/usr/bin/python3
+import concurrent.futures
+import os
+import os.path
+import time
+from xml.parsers.expat import ExpatError
+
+from functions import StringsWriter, readTranslations
+from batching import makeBatches, translateBatch
+from batch_jobs import batchCustomId, batchRequestLine, readBatchResults, writeBatchRequests
+from format_specifiers import normalizeTranslation, validateFormat
+from journal import TranslationJournal, journalPath
+from manifest import TranslationManifest, manifestPath, sourceFingerprint
+from metrics import RunMetrics
+from rate_limiter import callWithRetries
+from scheduler import TranslationScheduler
+from strings_parser import StringsSyntaxError
+from stringsdict import StringsdictWriter, isStringsdict, loadStringsdict, readStringsdict, \
+    stringsdictTranslations, translationsForTarget
+from translation_cache import DEFAULT_CACHE_DIR
+from translation_plan import TranslationPlan
+from xcstrings import CatalogWriter, catalogTranslations, isCatalog, loadCatalog, translatedUnits
+
+# Translates the strings resources of an app with a translator, as a library: a TranslationPipeline holds everything
+# a run needs (translator, translation memory, scheduler, options), none of it global, so a long-lived process can
+# translate several projects at once, sharing a warm translator client, translation memory and scheduler between
+# pipelines. translate.py is the command line interface over it.
+#
+#     provider = createProvider("deepl", authKey=key)
+#     pipeline = TranslationPipeline(provider, readLanguageCodes("LanguageCodes.txt"), outputPath="build/strings")
+#     for result in pipeline.translate(pipeline.readProject("MyApp")):
+#         print(result['source'], result['outputTargetCode'], result['translated'])
+#     pipeline.close()
+
+# Errors reading a source saved halfway, or writing its outputs, which watch retries on its next check: invalid JSON
+# or plists and decoding errors are ValueErrors, malformed plist XML raises ExpatError
+WATCH_RETRIED_ERRORS = (OSError, ValueError, ExpatError, StringsSyntaxError)
+
+
+def readLanguageCodes(fileName="LanguageCodes.txt"):
+    """
+    Read the languages to translate to, one per line: name, Google code, DeepL code and iOS code (.lproj name).
+    Lines starting with # are skipped.
+
+    :return: list of (friendly name, Google code, DeepL code, output code)
+    """
+    languages = []
+    with open(fileName, 'r') as supportedLangCodeFile:
+        for targetLine in supportedLangCodeFile:
+
+            if targetLine.strip().startswith("#"):
+                continue
+            # end if
+
+            targetArray = targetLine.split()
+            languages.append((targetArray[0], targetArray[1], targetArray[2], targetArray[3]))
+        # end for
+    # end with
+
+    return languages
+# end def
+
+
+def translationNeeded(translationTuple, existingTranslations, manifest, changedKeys=None):
+    """
+    Check if translation is required for a given source key. If not delta-translating, this will always return True
+    other wise False if translation key found in original target Localizable.strings file and its source did not
+    change since it was translated.
+
+    :param translationTuple: key / value
+    :param existingTranslations:  existing target translations, indexed by key
+    :param manifest:  TranslationManifest with the fingerprints of the sources of the existing translations
+    :param changedKeys: optional set of keys known to have changed, translated again whatever the manifest says
+    :return: True if needed, False if an up to date translation was found in the original target.
+    """
+    if translationTuple['key'] not in existingTranslations:
+        return True
+    # end if
+    if changedKeys is not None and translationTuple['key'] in changedKeys:
+        return True
+    # end if
+
+    return manifest.sourceChanged(translationTuple)
+# end def
+
+
+def findProjectSources(projectPath, originLangKey, outputPath="output"):
+    """
+    Find the strings resources of the origin language in a project: the .strings and .stringsdict files of every
+    `<origin>.lproj` directory under the root, those of `Base.lproj` directories not also found in the
+    `<origin>.lproj` directory next to them, and every String Catalog (.xcstrings). Hidden directories and the output
+    directory are skipped.
+
+    :return: sorted list of paths
+    """
+    outputPath = os.path.abspath(outputPath)
+    originPaths = []
+    for (dirPath, dirNames, fileNames) in os.walk(projectPath):
+        dirNames[:] = sorted(dirName for dirName in dirNames if not dirName.startswith(".")
+                             and os.path.abspath(os.path.join(dirPath, dirName)) != outputPath)
+
+        originPaths += [os.path.join(dirPath, fileName) for fileName in sorted(fileNames) if isCatalog(fileName)]
+
+        lprojName = os.path.basename(dirPath)
+        if lprojName not in (originLangKey + ".lproj", "Base.lproj"):
+            continue
+        # end if
+
+        for fileName in sorted(fileNames):
+            if not fileName.endswith(".strings") and not isStringsdict(fileName):
+                continue
+            # end if
+            if lprojName == "Base.lproj" and os.path.exists(
+                    os.path.join(os.path.dirname(dirPath), originLangKey + ".lproj", fileName)):
+                continue
+            # end if
+            originPaths.append(os.path.join(dirPath, fileName))
+        # end for
+    # end for
+
+    return originPaths
+# end def
+
+
+def pathForTarget(rootPath, source, outputTargetCode):
+    """
+    Path of the file of a target language for a source, under the given root directory. String Catalogs hold every
+    language in the same file.
+    """
+    if source['catalog'] is not None:
+        return os.path.join(rootPath, source['relativeDir'], source['stringsFileName'])
+    # end if
+
+    return os.path.join(rootPath, source['relativeDir'], outputTargetCode + ".lproj", source['stringsFileName'])
+# end def
+
+
+def sourceLinesFor(source, outputTargetCode):
+    """
+    Keys of a source to translate for a target language. Plural variants of .stringsdict files are the ones of the
+    target language.
+    """
+    if source['template'] is not None:
+        return translationsForTarget(source['template'], outputTargetCode)
+    elif source['catalog'] is not None:
+        return catalogTranslations(source['catalog'], outputTargetCode)
+    # end if
+
+    return source['originLines']
+# end def
+
+
+def fileStamp(fileName):
+    """
+    :return: modification time and size of a file, None if it doesn't exist
+    """
+    try:
+        stat = os.stat(fileName)
+    except OSError:
+        return None
+    # end try
+
+    return (stat.st_mtime_ns, stat.st_size)
+# end def
+
+
+def changedKeysOf(previousLines, lines):
+    """
+    Diff two versions of the keys of a source.
+
+    :return: (set of keys added or whose value or comment changed, set of keys removed)
+    """
+    previousSources = dict((translationTuple['key'], (translationTuple['value'], translationTuple['comment']))
+                           for translationTuple in previousLines)
+    changedKeys = set()
+    for translationTuple in lines:
+        if previousSources.get(translationTuple['key']) != (translationTuple['value'], translationTuple['comment']):
+            changedKeys.add(translationTuple['key'])
+        # end if
+    # end for
+
+    return (changedKeys, set(previousSources) - set(translationTuple['key'] for translationTuple in lines))
+# end def
+
+
+class TranslationPipeline:
+    """
+    Translates source files to every target language with one translator: reads the sources, plans the strings
+    needing translation for every file and language at once, queues the requests on the scheduler and writes the
+    outputs, yielding a result for each output file as soon as it is written.
+
+    The provider, translation memory and scheduler are given by the caller and can be shared by several pipelines
+    running at the same time, e.g. one per project, each pipeline only holds the state of its own runs.
+    """
+
+    def __init__(self, provider, languages, sourceLang="en", outputPath="output", cacheDir=DEFAULT_CACHE_DIR,
+                 translationCache=None, parseCache=None, scheduler=None, existingPath=None, emulate=False,
+                 maxBatchItems=0, retries=5, encoding=None, verbose="0", metrics=None, log=print):
+        """
+        :param provider: TranslationProvider to translate with, see providers.createProvider
+        :param languages: languages to translate to, see readLanguageCodes
+        :param sourceLang: origin locale
+        :param outputPath: directory the translations are written to
+        :param cacheDir: directory of the manifests and journals shared across runs
+        :param translationCache: optional TranslationCache, texts found in it are not sent to the translator
+        :param parseCache: optional ParseCache, unchanged .strings files found in it are not parsed again
+        :param scheduler: optional TranslationScheduler to queue requests on, a scheduler of its own otherwise
+        :param existingPath: optional root directory of existing translations, only new and changed keys are then
+                             translated and the existing translations of the others are carried over
+        :param emulate: only print what would be translated, nothing is sent or written
+        :param maxBatchItems: maximum number of strings per request, 0 for the limits of the translator
+        :param retries: number of times a throttled or failed request is retried
+        :param encoding: encoding of the .strings files read, detected from their contents if None
+        :param verbose: verbose level
+        :param metrics: RunMetrics the timings and counters of the runs are collected in
+        :param log: function printing the progress of the runs
+        """
+        self.provider = provider
+        self.sourceLang = sourceLang
+        self.outputPath = outputPath
+        self.cacheDir = os.path.expanduser(cacheDir)
+        self.translationCache = translationCache
+        self.parseCache = parseCache
+        self.existingPath = os.path.expanduser(existingPath) if existingPath else None
+        self.emulate = emulate
+        self.maxBatchItems = int(maxBatchItems)
+        self.retries = int(retries)
+        self.encoding = encoding or None
+        self.verbose = verbose
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.log = log
+        # Results of an offline Batch API job read with ingestBatchResults, by custom_id
+        self.batchResults = None
+        # Translations written for each (source name, output target code), carried over by watch
+        self.writtenTranslations = {}
+
+        self.ownsScheduler = scheduler is None
+        if scheduler is None:
+            scheduler = TranslationScheduler({provider.name: provider.concurrency})
+        # end if
+        self.scheduler = scheduler
+
+        self.targetLanguages = []
+        for (translateFriendlyName, googleTranslateTargetCode, deeplTranslateTargetCode, outputTargetCode) in languages:
+            useLangCode = provider.languageCode(translateFriendlyName, googleTranslateTargetCode,
+                                                deeplTranslateTargetCode)
+            if useLangCode is None:
+                self.log("Ignoring non-supported language for %s: %s" %
+                         (provider.friendlyName, translateFriendlyName))
+                continue
+            # endif
+
+            self.targetLanguages.append((translateFriendlyName, useLangCode, outputTargetCode))
+        # end for
+    # end def
+
+    def requestTranslations(self, sourceTexts, translateTargetCode, contexts):
+        """
+        Send a batch of source texts to Google / DeepL / OpenAI in as few requests as the translator allows.
+
+        :param sourceTexts: list of source texts to translate
+        :param translateTargetCode: target language (google translation code)
+        :param contexts: list of comments giving context to each source text
+        :return: list of translated texts, in the order of sourceTexts
+        """
+        provider = self.provider
+        if self.emulate:
+            if self.verbose == "1":
+                for sourceText in sourceTexts:
+                    self.log("  ..... Translating in Emulation: %s" % (sourceText))
+                # end for
+            # end if
+
+            return list(sourceTexts)
+        # end if
+
+        def timedRequest():
+            start = time.perf_counter()
+            succeeded = False
+            try:
+                translatedTexts = provider.translateMasked(sourceTexts, self.sourceLang, translateTargetCode, contexts)
+                succeeded = True
+                return translatedTexts
+            finally:
+                self.metrics.recordRequest(provider.name, time.perf_counter() - start, len(sourceTexts), succeeded)
+            # end try
+        # end def
+
+        return callWithRetries(timedRequest, provider.rateLimiter, provider.classifyError, maxRetries=self.retries,
+                               label="%s request for %s" % (provider.friendlyName, translateTargetCode))
+    # end def
+
+    def contextForCache(self, context):
+        """
+        Only translators using the comment as context (OpenAI) cache a text per comment, for other translators the
+        same text is cached once no matter its comment.
+        """
+        if self.provider.usesContext:
+            return context or ""
+        # end if
+
+        return ""
+    # end def
+
+    def translateSourceTexts(self, sourceTexts, translateTargetCode, contexts, requestFn=None):
+        """
+        Return translations for a batch of source texts using Google / DeepL / OpenAI. Texts found in the translation
+        memory are not sent to the translator. A text that fails to translate only fails by itself, the rest of the
+        batch is still returned.
+
+        :param sourceTexts: list of source texts to translate
+        :param translateTargetCode: target language (google translation code)
+        :param contexts: list of comments giving context to each source text
+        :param requestFn: optional function returning the translations of a list of indexes of sourceTexts, used
+                          instead of sending requests to the translator
+        :return: list of (translation, success, warning) tuples in the order of sourceTexts
+        """
+        if requestFn is None:
+            requestFn = lambda indexes: self.requestTranslations(
+                [sourceTexts[index] for index in indexes], translateTargetCode, [contexts[index] for index in indexes])
+        # end if
+
+        provider = self.provider
+        metrics = self.metrics
+        cacheContexts = [self.contextForCache(context) for context in contexts]
+
+        rawResults = [None] * len(sourceTexts)
+        if self.translationCache is not None:
+            with metrics.timed("translationMemory"):
+                cachedTexts = self.translationCache.getMany(
+                    provider.name, self.sourceLang, translateTargetCode, sourceTexts, cacheContexts)
+            # end with
+            rawResults = [None if cachedText is None else (cachedText, None) for cachedText in cachedTexts]
+        # end if
+
+        missingIndexes = [index for (index, rawResult) in enumerate(rawResults) if rawResult is None]
+        if missingIndexes:
+            batchResults = translateBatch(missingIndexes, requestFn, provider.classifyError)
+            for (index, batchResult) in zip(missingIndexes, batchResults):
+                rawResults[index] = batchResult
+            # end for
+        # end if
+
+        missingIndexSet = set(missingIndexes)
+        results = []
+        newlyCached = []
+        postProcessSeconds = 0.0
+        for (index, (sourceText, (translatedText, error))) in enumerate(zip(sourceTexts, rawResults)):
+            if error is None and translatedText is None:
+                error = "no translation returned"
+            # end if
+
+            if error is not None:
+                self.log("\n  ..... !! FAILED !! to translate for %s: %s = %s\n" %
+                         (translateTargetCode, sourceText, error))
+
+                results.append((sourceText, False, False))
+                continue
+            # end if
+
+            if self.verbose == "1" and not self.emulate:
+                self.log("  ..... Translated with %s: %s => %s" %
+                         (provider.friendlyName, sourceText, translatedText))
+            # end if
+
+            start = time.perf_counter()
+            result = self.postProcessTranslation(sourceText, translatedText, translateTargetCode)
+            postProcessSeconds += time.perf_counter() - start
+            results.append(result)
+
+            # Translations with formatter warnings are not remembered, so they are retried on the next run
+            (translation, success, warning) = result
+            if index in missingIndexSet and success and not warning and not self.emulate:
+                newlyCached.append((sourceText, cacheContexts[index], translatedText))
+            # end if
+        # end for
+
+        metrics.addStageTime("postProcess", postProcessSeconds, len(sourceTexts))
+        if self.translationCache is not None and newlyCached:
+            with metrics.timed("translationMemory"):
+                self.translationCache.putMany(provider.name, self.sourceLang, translateTargetCode, newlyCached)
+            # end with
+        # end if
+
+        return results
+    # end def
+
+    def translateSourceText(self, sourceText, translateTargetCode, context=None):
+        """
+        Return translation for source text using Google / DeepL / OpenAI
+        :param sourceText: source text to translate
+        :param translateTargetCode: target language (google translation code)
+        :return: (translation, success, warning)
+        """
+        return self.translateSourceTexts([sourceText], translateTargetCode, [context])[0]
+    # end def
+
+    def postProcessTranslation(self, sourceText, translatedText, translateTargetCode):
+        """
+        Clean up a translation returned by a translator and check it kept the formatters of the source text.
+
+        :param sourceText: source text
+        :param translatedText: translation returned by the translator
+        :param translateTargetCode: target language
+        :return: (translation, success, warning)
+        """
+        translatedText = normalizeTranslation(translatedText)
+
+        # Some basic validation to confirm translation did not get rid of formatters in source text
+        formatWarning = validateFormat(sourceText, translatedText)
+        formatterFailed = formatWarning is not None
+        if formatterFailed:
+            self.log("\n  ..... !! WARNING !! %s: %s => %s (lang: %s)\n" % (
+                formatWarning, sourceText, translatedText, translateTargetCode))
+        # end if
+
+        return (translatedText, True, formatterFailed)
+    # end def
+
+    def translatePlanItems(self, planItems, translateTargetCode, journal=None):
+        """
+        Translate a batch of unique work items of the translation plan to a target language.
+
+        :param planItems: list of work items, see TranslationPlan
+        :param translateTargetCode:  target language
+        :param journal: optional TranslationJournal the results are recorded in
+        :return: list of (translation, success, warning)
+        """
+        translationTuples = [planItem['translationTuple'] for planItem in planItems]
+        sourceTexts = [translationTuple['value'] for translationTuple in translationTuples]
+        contexts = [translationTuple['comment'] or "" for translationTuple in translationTuples]
+
+        requestFn = None
+        if self.batchResults is not None:
+            # Take the translations from the results of the Batch API job instead of the translator
+            requestFn = lambda indexes: [self.ingestedTranslation(
+                batchCustomId(planItems[index]['sourceName'], planItems[index]['outputTargetCode'],
+                              translationTuples[index]),
+                translateTargetCode)
+                for index in indexes]
+        # end if
+
+        start = time.perf_counter()
+        results = self.translateSourceTexts(sourceTexts, translateTargetCode, contexts, requestFn)
+        self.metrics.recordLanguage(translateTargetCode, len(planItems), start, time.perf_counter())
+
+        if journal is not None:
+            journal.record([planItem['workKey'] for planItem in planItems], results)
+        # end if
+
+        return results
+    # end def
+
+    def ingestedTranslation(self, customId, translateTargetCode):
+        """
+        :return: translation found for a request in the results of the Batch API job, or None
+        """
+        (translation, error) = self.batchResults.get(customId, (None, "not found in the batch results"))
+        if error is not None:
+            self.log("  ..... No batch result for %s (%s): %s" % (customId, translateTargetCode, error))
+        # end if
+
+        return translation
+    # end def
+
+    def readSource(self, originPath, projectPath=None, strict=False):
+        """
+        Read a source file of the origin language.
+
+        :param originPath: path of the .strings, .stringsdict or .xcstrings file
+        :param projectPath: root directory of the project the file was found in, if any
+        :param strict: raise StringsSyntaxError on invalid syntax in a .strings file instead of skipping the line
+        :return: source with the translations of the file and the names and paths its outputs are written with
+        """
+        dirName, stringsFileName = os.path.split(originPath)
+        self.log("Reading source language: %s" % (originPath))
+        self.log("Will use filename: %s" % (stringsFileName))
+
+        # Outputs of a project keep the directory of the .lproj directory the file was found in, relative to the
+        # root. String Catalogs hold every language, so they are not in a .lproj directory.
+        relativeDir = ""
+        if projectPath is not None:
+            relativeDir = os.path.relpath(dirName if isCatalog(stringsFileName) else os.path.dirname(dirName),
+                                          projectPath)
+            if relativeDir == os.curdir:
+                relativeDir = ""
+            # end if
+        # end if
+
+        source = {
+            'originPath': originPath,
+            'projectPath': projectPath,
+            'stringsFileName': stringsFileName,
+            'name': os.path.join(relativeDir, stringsFileName),
+            'relativeDir': relativeDir,
+            'template': None,
+            'catalog': None,
+            'catalogWriter': None,
+        }
+        if isCatalog(stringsFileName):
+            source['catalog'] = loadCatalog(originPath, metrics=self.metrics)
+            source['originLines'] = catalogTranslations(source['catalog'])
+            source['catalogWriter'] = CatalogWriter(source['catalog'], pathForTarget(self.outputPath, source, None),
+                                                    metrics=self.metrics)
+        elif isStringsdict(stringsFileName):
+            source['template'] = loadStringsdict(originPath, metrics=self.metrics)
+            source['originLines'] = stringsdictTranslations(source['template'])
+        else:
+            source['originLines'] = self.readStrings(originPath, strict=strict)
+        # end if
+
+        self.log("Total lines in source: %s\n" % (len(source['originLines'])))
+        return source
+    # end def
+
+    def readSources(self, originPaths):
+        """
+        Read source files given one by one, see readSource.
+        """
+        return [self.readSource(os.path.expanduser(originPath)) for originPath in originPaths]
+    # end def
+
+    def readProject(self, projectPath):
+        """
+        Read every source file of the origin language found in a project, see findProjectSources.
+        """
+        projectPath = os.path.expanduser(projectPath)
+        originPaths = findProjectSources(projectPath, self.sourceLang.strip(), self.outputPath)
+        self.log("Found %s strings files of %s in project: %s\n" % (len(originPaths), self.sourceLang.strip(),
+                                                                     projectPath))
+
+        return [self.readSource(originPath, projectPath) for originPath in originPaths]
+    # end def
+
+    def friendlyNameFor(self, source, translateFriendlyName):
+        """
+        Name of a language printed for a source, with the name of the file in project mode.
+        """
+        if source['relativeDir'] or source['projectPath'] is not None:
+            return "%s (%s)" % (translateFriendlyName, source['name'])
+        # end if
+
+        return translateFriendlyName
+    # end def
+
+    def existingTranslationsFor(self, source, rootPath, outputTargetCode):
+        """
+        Read the existing translations of a target language for a source: those of its file under the given root
+        directory, or for a String Catalog its units of the language in the "translated" state.
+
+        :param rootPath: root directory of the existing translations, None for the catalog of the source itself
+        """
+        if source['catalog'] is not None:
+            catalog = source['catalog']
+            if rootPath is not None:
+                catalog = loadCatalog(pathForTarget(rootPath, source, outputTargetCode), metrics=self.metrics)
+            # end if
+            return translatedUnits(catalog, outputTargetCode)
+        # end if
+
+        fileName = pathForTarget(rootPath, source, outputTargetCode)
+        if isStringsdict(fileName):
+            return readStringsdict(fileName, metrics=self.metrics)
+        # end if
+
+        return self.readStrings(fileName)
+    # end def
+
+    def readStrings(self, fileName, strict=False):
+        """
+        Read a .strings file with the parse cache and metrics of the pipeline.
+        """
+        return readTranslations(fileName, strict=strict, encoding=self.encoding,
+                                parseCache=self.parseCache, metrics=self.metrics)
+    # end def
+
+    def targetLanguagesFor(self, source):
+        """
+        Target languages of a source: every language of the pipeline, but the source language of a String Catalog.
+        """
+        if source['catalog'] is None:
+            return self.targetLanguages
+        # end if
+
+        return [targetLanguage for targetLanguage in self.targetLanguages
+                if targetLanguage[2] != source['catalog'].get('sourceLanguage')]
+    # end def
+
+    def planTranslateFile(self, plan, source, translateFriendlyName, translateTargetCode, outputTargetCode,
+                          existingTranslations=None, changedKeys=None):
+        """
+        Find the keys of the source language that need translating for the given output file, and add them to the
+        translation plan. Nothing is sent or written until the plan is submitted and finishTranslateFile is called
+        with the returned job.
+
+        :param plan: TranslationPlan of the run
+        :param source: source file, see readSource
+        :param translateFriendlyName: friendly name for printing
+        :param translateTargetCode: google translation target code
+        :param outputTargetCode: output target code
+        :param existingTranslations: optional existing translations indexed by key, used instead of reading them
+        :param changedKeys: optional set of keys to translate again even if they have an existing translation
+        :return: job with the manifest, the existing translations and the work keys of the needed lines
+        """
+        self.log("Planning translations for: " + self.friendlyNameFor(source, translateFriendlyName))
+
+        stringsFileName = source['stringsFileName']
+        originLines = sourceLinesFor(source, outputTargetCode)
+        manifest = TranslationManifest(manifestPath(self.cacheDir, source['originPath'], stringsFileName,
+                                                    outputTargetCode))
+
+        # When delta-translating, pre-load existing translations to compare against
+        existingOutputTranslations = {}
+        if existingTranslations is not None:
+            # Translations kept in memory from the previous pass in watch mode
+            existingOutputTranslations = existingTranslations
+        elif source['catalog'] is not None:
+            # A String Catalog holds every language, the units already translated are carried over
+            for existingTranslation in self.existingTranslationsFor(source, None, outputTargetCode):
+                existingOutputTranslations[existingTranslation['key']] = existingTranslation
+            # end for
+
+            self.log("  ... units already translated in the catalog: %s" % (len(existingOutputTranslations)))
+        elif self.existingPath is not None:
+            self.log("Reading existing %s from path: %s" % (
+                stringsFileName, pathForTarget(self.existingPath, source, outputTargetCode)))
+
+            for existingTranslation in self.existingTranslationsFor(source, self.existingPath, outputTargetCode):
+                existingOutputTranslations[existingTranslation['key']] = existingTranslation
+            # end for
+
+            self.log("  ... will only translate new and changed keys. Existing translations found: %s keys" % (
+                len(existingOutputTranslations)))
+        # end if
+
+        neededLines = []
+        totalSkipped = 0
+        totalChanged = 0
+        for (index, translationTuple) in enumerate(originLines):
+            if translationNeeded(translationTuple, existingOutputTranslations, manifest, changedKeys):
+                neededLines.append((index, translationTuple))
+
+                if translationTuple['key'] in existingOutputTranslations:
+                    totalChanged += 1
+                    if self.verbose == "1":
+                        self.log("  ........... source changed for key: %s" % (translationTuple['key']))
+                    # end if
+                # end if
+            else:
+                totalSkipped += 1
+                if self.verbose == "1":
+                    self.log("  ........... skipping already translated key: %s" %
+                             (translationTuple['key']))
+                # end if
+            # end if
+        # end for
+
+        workKeys = {}
+        for (index, translationTuple) in neededLines:
+            workKeys[index] = plan.add(translateTargetCode, translationTuple,
+                                       self.contextForCache(translationTuple['comment'] or ""), outputTargetCode,
+                                       source['name'])
+        # end for
+
+        return {
+            'source': source,
+            'originLines': originLines,
+            'translateFriendlyName': translateFriendlyName,
+            'translateTargetCode': translateTargetCode,
+            'outputTargetCode': outputTargetCode,
+            'existingOutputTranslations': existingOutputTranslations,
+            'manifest': manifest,
+            'workKeys': workKeys,
+            'totalSkipped': totalSkipped,
+            'totalChanged': totalChanged,
+        }
+    # end def
+
+    def planSources(self, sources):
+        """
+        Plan the work for every file and language before sending anything, so strings needed by several keys are
+        translated once. Every file shares the same plan, so its requests are batched and scheduled together.
+
+        :return: (TranslationPlan, list of jobs, see planTranslateFile)
+        """
+        plan = TranslationPlan()
+        jobs = []
+        for source in sources:
+            for (translateFriendlyName, useLangCode, outputTargetCode) in self.targetLanguagesFor(source):
+                jobs.append(self.planTranslateFile(plan, source, translateFriendlyName, useLangCode,
+                                                   outputTargetCode))
+            # end for
+        # end for
+        self.printTranslationPlan(plan, jobs)
+
+        self.metrics.setCounter("planStrings", plan.totalStrings)
+        self.metrics.setCounter("planUniqueStrings", plan.totalUnique())
+        return (plan, jobs)
+    # end def
+
+    def printTranslationPlan(self, plan, jobs):
+        """
+        Print how many strings the plan translates once duplicates are merged, and for each language when emulating.
+        """
+        totalFiles = len(set(job['source']['name'] for job in jobs))
+        self.log("\nTranslation plan: %s strings to translate in %s languages%s, %s unique (%s duplicates merged)\n" % (
+            plan.totalStrings, len(set(job['outputTargetCode'] for job in jobs)),
+            " and %s files" % (totalFiles) if totalFiles > 1 else "", plan.totalUnique(),
+            plan.totalStrings - plan.totalUnique()))
+
+        if self.emulate:
+            for job in jobs:
+                self.log("  %s: %s strings, %s unique, %s carried over" % (
+                    self.friendlyNameFor(job['source'], job['translateFriendlyName']), len(job['workKeys']),
+                    len(plan.uniqueItems(job['translateTargetCode'])), job['totalSkipped']))
+            # end for
+            self.log("")
+        # end if
+    # end def
+
+    def submitTranslationPlan(self, plan, resumedResults=None, journal=None):
+        """
+        Queue requests for the unique work items of the plan, for every file and language at once.
+
+        :param plan: TranslationPlan of the run
+        :param resumedResults: optional results of an interrupted run by work key, these items are not translated
+                               again
+        :param journal: optional TranslationJournal the results are recorded in
+        """
+        # Group the strings into as few requests as the translator allows. Strings spanning several lines cannot be
+        # joined into a single Google request, so those are sent on their own.
+        provider = self.provider
+        batchLimits = provider.batchLimits(self.maxBatchItems)
+        for translateTargetCode in plan.targetCodes():
+            planItems = []
+            for planItem in plan.uniqueItems(translateTargetCode):
+                if resumedResults and planItem['workKey'] in resumedResults:
+                    plan.setResult(planItem, resumedResults[planItem['workKey']])
+                else:
+                    planItems.append(planItem)
+                # end if
+            # end for
+
+            sizeOf = lambda planItem: provider.requestSize(planItem['translationTuple']['value'],
+                                                           planItem['translationTuple']['comment'])
+            isolate = lambda planItem: provider.sendsAlone(planItem['translationTuple']['value'])
+            for batch in makeBatches(planItems, batchLimits['maxItems'], batchLimits['maxChars'], sizeOf=sizeOf,
+                                     isolate=isolate):
+                plan.setPending(batch, self.scheduler.submit(provider.name, self.translatePlanItems, batch,
+                                                             translateTargetCode, journal))
+            # end for
+        # end for
+    # end def
+
+    def batchRequestLinesForPlan(self, plan):
+        """
+        Batch API requests for the unique work items of the plan. Strings found in the translation memory are left
+        out, they are taken from it when the results are ingested.
+
+        :return: list of JSON request lines
+        """
+        requestLines = []
+        for translateTargetCode in plan.targetCodes():
+            planItems = plan.uniqueItems(translateTargetCode)
+            if self.translationCache is not None:
+                cachedTexts = self.translationCache.getMany(
+                    self.provider.name, self.sourceLang, translateTargetCode,
+                    [planItem['translationTuple']['value'] for planItem in planItems],
+                    [self.contextForCache(planItem['translationTuple']['comment'] or "") for planItem in planItems])
+                planItems = [planItem for (planItem, cachedText) in zip(planItems, cachedTexts) if cachedText is None]
+            # end if
+
+            for planItem in planItems:
+                translationTuple = planItem['translationTuple']
+                entry = {'text': translationTuple['value']}
+                if translationTuple['comment']:
+                    entry['context'] = translationTuple['comment']
+                # end if
+                requestLines.append(batchRequestLine(
+                    batchCustomId(planItem['sourceName'], planItem['outputTargetCode'], translationTuple),
+                    self.provider.batchRequestBody({"1": entry}, self.sourceLang, translateTargetCode)))
+            # end for
+        # end for
+
+        return requestLines
+    # end def
+
+    def exportBatchRequests(self, sources, fileName):
+        """
+        Write the requests for every string of the sources needing translation to a single Batch API job file, to be
+        run offline and ingested later with ingestBatchResults.
+
+        :return: number of requests written
+        """
+        (plan, jobs) = self.planSources(sources)
+        return writeBatchRequests(fileName, self.batchRequestLinesForPlan(plan))
+    # end def
+
+    def ingestBatchResults(self, fileName):
+        """
+        Translate with the results file of a Batch API job exported with exportBatchRequests, instead of sending
+        requests.
+
+        :return: number of results read
+        """
+        self.batchResults = readBatchResults(fileName, self.provider.batchResultContent)
+        return len(self.batchResults)
+    # end def
+
+    def warmCache(self, sources, rootPath):
+        """
+        Remember the existing translations of every key of the sources found under a root directory, as if they came
+        from the translator.
+        """
+        for source in sources:
+            for (translateFriendlyName, useLangCode, outputTargetCode) in self.targetLanguagesFor(source):
+                existingValues = {}
+                for existingTranslation in self.existingTranslationsFor(source, rootPath, outputTargetCode):
+                    existingValues[existingTranslation['key']] = existingTranslation['value']
+                # end for
+
+                warmEntries = []
+                for translationTuple in sourceLinesFor(source, outputTargetCode):
+                    if translationTuple['key'] in existingValues:
+                        warmEntries.append((translationTuple['value'],
+                                            self.contextForCache(translationTuple['comment']),
+                                            existingValues[translationTuple['key']]))
+                    # end if
+                # end for
+
+                self.translationCache.putMany(self.provider.name, self.sourceLang, useLangCode, warmEntries)
+                self.log("Warmed translation memory for %s from %s: %s translations" % (
+                    translateFriendlyName, source['name'], len(warmEntries)))
+            # end for
+        # end for
+    # end def
+
+    def finishTranslateFile(self, job, plan):
+        """
+        Wait for the queued translations of a language and write them out in the order of the source file, so the
+        output is the same as translating one key after another. When delta-translating, existing translations of
+        unchanged keys are carried over into the output.
+
+        :param job: job returned by planTranslateFile
+        :param plan: TranslationPlan the job was added to, once submitted
+        :return: result of the output file, with the translations written to it indexed by key
+        """
+        source = job['source']
+        translateFriendlyName = self.friendlyNameFor(source, job['translateFriendlyName'])
+        outputTargetCode = job['outputTargetCode']
+        existingOutputTranslations = job['existingOutputTranslations']
+        manifest = job['manifest']
+
+        results = {}
+        for (index, workKey) in job['workKeys'].items():
+            results[index] = plan.resultOf(workKey)
+        # end for
+
+        totalLinesTranslated = 0
+        totalLinesNeeded = 0
+        totalWarnings = 0
+        fingerprints = {}
+        writtenValues = {}
+        outdatedValues = {}
+        writtenTranslations = {}
+        outputPath = pathForTarget(self.outputPath, source, outputTargetCode)
+        if source['catalogWriter'] is not None:
+            # The catalog is written once every language was put into it
+            writer = source['catalogWriter'].languageWriter(outputTargetCode, job['originLines'])
+        elif source['template'] is not None:
+            writer = StringsdictWriter(source['stringsFileName'], outputTargetCode, source['template'],
+                                       fileName=outputPath, metrics=self.metrics)
+        else:
+            writer = StringsWriter(source['stringsFileName'], outputTargetCode, fileName=outputPath,
+                                   metrics=self.metrics)
+        # end if
+        for (index, translationTuple) in enumerate(job['originLines']):
+            stringName = translationTuple['key']
+            stringComment = translationTuple['comment'] or ""
+            existingTranslation = existingOutputTranslations.get(stringName)
+            needsReview = False
+
+            if index in results:
+                (translation, success, warning) = results[index]
+                totalLinesNeeded += 1
+                needsReview = success and warning
+
+                if success:
+                    totalLinesTranslated += 1
+                    fingerprints[stringName] = sourceFingerprint(translationTuple)
+                    if existingTranslation is not None and existingTranslation['value'] != translation:
+                        # Recognised on the next runs if the existing translations are not updated with the output
+                        outdatedValues[stringName] = existingTranslation['value']
+                    # end if
+                elif existingTranslation is not None:
+                    # Keep the outdated translation rather than losing it, it will be retried on the next run
+                    translation = existingTranslation['value']
+                    if manifest.fingerprintOf(stringName) is not None:
+                        fingerprints[stringName] = manifest.fingerprintOf(stringName)
+                    # end if
+                # end if
+                if warning:
+                    totalWarnings += 1
+                # end if
+
+                # Only save translated lines
+                if not success and existingTranslation is None:
+                    continue
+                # end if
+            else:
+                # Carry over the existing translation of an unchanged key, or the one it was last translated to if the
+                # existing translation is still the outdated one
+                translation = existingTranslation['value']
+                if manifest.isOutdated(stringName, translation):
+                    outdatedValues[stringName] = translation
+                    translation = manifest.upToDateValue(stringName, translation)
+                # end if
+                fingerprints[stringName] = manifest.fingerprintOf(stringName) or sourceFingerprint(translationTuple)
+            # end if
+
+            writer.writeTranslation(stringName, translation, stringComment, needsReview)
+            if stringName in fingerprints:
+                writtenValues[stringName] = translation
+            # end if
+            writtenTranslations[stringName] = {'key': stringName, 'value': translation,
+                                               'comment': translationTuple['comment']}
+        # end for
+
+        if not self.emulate:
+            writer.close()
+            manifest.save(fingerprints, writtenValues, outdatedValues)
+        # end if
+
+        metrics = self.metrics
+        metrics.addCounter("stringsNeeded", totalLinesNeeded)
+        metrics.addCounter("stringsTranslated", totalLinesTranslated)
+        metrics.addCounter("formatterWarnings", totalWarnings)
+
+        self.log("Finished translating for: " + translateFriendlyName)
+        if totalWarnings != 0:
+            self.log("ERROR: CHECK WARNINGS. Total reported %s" % (totalWarnings))
+        # end if
+
+        if totalLinesNeeded != totalLinesTranslated:
+            self.log("ERROR: NOT ALL LINES TRANSLATED. Total lines translated for %s: %s. Original source count: %s" % (
+                translateFriendlyName, totalLinesTranslated, totalLinesNeeded))
+        else:
+            if self.existingPath is not None or job['totalSkipped'] != 0:
+                self.log("SUCCESS: New lines translated for %s: %s (source changed: %s), carried over: %s" %
+                         (translateFriendlyName, totalLinesTranslated, job['totalChanged'], job['totalSkipped']))
+            else:
+                self.log("SUCCESS: Total lines translated for %s: %s" %
+                         (translateFriendlyName, totalLinesTranslated))
+            # endif
+        # end if
+
+        return {
+            'source': source['name'],
+            'originPath': source['originPath'],
+            'outputPath': source['catalogWriter'].fileName if source['catalogWriter'] is not None else outputPath,
+            'language': job['translateFriendlyName'],
+            'outputTargetCode': outputTargetCode,
+            'needed': totalLinesNeeded,
+            'translated': totalLinesTranslated,
+            'warnings': totalWarnings,
+            'changed': job['totalChanged'],
+            'carriedOver': job['totalSkipped'],
+            'translations': writtenTranslations,
+        }
+    # end def
+
+    def finishTranslationJobs(self, jobs, plan):
+        """
+        Write out the jobs of a submitted plan one after another, yielding the result of each output file once it is
+        written. A String Catalog holds every language, so it is written, and the results of its languages yielded,
+        once its last language is done.
+        """
+        remainingJobs = {}
+        for job in jobs:
+            remainingJobs[job['source']['name']] = remainingJobs.get(job['source']['name'], 0) + 1
+        # end for
+
+        catalogResults = {}
+        for job in jobs:
+            source = job['source']
+            result = self.finishTranslateFile(job, plan)
+            self.writtenTranslations[(source['name'], job['outputTargetCode'])] = result['translations']
+
+            self.log("\n")
+            if source['catalogWriter'] is None:
+                yield result
+                continue
+            # end if
+
+            catalogResults.setdefault(source['name'], []).append(result)
+            remainingJobs[source['name']] -= 1
+            if remainingJobs[source['name']] != 0:
+                continue
+            # end if
+
+            if not self.emulate:
+                source['catalogWriter'].close()
+                self.log("Wrote String Catalog: %s" % (source['catalogWriter'].fileName))
+            # end if
+            for catalogResult in catalogResults.pop(source['name']):
+                yield catalogResult
+            # end for
+        # end for
+    # end def
+
+    def runJournalPath(self, sources):
+        """
+        Path of the journal of a run translating the given sources, one per project or per single file.
+        """
+        if sources[0]['projectPath'] is not None:
+            return journalPath(self.cacheDir, sources[0]['projectPath'], "project")
+        # end if
+
+        return journalPath(self.cacheDir, sources[0]['originPath'], sources[0]['stringsFileName'])
+    # end def
+
+    def cancelPlan(self, plan):
+        """
+        Drop the queued requests of a plan, and wait for the ones in flight so their results are journaled.
+        """
+        concurrent.futures.wait(plan.cancelPending())
+    # end def
+
+    def translate(self, sources, resume=False):
+        """
+        Translate sources to every target language, yielding the result of each output file as soon as it is
+        written, see finishTranslateFile. Requests for every file and language are queued at once so they are all in
+        flight together, the outputs are written in the order of the sources and languages.
+
+        Every completed translation is journaled, so an interrupted run can be resumed with resume. If the run is
+        interrupted, or the results are not all consumed, its queued requests are dropped.
+
+        :param sources: sources read with readSource, readSources or readProject
+        :param resume: take the translations completed by an interrupted run from its journal
+        """
+        (plan, jobs) = self.planSources(sources)
+
+        journal = None
+        resumedResults = {}
+        if not self.emulate and sources:
+            journal = TranslationJournal(self.runJournalPath(sources), self.provider.name, self.sourceLang)
+            if resume:
+                resumedResults = journal.load()
+                self.log("Resuming interrupted run, translations already completed: %s\n" % (len(resumedResults)))
+            elif os.path.exists(journal.path):
+                self.log("Discarding the journal of an interrupted run, use --resume to continue it instead\n")
+            # end if
+            journal.start(resumedResults)
+        # end if
+
+        completed = False
+        try:
+            self.submitTranslationPlan(plan, resumedResults, journal)
+
+            self.log("")
+            for result in self.finishTranslationJobs(jobs, plan):
+                yield result
+            # end for
+            completed = True
+        except KeyboardInterrupt:
+            self.log("\nInterrupted, waiting for the requests in flight...")
+            raise
+        finally:
+            if not completed:
+                self.cancelPlan(plan)
+                if journal is not None:
+                    journal.close()
+                    self.log("Run again with --resume to continue, translations completed: %s" % (
+                        len(resumedResults) + journal.totalRecorded))
+                # end if
+            # end if
+        # end try
+
+        if journal is not None:
+            # Every language was written, nothing is left to resume
+            journal.remove()
+        # end if
+    # end def
+
+    def run(self, sources, resume=False):
+        """
+        Translate sources to every target language, see translate.
+
+        :return: list of the results of every output file
+        """
+        return list(self.translate(sources, resume))
+    # end def
+
+    def translateChangedSource(self, previousSource, source):
+        """
+        Translate the keys changed between two versions of a source in every language, carrying over the
+        translations written for the previous version, and rewrite its outputs, yielding their results.
+        """
+        plan = TranslationPlan()
+        jobs = []
+        totalChanged = 0
+        totalRemoved = 0
+        for (translateFriendlyName, useLangCode, outputTargetCode) in self.targetLanguagesFor(source):
+            (changedKeys, removedKeys) = changedKeysOf(sourceLinesFor(previousSource, outputTargetCode),
+                                                       sourceLinesFor(source, outputTargetCode))
+            totalChanged = max(totalChanged, len(changedKeys))
+            totalRemoved = max(totalRemoved, len(removedKeys))
+            jobs.append(self.planTranslateFile(plan, source, translateFriendlyName, useLangCode, outputTargetCode,
+                                               existingTranslations=self.writtenTranslations.get(
+                                                   (source['name'], outputTargetCode), {}),
+                                               changedKeys=changedKeys))
+        # end for
+
+        self.log("\n%s changed: %s keys added or changed, %s removed" % (source['name'], totalChanged, totalRemoved))
+        if totalChanged == 0 and totalRemoved == 0:
+            return
+        # end if
+
+        completed = False
+        try:
+            self.submitTranslationPlan(plan)
+            for result in self.finishTranslationJobs(jobs, plan):
+                yield result
+            # end for
+            completed = True
+        finally:
+            if not completed:
+                self.cancelPlan(plan)
+            # end if
+        # end try
+    # end def
+
+    def watch(self, sources, interval=1.0):
+        """
+        Watch the source files of a run and translate the keys changed in them as soon as they are saved, yielding
+        the results of the rewritten outputs, until interrupted. The parsed sources, the translations written, the
+        translator client and the translation memory stay in memory, only the changed keys are sent and only the
+        outputs of the changed files are rewritten.
+
+        A source that can't be read, e.g. a String Catalog saved halfway, or whose outputs can't be written is
+        retried on the next check.
+
+        :param sources: sources of a run of translate, replaced in place when they change
+        :param interval: number of seconds between checks of the source files
+        """
+        stamps = [fileStamp(source['originPath']) for source in sources]
+        # Last error of each source failing, only printed again when it changes
+        errors = {}
+        self.log("Watching %s source files for changes, press Ctrl-C to stop\n" % (len(sources)))
+
+        try:
+            while True:
+                time.sleep(interval)
+                for (index, source) in enumerate(sources):
+                    stamp = fileStamp(source['originPath'])
+                    if stamp is None or stamp == stamps[index]:
+                        continue
+                    # end if
+
+                    try:
+                        # A .strings file saved halfway only parses with lines skipped, its keys would be dropped
+                        changedSource = self.readSource(source['originPath'], source['projectPath'], strict=True)
+                        for result in self.translateChangedSource(source, changedSource):
+                            yield result
+                        # end for
+                    except WATCH_RETRIED_ERRORS as e:
+                        if errors.get(index) != str(e):
+                            self.log("Error translating %s, retrying until it succeeds: %s" %
+                                     (source['originPath'], e))
+                            errors[index] = str(e)
+                        # end if
+                        continue
+                    # end try
+                    errors.pop(index, None)
+                    sources[index] = changedSource
+                    stamps[index] = stamp
+                    self.log("Watching for changes...")
+                # end for
+            # end while
+        except KeyboardInterrupt:
+            self.log("\nStopped watching")
+        # end try
+    # end def
+
+    def close(self):
+        """
+        Wait for the requests in flight and stop the scheduler if the pipeline created it. The provider and the
+        translation memory are left open, they belong to the caller.
+        """
+        if self.ownsScheduler:
+            self.scheduler.shutdown()
+        # end if
+    # end def
+
+    def __enter__(self):
+        return self
+    # end def
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+    # end def
+# end class
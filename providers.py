@@ -0,0 +1,719 @@
+#!/usr/bin/python3
+import importlib
+import importlib.util
+import json
+import os.path
+import threading
+
+from batching import batchLimitsFor
+from format_specifiers import PLACEHOLDER_SENTINEL, PLACEHOLDER_XML, maskPlaceholders, unmaskPlaceholders
+from functions import read_open_ai_token
+from rate_limiter import classifyError
+
+# The SDK of a translator (deepl, googletrans, openai, requests) is only imported by createClient, when the provider
+# sends its first request: importing all of them takes longer than a whole delta run, and most runs use one
+# translator, or none at all with -e.
+
+class TranslationProvider(object):
+    """
+    Common interface of the translators. Each provider keeps a single client for the whole run, created on first use
+    and shared by every worker thread, so connections are pooled and kept alive instead of paying for client setup
+    and a new TLS handshake on every string.
+
+    Translators added as plugins (see registerProvider) subclass it, setting name and friendlyName and implementing
+    createClient and translate.
+    """
+
+    # Name used with -t and to look up concurrency / batch limits
+    name = None
+    # Name used when printing
+    friendlyName = None
+    # Whether the comment of a string is sent to the translator as context
+    usesContext = False
+    # Tokens format specifiers and escape sequences are masked with before texts are sent, see maskPlaceholders.
+    # None sends texts as they are.
+    placeholderStyle = None
+    # Number of requests kept in flight at once unless set with -j, for translators without a default in scheduler.py
+    defaultConcurrency = 1
+
+    def __init__(self, authKey="", verbose="0", concurrency=1, options=None):
+        self.authKey = authKey
+        self.verbose = verbose
+        self.concurrency = concurrency
+        self.options = dict(options or {})
+        # AdaptiveRateLimiter shared by every request to this translator, if rate limiting is enabled
+        self.rateLimiter = None
+        self._client = None
+        self._clientLock = threading.Lock()
+    #end def
+
+    def client(self):
+        """
+        Return the client of this provider, creating it the first time it is needed.
+        """
+        with self._clientLock:
+            if self._client is None:
+                self._client = self.createClient()
+            #end if
+            return self._client
+        #end with
+    #end def
+
+    def createClient(self):
+        raise NotImplementedError()
+    #end def
+
+    def languageCode(self, friendlyName, googleCode, deeplCode):
+        """
+        Pick the code this provider uses for a language listed in LanguageCodes.txt.
+
+        :return: language code, or None if the language is not supported by this provider
+        """
+        return googleCode
+    #end def
+
+    def sendsAlone(self, sourceText):
+        """
+        Whether a source text must be sent in a request of its own instead of being batched with others.
+        """
+        return False
+    #end def
+
+    def batchLimits(self, maxItems=0):
+        """
+        Request limits used to group strings into batches.
+
+        :param maxItems: optional override of the maximum number of strings per request
+        :return: dict with maxItems and maxChars (0 meaning no character limit)
+        """
+        return batchLimitsFor(self.name, maxItems)
+    #end def
+
+    def requestSize(self, sourceText, context):
+        """
+        Number of characters a source text adds to a request, counted against the maxChars limit.
+        """
+        if self.usesContext:
+            return len(sourceText) + len(context or "")
+        #end if
+
+        return len(sourceText)
+    #end def
+
+    def classifyError(self, error):
+        """
+        Tell apart errors worth retrying from the others, see rate_limiter.classifyError.
+        """
+        return classifyError(error)
+    #end def
+
+    def maskingStyle(self):
+        """
+        :return: placeholder style used for this run, None if masking is disabled
+        """
+        if not self.options.get('maskPlaceholders', True):
+            return None
+        #end if
+
+        return self.placeholderStyle
+    #end def
+
+    def translateMasked(self, sourceTexts, sourceLang, targetCode, contexts):
+        """
+        Translate a batch of source texts with their format specifiers and escape sequences masked, so the
+        translator can't mangle them, then put them back. Texts whose placeholders don't all come back exactly once
+        are translated again unmasked in a second request, their formatters are then checked as usual.
+
+        :return: list of translated texts, in the order of sourceTexts
+        """
+        style = self.maskingStyle()
+        if style is None:
+            return self.translate(sourceTexts, sourceLang, targetCode, contexts)
+        #end if
+
+        masked = [maskPlaceholders(sourceText, style) for sourceText in sourceTexts]
+        translatedTexts = self.translate([maskedText for (maskedText, placeholders) in masked], sourceLang,
+                                         targetCode, contexts)
+
+        results = []
+        lostIndexes = []
+        for (index, ((maskedText, placeholders), translatedText)) in enumerate(zip(masked, translatedTexts)):
+            if placeholders is None:
+                # The text was sent as it is
+                results.append(translatedText)
+                continue
+            #end if
+
+            restored = unmaskPlaceholders(translatedText, placeholders, style)
+            if restored is None:
+                lostIndexes.append(index)
+            #end if
+            results.append(restored)
+        #end for
+
+        if lostIndexes:
+            if self.verbose == "1":
+                print("  ..... %s lost placeholders of %s strings, translating them unmasked" % (
+                    self.friendlyName, len(lostIndexes)))
+            #end if
+
+            escaped = [maskPlaceholders(sourceTexts[index], style, keepPlaceholders=True)[0] for index in lostIndexes]
+            retriedTexts = self.translate(escaped, sourceLang, targetCode, [contexts[index] for index in lostIndexes])
+            for (index, translatedText) in zip(lostIndexes, retriedTexts):
+                if style == PLACEHOLDER_XML:
+                    # Only the XML escapes have to be undone
+                    translatedText = unmaskPlaceholders(translatedText, [], style) or translatedText
+                #end if
+                results[index] = translatedText
+            #end for
+        #end if
+
+        return results
+    #end def
+
+    def translate(self, sourceTexts, sourceLang, targetCode, contexts):
+        """
+        Translate a batch of source texts with one request where the translator allows it.
+
+        :param sourceTexts: list of source texts
+        :param sourceLang: origin locale
+        :param targetCode: target language code returned by languageCode
+        :param contexts: list of comments giving context to each source text
+        :return: list of translated texts, in the order of sourceTexts
+        """
+        raise NotImplementedError()
+    #end def
+
+    def close(self):
+        self._client = None
+    #end def
+#end class
+
+class GoogleProvider(TranslationProvider):
+    name = "google"
+    friendlyName = "Google"
+    placeholderStyle = PLACEHOLDER_SENTINEL
+
+    def createClient(self):
+        from googletrans import Translator
+
+        # A single googletrans translator keeps its HTTP/2 connection to Google alive between requests. Errors
+        # must be raised, otherwise a throttled request fails later on parsing the response without its status code.
+        return Translator(raise_exception=True)
+    #end def
+
+    def sendsAlone(self, sourceText):
+        # googletrans only takes a single text, so batches are sent as one text per line
+        return "\n" in sourceText
+    #end def
+
+    def translate(self, sourceTexts, sourceLang, targetCode, contexts):
+        obj = self.client().translate("\n".join(sourceTexts), src=sourceLang, dest=targetCode)
+
+        return obj.text.split("\n")
+    #end def
+#end class
+
+class DeepLProvider(TranslationProvider):
+    name = "deepl"
+    friendlyName = "DeepL"
+    # DeepL leaves XML tags alone with tag_handling
+    placeholderStyle = PLACEHOLDER_XML
+
+    def createClient(self):
+        import deepl
+
+        # The DeepL translator keeps a requests session, reused for every request of the run
+        return deepl.Translator(self.authKey)
+    #end def
+
+    def languageCode(self, friendlyName, googleCode, deeplCode):
+        if deeplCode.strip() == "-":
+            return None
+        #end if
+
+        return deeplCode
+    #end def
+
+    def translate(self, sourceTexts, sourceLang, targetCode, contexts):
+        if self.maskingStyle() == PLACEHOLDER_XML:
+            results = self.client().translate_text(sourceTexts, source_lang=sourceLang, target_lang=targetCode,
+                                                   tag_handling="xml")
+        else:
+            results = self.client().translate_text(sourceTexts, source_lang=sourceLang, target_lang=targetCode)
+        #end if
+
+        return [result.text for result in results]
+    #end def
+#end class
+
+def parseBatchAnswer(content):
+    """
+    Parse the JSON object answered to a batched prompt, tolerating a markdown code fence around it.
+
+    :return: dict of id to translation, empty if the answer is not a JSON object
+    """
+    if not content:
+        return {}
+    #end if
+
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        if content.startswith("json"):
+            content = content[4:]
+        #end if
+    #end if
+
+    try:
+        answer = json.loads(content)
+    except ValueError:
+        return {}
+    #end try
+
+    return answer if isinstance(answer, dict) else {}
+#end def
+
+# Model used for batched prompting unless set with --openai-model
+DEFAULT_OPENAI_MODEL = "gpt-4o-mini"
+# Approximate number of prompt tokens per batched request unless set with --openai-tokens
+DEFAULT_OPENAI_TOKEN_BUDGET = 3000
+# Number of times keys missing from a batched answer are asked for again
+OPENAI_BATCH_RETRIES = 2
+
+class OpenAIProvider(TranslationProvider):
+    """
+    Translates one string per completion request, or with batched prompting (--openai-batch) many strings per chat
+    request: the strings are sent as a JSON object keyed by id, each with its own comment as context, and the answer
+    must be a JSON object with the translation of every id. Ids missing from the answer, or not translated to a
+    string, are asked for again on their own.
+    """
+
+    name = "openai"
+    friendlyName = "OpenAI"
+    usesContext = True
+
+    def createClient(self):
+        import openai
+        import requests
+
+        # Read the token once, it is sent with each request rather than set on the module shared by every provider
+        self.apiKey = read_open_ai_token()
+
+        # The SDK only takes a pool of keep-alive connections for the whole process: share one between all worker
+        # threads, unless the program already set its own
+        self._session = None
+        if openai.requestssession is None:
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, self.concurrency),
+                                                    max_retries=2)
+            self._session.mount("https://", adapter)
+            openai.requestssession = self._session
+        #end if
+
+        return openai
+    #end def
+
+    def batched(self):
+        return bool(self.options.get('openaiBatch'))
+    #end def
+
+    def model(self):
+        return self.options.get('openaiModel') or DEFAULT_OPENAI_MODEL
+    #end def
+
+    def languageCode(self, friendlyName, googleCode, deeplCode):
+        return friendlyName
+    #end def
+
+    def batchLimits(self, maxItems=0):
+        if not self.batched():
+            return TranslationProvider.batchLimits(self, maxItems)
+        #end if
+
+        # Roughly 4 characters per token, leaving room for the instructions and the JSON around each string
+        tokenBudget = int(self.options.get('openaiTokenBudget') or DEFAULT_OPENAI_TOKEN_BUDGET)
+        return {'maxItems': maxItems if maxItems > 0 else 100, 'maxChars': max(1, tokenBudget - 300) * 4}
+    #end def
+
+    def requestSize(self, sourceText, context):
+        # Each string is wrapped in a JSON entry with its id and context
+        return len(sourceText) + len(context or "") + 40
+    #end def
+
+    def translate(self, sourceTexts, sourceLang, targetCode, contexts):
+        if self.batched():
+            return self.translateBatch(sourceTexts, sourceLang, targetCode, contexts)
+        #end if
+
+        return [self.translateText(sourceText, "English", targetCode, context)
+                for (sourceText, context) in zip(sourceTexts, contexts)]
+    #end def
+
+    def batchMessages(self, entries, sourceLang, targetCode):
+        """
+        Chat messages asking for the translation of a JSON object of entries keyed by id.
+
+        :param entries: dict of id to {'text', 'context'}
+        """
+        instructions = (
+            "You are a professional translator localizing the user interface of an app. "
+            f"Translate the \"text\" of every entry of the JSON object sent by the user from {sourceLang} to {targetCode}. "
+            "Use the \"context\" of an entry, when given, to pick the right meaning, but never translate the context itself. "
+            "Keep format specifiers such as %@, %d, %1$@ and %lld, escape sequences such as \\n and \\\" and "
+            "surrounding whitespace exactly as they are. Don't add a period at the end and don't capitalize a "
+            "translation if the original text does not start with a capital letter. "
+            "Answer with a JSON object mapping every key of the input to its translation as a string, and nothing else.")
+
+        return [
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": json.dumps(entries, ensure_ascii=False)},
+        ]
+    #end def
+
+    def batchRequestBody(self, entries, sourceLang, targetCode):
+        """
+        Body of a chat request for the translation of a JSON object of entries keyed by id, used for batched
+        prompting and for the requests of offline Batch API jobs.
+        """
+        return {
+            'model': self.model(),
+            'messages': self.batchMessages(entries, sourceLang, targetCode),
+            'temperature': 0,
+            'response_format': {"type": "json_object"},
+        }
+    #end def
+
+    def batchResultContent(self, responseBody, entryId="1"):
+        """
+        Translation of an entry in the body of a chat completion returned for a request built by batchRequestBody.
+
+        :return: translated text, or None if the answer has no translation for the entry
+        """
+        try:
+            content = responseBody['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            return None
+        #end try
+
+        translation = parseBatchAnswer(content).get(entryId)
+        return translation if isinstance(translation, str) else None
+    #end def
+
+    def translateBatch(self, sourceTexts, sourceLang, targetCode, contexts):
+        """
+        Translate a batch of strings with as few chat requests as possible, asking again only for the ids missing
+        from an answer or not translated to a string.
+
+        :return: list of translated texts, None for strings still missing after the retries
+        """
+        client = self.client()
+        translations = {}
+        pendingIds = [str(index + 1) for index in range(len(sourceTexts))]
+
+        for attempt in range(1 + OPENAI_BATCH_RETRIES):
+            if not pendingIds:
+                break
+            #end if
+
+            entries = {}
+            for entryId in pendingIds:
+                index = int(entryId) - 1
+                entries[entryId] = {'text': sourceTexts[index]}
+                if contexts[index]:
+                    entries[entryId]['context'] = contexts[index]
+                #end if
+            #end for
+
+            request = self.batchRequestBody(entries, sourceLang, targetCode)
+            if self.verbose == "2":
+                print("---------------------------------------------")
+                print("  ..... OpenAI Prompt: %s" % (request['messages']))
+                print("---------------------------------------------")
+            # end if
+
+            response = client.ChatCompletion.create(api_key=self.apiKey, **request)
+            if self.verbose == "2":
+                print("---------------------------------------------")
+                print("  ..... OpenAI response: %s" % (response))
+                print("---------------------------------------------")
+            # end if
+
+            answer = parseBatchAnswer(response.choices[0].message.content if response.choices else None)
+            for entryId in pendingIds:
+                translation = answer.get(entryId)
+                if isinstance(translation, str) and (translation.strip() or not sourceTexts[int(entryId) - 1].strip()):
+                    translations[entryId] = translation
+                #end if
+            #end for
+
+            pendingIds = [entryId for entryId in pendingIds if entryId not in translations]
+            if pendingIds and attempt < OPENAI_BATCH_RETRIES:
+                print("  ..... OpenAI answer missing %s of %s translations for %s, asking again" % (
+                    len(pendingIds), len(entries), targetCode))
+            #end if
+        #end for
+
+        return [translations.get(str(index + 1)) for index in range(len(sourceTexts))]
+    #end def
+
+    def translateText(self, text, source_lang, target_lang, context=None):
+        client = self.client()
+        prompt = f" Translate the following text from {source_lang} to {target_lang}: {text}."
+        adPrompt = f" Your goal is to translate text, but not to change it's meaning. You can use the following context to help you: {context}. All your answers strictly target language. don't add a period at the end and don't capitalize it if it's the original text not with a capital letter"
+        if context:
+            prompt = f"{adPrompt}\n\n{prompt}"
+
+        if self.verbose == "2":
+            print("---------------------------------------------")
+            print("  ..... OpenAI Prompt: %s" % (prompt))
+            print("---------------------------------------------")
+        # end if
+
+        response = client.Completion.create(
+            api_key=self.apiKey,
+            engine="text-davinci-003",
+            prompt=prompt,
+            temperature=0,
+            max_tokens=1000,
+            stream=False,
+        )
+        if self.verbose == "2":
+            print("---------------------------------------------")
+            print("  ..... OpenAI response: %s" % (response))
+            print("---------------------------------------------")
+        # end if
+
+        if response.choices:
+            return response.choices[0].text.strip()
+        else:
+            return None
+        # end if
+    #end def
+
+    def classifyError(self, error):
+        # Running out of quota is reported as a 429 too, but retrying will not help
+        if getattr(error, "code", None) == "insufficient_quota":
+            return (None, None)
+        #end if
+
+        return classifyError(error)
+    #end def
+
+    def close(self):
+        if self._client is not None and self._session is not None:
+            if self._client.requestssession is self._session:
+                self._client.requestssession = None
+            #end if
+            self._session.close()
+            self._session = None
+        #end if
+        TranslationProvider.close(self)
+    #end def
+#end class
+
+# Server used with -t http unless set with --http-url, the default address of a local LibreTranslate server
+DEFAULT_HTTP_URL = "http://localhost:5000/translate"
+
+class HttpProvider(TranslationProvider):
+    """
+    Translates with a LibreTranslate compatible server, e.g. a self hosted one, which takes a list of texts per
+    request. The auth key given with -a is sent as api_key.
+    """
+
+    name = "http"
+    friendlyName = "HTTP"
+    placeholderStyle = PLACEHOLDER_SENTINEL
+
+    def createClient(self):
+        import requests
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, self.concurrency))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        return session
+    #end def
+
+    def url(self):
+        return self.options.get('httpUrl') or DEFAULT_HTTP_URL
+    #end def
+
+    def translate(self, sourceTexts, sourceLang, targetCode, contexts):
+        payload = {'q': sourceTexts, 'source': sourceLang, 'target': targetCode, 'format': "text"}
+        if self.authKey:
+            payload['api_key'] = self.authKey
+        #end if
+
+        response = self.client().post(self.url(), json=payload, timeout=60)
+        response.raise_for_status()
+
+        translatedTexts = response.json().get('translatedText')
+        return translatedTexts if isinstance(translatedTexts, list) else None
+    #end def
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        #end if
+        TranslationProvider.close(self)
+    #end def
+#end class
+
+# Translators selectable with -t, by name: provider classes, or the "module:Class" / "path/to/file.py:Class" import
+# path of a plugin, imported the first time it is selected
+PROVIDERS = {
+    GoogleProvider.name: GoogleProvider,
+    DeepLProvider.name: DeepLProvider,
+    OpenAIProvider.name: OpenAIProvider,
+    HttpProvider.name: HttpProvider,
+}
+
+# Entry point group installed packages register translators in, e.g. in their pyproject.toml:
+# [project.entry-points."auto_localize.providers"]
+# mymt = "mymt_plugin:MyMTProvider"
+PLUGIN_ENTRY_POINT_GROUP = "auto_localize.providers"
+
+class ProviderPluginError(Exception):
+    pass
+#end class
+
+def loadPlugin(importPath):
+    """
+    Import the provider class of a plugin.
+
+    :param importPath: "module:Class", or "path/to/file.py:Class" for a plugin not installed as a module
+    :return: provider class
+    """
+    (moduleName, separator, className) = str(importPath).strip().rpartition(":")
+    if not separator or not moduleName or not className:
+        raise ProviderPluginError("Invalid translator plugin %s, expected module:Class or path/to/file.py:Class" %
+                                  (importPath))
+    #end if
+
+    try:
+        if moduleName.endswith(".py"):
+            spec = importlib.util.spec_from_file_location(
+                "auto_localize_plugin_" + os.path.splitext(os.path.basename(moduleName))[0], moduleName)
+            if spec is None or not os.path.exists(moduleName):
+                raise ProviderPluginError("Translator plugin file not found: %s" % (moduleName))
+            #end if
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(moduleName)
+        #end if
+    except ImportError as error:
+        raise ProviderPluginError("Can't import translator plugin %s: %s" % (importPath, error))
+    #end try
+
+    providerClass = getattr(module, className, None)
+    if not isinstance(providerClass, type) or not issubclass(providerClass, TranslationProvider):
+        raise ProviderPluginError("Translator plugin %s is not a subclass of providers.TranslationProvider" %
+                                  (importPath))
+    #end if
+
+    return providerClass
+#end def
+
+def registerProvider(provider, name=None):
+    """
+    Make a translator selectable with -t.
+
+    :param provider: provider class, or import path of a plugin (see loadPlugin), only imported when selected
+    :param name: name used with -t, defaults to the name of the provider class. Required for an import path.
+    :return: name the translator was registered with
+    """
+    if name is None:
+        if isinstance(provider, str):
+            # The plugin has to be imported to know its name
+            provider = loadPlugin(provider)
+        #end if
+        name = provider.name
+    #end if
+
+    if not name:
+        raise ProviderPluginError("Translator plugin %s has no name" % (provider))
+    #end if
+
+    name = str(name).strip().lower()
+    PROVIDERS[name] = provider
+    return name
+#end def
+
+def _entryPointProvider(name):
+    """
+    :return: import path of the translator an installed package registered with the given name, None if none did
+    """
+    # Scanning installed packages is slow, only done for names not registered
+    import importlib.metadata
+
+    try:
+        entryPoints = importlib.metadata.entry_points(group=PLUGIN_ENTRY_POINT_GROUP)
+    except TypeError:
+        # Python before 3.10
+        entryPoints = importlib.metadata.entry_points().get(PLUGIN_ENTRY_POINT_GROUP, [])
+    #end try
+
+    for entryPoint in entryPoints:
+        if entryPoint.name.strip().lower() == name:
+            return entryPoint.value
+        #end if
+    #end for
+
+    return None
+#end def
+
+def providerClass(name):
+    """
+    Look up the class of a translator, importing it if it is a plugin not used yet. Installed packages are only
+    searched for translators when the name is not registered.
+
+    :return: provider class, None if there is no translator with this name
+    """
+    name = str(name).strip().lower()
+    provider = PROVIDERS.get(name)
+    if provider is None:
+        provider = _entryPointProvider(name)
+        if provider is None:
+            return None
+        #end if
+    #end if
+
+    if isinstance(provider, str):
+        provider = loadPlugin(provider)
+        PROVIDERS[name] = provider
+    #end if
+
+    return provider
+#end def
+
+def providerNames():
+    """
+    :return: names of the registered translators
+    """
+    return sorted(PROVIDERS)
+#end def
+
+def createProvider(name, authKey="", verbose="0", concurrency=1, options=None):
+    """
+    Create the provider selected with -t. Google is used for any name not recognised.
+
+    :param name: translator name (google, deepl, openai, http or the name of a plugin)
+    :param authKey: auth key for translators requiring one
+    :param verbose: verbose level
+    :param concurrency: number of requests kept in flight with this provider
+    :param options: dict of provider specific options (openaiBatch, openaiModel, openaiTokenBudget, httpUrl)
+    :return: TranslationProvider
+    """
+    selectedClass = providerClass(name)
+    if selectedClass is None:
+        if len(str(name).strip()) != 0:
+            print("Unknown translator %s, using Google. Available translators: %s" % (name, ", ".join(providerNames())))
+        #end if
+        selectedClass = GoogleProvider
+    #end if
+
+    return selectedClass(authKey=authKey, verbose=verbose, concurrency=concurrency, options=options)
+#end def
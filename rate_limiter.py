@@ -0,0 +1,323 @@
+#!/usr/bin/python3
+import email.utils
+import random
+import re
+import threading
+import time
+
+# Requests per second each translator starts at. While no request is throttled the rate grows up to
+# MAX_RATE_FACTOR times this, and it is halved every time the translator answers with a 429.
+DEFAULT_PROVIDER_RATES = {
+    'google': 10.0,
+    'deepl': 20.0,
+    'openai': 5.0,
+    'http': 50.0,
+}
+MAX_RATE_FACTOR = 4
+
+# Kinds of errors returned by classifyError
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+
+# HTTP status codes of requests rejected for the texts they sent or for their size, rather than for the account
+REQUEST_ERROR_STATUSES = (400, 413, 414, 422)
+
+class RetriesExhaustedError(Exception):
+    """
+    Raised when a request still fails after all its retries. The last error is kept in lastError.
+    """
+
+    def __init__(self, attempts, lastError):
+        Exception.__init__(self, "gave up after %s attempts: %s" % (attempts, lastError))
+        self.attempts = attempts
+        self.lastError = lastError
+    #end def
+#end class
+
+def parseRateLimits(spec, defaults=DEFAULT_PROVIDER_RATES):
+    """
+    Parse the request rates given on the command line, in the same format as the concurrency limits: empty for the
+    defaults, a single number of requests per second for every translator, or per translator rates such as
+    "deepl=10,google=2.5". A rate of 0 disables rate limiting.
+
+    :param spec: rate spec string
+    :param defaults: default rates per translator
+    :return: dict of translator name to requests per second
+    """
+    rates = dict(defaults)
+    spec = str(spec or "").strip()
+    if len(spec) == 0:
+        return rates
+    #end if
+
+    if "=" not in spec:
+        for name in rates:
+            rates[name] = _parseRate(spec)
+        #end for
+        return rates
+    #end if
+
+    for item in spec.split(","):
+        if len(item.strip()) == 0:
+            continue
+        #end if
+
+        name, _, value = item.partition("=")
+        rates[name.strip().lower()] = _parseRate(value)
+    #end for
+
+    return rates
+#end def
+
+def _parseRate(value):
+    try:
+        rate = float(value.strip())
+    except ValueError:
+        raise ValueError("Invalid rate '%s', expected a number of requests per second" % (value.strip()))
+    #end try
+
+    if rate < 0:
+        raise ValueError("Invalid rate '%s', expected a number of requests per second" % (value.strip()))
+    #end if
+    return rate
+#end def
+
+def parseRetryAfter(value, now=None):
+    """
+    Parse a Retry-After header, given either in seconds or as an HTTP date.
+
+    :return: number of seconds to wait, or None if the header is missing or invalid
+    """
+    if value is None:
+        return None
+    #end if
+
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    #end try
+
+    try:
+        retryAt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    #end try
+    if retryAt is None:
+        return None
+    #end if
+
+    return max(0.0, retryAt.timestamp() - (time.time() if now is None else now))
+#end def
+
+def _statusOf(error):
+    for name in ("http_status", "http_status_code", "status_code"):
+        status = getattr(error, name, None)
+        if isinstance(status, int):
+            return status
+        #end if
+    #end for
+
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status
+    #end if
+
+    # googletrans only reports the status code in the message
+    match = re.search(r'Unexpected status code "(\d+)"', str(error))
+    return int(match.group(1)) if match else None
+#end def
+
+def _headersOf(error):
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    #end if
+
+    return headers or {}
+#end def
+
+def classifyError(error):
+    """
+    Tell apart errors worth retrying from the others, from the HTTP status code and headers carried by the
+    exceptions of the translator libraries.
+
+    :return: (THROTTLED, retryAfter) for rate limiting, (TRANSIENT, None) for server and network errors that may
+             succeed when retried, (None, None) otherwise. retryAfter is None when the server did not say.
+    """
+    status = _statusOf(error)
+    if status == 429:
+        headers = _headersOf(error)
+        try:
+            retryAfter = parseRetryAfter(headers.get("Retry-After") or headers.get("retry-after"))
+        except AttributeError:
+            retryAfter = None
+        #end try
+        return (THROTTLED, retryAfter)
+    #end if
+
+    if status is not None:
+        return (TRANSIENT, None) if status == 408 or status >= 500 else (None, None)
+    #end if
+
+    if isinstance(error, (ConnectionError, TimeoutError)) or getattr(error, "should_retry", False):
+        return (TRANSIENT, None)
+    #end if
+
+    # Network errors of requests and httpx, without importing either
+    errorNames = [errorClass.__name__ for errorClass in type(error).__mro__]
+    for transientName in ("ConnectionError", "ConnectError", "Timeout", "TimeoutException", "NetworkError",
+                          "APIConnectionError", "ServiceUnavailableError", "TryAgain"):
+        if transientName in errorNames:
+            return (TRANSIENT, None)
+        #end if
+    #end for
+
+    return (None, None)
+#end def
+
+def isRequestError(error):
+    """
+    Tell whether a request was rejected for what it sent, such as a text the translator can't take or a request
+    too large, so that sending its texts apart may succeed. Errors without a status code, raised on reading the
+    response, count as such too. Errors of the account such as a wrong key or an exhausted quota do not.
+    """
+    status = _statusOf(error)
+    return status is None or status in REQUEST_ERROR_STATUSES
+#end def
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket spacing out the requests sent to a translator by all worker threads. The rate follows the
+    translator: it is halved when a request is throttled, every request then waits out the Retry-After given, and
+    it grows back slowly while requests succeed, so a run settles just under the highest rate the translator
+    sustains.
+    """
+
+    def __init__(self, rate, maxRate=None, minRate=0.1, burst=1.0):
+        self.initialRate = float(rate)
+        self.rate = float(rate)
+        self.maxRate = float(maxRate) if maxRate else self.rate * MAX_RATE_FACTOR
+        self.minRate = min(float(minRate), self.rate)
+        self.burst = max(1.0, float(burst))
+        self.throttled = 0
+        self._tokens = self.burst
+        self._updatedAt = time.monotonic()
+        self._pausedUntil = 0.0
+        self._slowedAt = 0.0
+        self._throttledRate = self.maxRate / 0.9
+        self._lock = threading.Lock()
+    #end def
+
+    def acquire(self):
+        """
+        Wait until a request may be sent.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._pausedUntil:
+                    wait = self._pausedUntil - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updatedAt) * self.rate)
+                    self._updatedAt = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    #end if
+                    wait = (1 - self._tokens) / self.rate
+                #end if
+            #end with
+
+            time.sleep(wait)
+        #end while
+    #end def
+
+    def onSuccess(self):
+        with self._lock:
+            # Grow quickly back to just under the rate last throttled at, then only probe slowly above it
+            if self.rate < self._throttledRate * 0.9:
+                self.rate = min(self._throttledRate * 0.9, self.rate + self.initialRate / 20.0)
+            else:
+                self.rate = min(self.maxRate, self.rate + self.initialRate / 500.0)
+            #end if
+        #end with
+    #end def
+
+    def onThrottle(self, retryAfter=None):
+        """
+        Slow down after a request was throttled, pausing every request for retryAfter seconds when given.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+
+            # Requests already in flight when the limit was hit are throttled too, only slow down once for them
+            if now - self._slowedAt >= 1.0:
+                self._throttledRate = self.rate
+                self.rate = max(self.minRate, self.rate / 2)
+                self._slowedAt = now
+            #end if
+
+            if retryAfter:
+                self._pausedUntil = max(self._pausedUntil, now + retryAfter)
+            #end if
+            self._tokens = 0
+            self._updatedAt = max(now, self._pausedUntil)
+        #end with
+    #end def
+#end class
+
+def callWithRetries(fn, rateLimiter=None, classify=classifyError, maxRetries=5, baseDelay=0.5, maxDelay=30.0,
+                    label="request"):
+    """
+    Call fn, retrying throttled and transient failures with exponential backoff.
+
+    :param fn: performs one request
+    :param rateLimiter: optional AdaptiveRateLimiter every attempt waits on and reports to
+    :param classify: returns the kind of an error and the seconds to wait before retrying, see classifyError
+    :param maxRetries: maximum number of retries after the first attempt
+    :param baseDelay: seconds waited before the first retry, doubled for each following one up to maxDelay
+    :param label: description of the request for printing
+    :return: result of fn
+    """
+    attempt = 0
+    while True:
+        if rateLimiter is not None:
+            rateLimiter.acquire()
+        #end if
+
+        try:
+            result = fn()
+        except Exception as e:
+            (kind, retryAfter) = classify(e)
+            if kind is None:
+                raise
+            #end if
+            if attempt >= maxRetries:
+                raise RetriesExhaustedError(attempt + 1, e)
+            #end if
+
+            # Half of the backoff is random so threads retrying together do not hit the translator at the same time
+            backoff = min(maxDelay, baseDelay * (2 ** attempt))
+            delay = retryAfter if retryAfter is not None else backoff / 2 + random.uniform(0, backoff / 2)
+            attempt += 1
+            print("  ..... %s %s (%s), retrying in %.1fs (retry %s of %s)" % (
+                label, kind, e, delay, attempt, maxRetries))
+
+            if kind == THROTTLED and rateLimiter is not None:
+                # Every thread waits, not only this one
+                rateLimiter.onThrottle(delay)
+            else:
+                time.sleep(delay)
+            #end if
+            continue
+        #end try
+
+        if rateLimiter is not None:
+            rateLimiter.onSuccess()
+        #end if
+        return result
+    #end while
+#end def
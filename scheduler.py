@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+import cProfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Default number of requests kept in flight at once for each translator. These stay well below the limits
+# documented by each provider so a full run does not immediately trip their rate limiting.
+DEFAULT_PROVIDER_CONCURRENCY = {
+    'google': 4,
+    'deepl': 8,
+    'openai': 4,
+    'http': 8,
+}
+
+def parseConcurrencyLimits(spec, defaults=DEFAULT_PROVIDER_CONCURRENCY):
+    """
+    Parse the concurrency limits given on the command line.
+
+    The spec is either empty (use the defaults), a single number applied to every translator (e.g. "1" to translate
+    sequentially) or a comma separated list of per translator limits (e.g. "deepl=8,google=2").
+
+    :param spec: concurrency spec string
+    :param defaults: default limits per translator
+    :return: dict of translator name to maximum requests in flight
+    """
+    limits = dict(defaults)
+    spec = str(spec or "").strip()
+    if len(spec) == 0:
+        return limits
+    #end if
+
+    if spec.isdigit():
+        for name in limits:
+            limits[name] = max(1, int(spec))
+        #end for
+        return limits
+    #end if
+
+    for item in spec.split(","):
+        if len(item.strip()) == 0:
+            continue
+        #end if
+
+        name, _, value = item.partition("=")
+        if not value.strip().isdigit():
+            raise ValueError("Invalid concurrency limit '%s', expected name=number" % (item.strip()))
+        #end if
+        limits[name.strip().lower()] = max(1, int(value.strip()))
+    #end for
+
+    return limits
+#end def
+
+class TranslationScheduler:
+    """
+    Runs translation requests on a shared pool of worker threads, keeping at most the configured number of requests
+    in flight for each translator. Work for every language can be queued up front so the network is kept busy
+    across languages and keys, while results are still collected in order through the returned futures.
+    """
+
+    def __init__(self, limits, profile=False):
+        self.limits = dict(limits)
+        # cProfile only follows the thread it is enabled in, so with profile set each call gets its own profiler
+        self.profile = profile
+        self.profiles = []
+        self._semaphores = {}
+        for name, limit in self.limits.items():
+            self._semaphores[name] = threading.BoundedSemaphore(limit)
+        #end for
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, sum(self.limits.values())),
+                                            thread_name_prefix="translate")
+    #end def
+
+    def _semaphoreFor(self, providerName):
+        with self._lock:
+            if providerName not in self._semaphores:
+                self._semaphores[providerName] = threading.BoundedSemaphore(1)
+            #end if
+            return self._semaphores[providerName]
+        #end with
+    #end def
+
+    def _run(self, providerName, fn, args, kwargs):
+        with self._semaphoreFor(providerName):
+            if not self.profile:
+                return fn(*args, **kwargs)
+            #end if
+
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self.profiles.append(profiler)
+                #end with
+            #end try
+        #end with
+    #end def
+
+    def submit(self, providerName, fn, *args, **kwargs):
+        """
+        Queue a call to fn for the given translator.
+
+        :param providerName: translator the call counts against
+        :param fn: callable performing the request
+        :return: concurrent.futures.Future with the result of fn
+        """
+        return self._executor.submit(self._run, providerName, fn, args, kwargs)
+    #end def
+
+    def shutdown(self, cancelPending=False):
+        """
+        Wait for the queued calls to finish, or only for the running ones with cancelPending.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=cancelPending)
+    #end def
+
+    def __enter__(self):
+        return self
+    #end def
+
+    def __exit__(self, excType, excValue, traceback):
+        self.shutdown()
+        return False
+    #end def
+#end class
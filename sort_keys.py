@@ -2,7 +2,10 @@
 import argparse
 import os.path
 
-from functions import readTranslations, clearContentsOfFile, writeTranslationToFile, writeCommentToFile
+from format_specifiers import lintValue, validateTranslations
+from functions import StringsWriter, readTranslations
+from parse_cache import ParseCache
+from translation_cache import DEFAULT_CACHE_DIR
 
 #TODO: Auto remove duplicate key / value pairs and report duplicates where their values don't match
 
@@ -21,8 +24,12 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-p", default="", help="set the path to the root directory where all the localized translations reside (i.e. directory with `fr.lproj` etc)")
 parser.add_argument("-f", default="Localizable.strings", help="set the name of the .strings file to look for")
 parser.add_argument("-o", default="en", help="set the origin locale for to extract missing translations from, default is english")
+parser.add_argument("--encoding", default="", help="set the encoding of the .strings files read (e.g. utf-8 or utf-16). Detected from their contents by default")
 args = parser.parse_args()
 
+# Cache of the parsed .strings files, shared with the other scripts
+parseCache = ParseCache(os.path.join(DEFAULT_CACHE_DIR, "parsed"))
+
 # Read and cache origin language once
 resourcePath = os.path.expanduser(args.p.strip())
 originLangKey = args.o.strip()
@@ -31,9 +38,9 @@ originPath = os.path.join(resourcePath, originLangKey + os.path.join(".lproj", s
 
 print("Reading source language: %s" % (originPath))
 
-originLines = readTranslations(originPath)
+originLines = readTranslations(originPath, encoding=args.encoding or None, parseCache=parseCache)
 
-clearContentsOfFile(stringsFileName, originLangKey)
+writer = StringsWriter(stringsFileName, originLangKey)
 
 print("Sorting localizations")
 totalLinesWritten = 0
@@ -61,91 +68,41 @@ for originLine in originLines:
     # end if
 # end for
 
-formatMisMatch = 0
+writtenLines = []
 for line in sorted(mismatchedTranslationLines, key = lambda i: str(i['key']).lower()):
-    stringName = line['key']
-    stringVal = line['value']
     stringComment = line['comment']
 
     if not stringComment:
         stringComment = ""
     #end if
 
-    # lint
-    stringVal = stringVal.replace("（", " (")
-    stringVal = stringVal.replace("）", ") ")
-    stringVal = stringVal.replace("％", "%")
-    stringVal = stringVal.replace("% @", "%@")
-    stringVal = stringVal.replace("\\ n", "\n")
-
-    writeTranslationToFile(stringsFileName, stringName, stringVal, stringComment, originLangKey)
-
-    # Some basic validation to confirm translation did not get rid of formatters in source text
-    totalFormattersInSource = stringName.count('%')
-    totalFormattersInOutput = stringVal.count('%')
-
-    if totalFormattersInSource != totalFormattersInOutput:
-        formatMisMatch += 1
-
-        print("\n  ..... !! WARNING !! Formatters don't match in: %s => %s\n" % (
-        stringName, stringVal))
-    #end if
-
-    formatterIndex = stringVal.find('%')
-    if formatterIndex != -1 and formatterIndex + 1 >= len(stringVal):
-        formatMisMatch += 1
-
-        print("\n  ..... !! WARNING !! Invalid formatter in: %s => %s\n" % (stringName, stringVal))
-    elif formatterIndex != -1 and len(stringVal) != formatterIndex and stringVal[formatterIndex + 1] not in ['u', 'l', '@', 'f', '1', '2', '3', 'd', '.']:
-        formatMisMatch += 1
-
-        print("\n  ..... !! WARNING !! Invalid formatter in: %s => %s\n" % (stringName, stringVal))
-    # end if
-
+    stringVal = lintValue(line['value'])
+    writer.writeTranslation(line['key'], stringVal, stringComment)
+    writtenLines.append((line['key'], stringVal))
 #end for
 
-writeCommentToFile(stringsFileName, "-------", originLangKey)
+writer.writeComment("-------")
 
 for line in sorted(normalLines, key = lambda i: str(i['key']).lower()):
-    stringName = line['key']
-    stringVal = line['value']
     stringComment = line['comment']
 
     if not stringComment:
         stringComment = ""
     #end if
 
-    # lint
-    stringVal = stringVal.replace("（", " (")
-    stringVal = stringVal.replace("）", ")")
-    stringVal = stringVal.replace("％", "%")
-    stringVal = stringVal.replace("% @", "%@")
-    stringVal = stringVal.replace("\\ n", "\n")
-
-    writeTranslationToFile(stringsFileName, stringName, stringVal, stringComment, originLangKey)
-
-    # Some basic validation to confirm translation did not get rid of formatters in source text
-    totalFormattersInSource = stringName.count('%')
-    totalFormattersInOutput = stringVal.count('%')
-
-    if totalFormattersInSource != totalFormattersInOutput:
-        formatMisMatch += 1
-
-        print("\n  ..... !! WARNING !! Formatters don't match in: %s => %s\n" % (
-        stringName, stringVal))
-    #end if
-
+    stringVal = lintValue(line['value'])
+    writer.writeTranslation(line['key'], stringVal, stringComment)
+    writtenLines.append((line['key'], stringVal))
+#end for
 
-    formatterIndex = stringVal.find('%')
-    if formatterIndex != -1 and formatterIndex + 1 >= len(stringVal):
-        formatMisMatch += 1
+writer.close()
 
-        print("\n  ..... !! WARNING !! Invalid formatter in: %s => %s\n" % (stringName, stringVal))
-    elif formatterIndex != -1 and len(stringVal) != formatterIndex and stringVal[formatterIndex + 1] not in ['u', 'l', '@', 'f', '1', '2', '3', 'd', '.']:
-        formatMisMatch += 1
+# Some basic validation to confirm values did not get rid of the formatters in their keys
+formatMisMatch = 0
+for (index, formatWarning) in validateTranslations(writtenLines):
+    formatMisMatch += 1
 
-        print("\n  ..... !! WARNING !! Invalid formatter in: %s => %s\n" % (stringName, stringVal))
-    # end if
+    print("\n  ..... !! WARNING !! %s: %s => %s\n" % (formatWarning, writtenLines[index][0], writtenLines[index][1]))
 #end for
 
 if formatMisMatch > 0:
@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+# Bumped whenever the entries produced by the parser change, so anything derived from parsed files can be invalidated
+PARSER_VERSION = 1
+
+class StringsSyntaxError(Exception):
+    """
+    Raised for invalid syntax in a .strings file, with the line and column (both starting at 1) where it was found.
+    """
+
+    def __init__(self, message, fileName, line, column):
+        Exception.__init__(self, "%s:%s:%s: %s" % (fileName, line, column, message))
+        self.fileName = fileName
+        self.line = line
+        self.column = column
+    #end def
+#end class
+
+def _isWordCharacter(character):
+    # Same characters as \w in a unicode regex
+    return character.isalnum() or character == "_"
+#end def
+
+class _StringsTokenizer:
+    """
+    Walks the contents of a .strings file one token at a time, using plain string searches instead of a regex.
+    """
+
+    def __init__(self, content, fileName):
+        self.content = content
+        self.fileName = fileName
+        self.length = len(content)
+        self.pos = 0
+    #end def
+
+    def error(self, message, pos=None):
+        if pos is None:
+            pos = self.pos
+        #end if
+
+        line = self.content.count("\n", 0, pos) + 1
+        column = pos - (self.content.rfind("\n", 0, pos) + 1) + 1
+        return StringsSyntaxError(message, self.fileName, line, column)
+    #end def
+
+    def skipWhitespace(self):
+        content = self.content
+        pos = self.pos
+        while pos < self.length and content[pos].isspace():
+            pos += 1
+        #end while
+        self.pos = pos
+    #end def
+
+    def expect(self, character):
+        self.skipWhitespace()
+        if self.pos >= self.length or self.content[self.pos] != character:
+            found = "end of file" if self.pos >= self.length else "'%s'" % (self.content[self.pos])
+            raise self.error("expected '%s', found %s" % (character, found))
+        #end if
+        self.pos += 1
+    #end def
+
+    def quoted(self):
+        """
+        Read a quoted string starting at the current position. Escapes are kept as they are in the file.
+        """
+        content = self.content
+        start = self.pos
+        search = start + 1
+        while True:
+            end = content.find('"', search)
+            if end == -1:
+                raise self.error("unterminated string", start)
+            #end if
+
+            # The quote is escaped when preceded by an odd number of backslashes
+            backslash = end - 1
+            while backslash > start and content[backslash] == "\\":
+                backslash -= 1
+            #end while
+
+            if (end - 1 - backslash) % 2 == 0:
+                self.pos = end + 1
+                return content[start + 1:end]
+            #end if
+            search = end + 1
+        #end while
+    #end def
+
+    def word(self):
+        """
+        Read an unquoted property key starting at the current position.
+        """
+        content = self.content
+        start = self.pos
+        pos = start
+        while pos < self.length and _isWordCharacter(content[pos]):
+            pos += 1
+        #end while
+        self.pos = pos
+        return content[start:pos]
+    #end def
+
+    def skipToNextLine(self):
+        nextLine = self.content.find("\n", self.pos)
+        self.pos = self.length if nextLine == -1 else nextLine + 1
+    #end def
+#end class
+
+def iterTranslations(content, fileName="<string>", strict=False, errors=None):
+    """
+    Parse the contents of a .strings file, yielding a dict with the key, value and comment of each translation as it
+    is found.
+
+    A /* */ comment belongs to a translation when it ends on the line right before it. Keys and values keep their
+    escapes as written in the file, keys may also be unquoted property names. // comments are skipped.
+
+    :param content: decoded contents of the file
+    :param fileName: file name used in syntax errors
+    :param strict: raise StringsSyntaxError on invalid syntax instead of printing it and skipping the line
+    :param errors: optional list the syntax errors skipped are added to
+    :return: generator of {'key', 'value', 'comment'} dicts
+    """
+    tokenizer = _StringsTokenizer(content, fileName)
+    length = tokenizer.length
+    comment = ""
+    commentAttachPos = -1
+
+    while True:
+        tokenizer.skipWhitespace()
+        pos = tokenizer.pos
+        if pos >= length:
+            break
+        #end if
+
+        try:
+            if content.startswith("/*", pos):
+                end = content.find("*/", pos + 2)
+                if end == -1:
+                    raise tokenizer.error("unterminated comment")
+                #end if
+
+                comment = content[pos + 2:end]
+
+                # The comment is attached to a translation starting right after the end of its line
+                after = end + 2
+                while after < length and content[after] in " \t":
+                    after += 1
+                #end while
+                commentAttachPos = after + 1 if after < length and content[after] == "\n" else -1
+
+                tokenizer.pos = end + 2
+                continue
+            #end if
+
+            if content.startswith("//", pos):
+                tokenizer.skipToNextLine()
+                continue
+            #end if
+
+            if content[pos] == '"':
+                key = tokenizer.quoted()
+            elif _isWordCharacter(content[pos]):
+                key = tokenizer.word()
+            else:
+                raise tokenizer.error("unexpected '%s'" % (content[pos]))
+            #end if
+
+            tokenizer.expect("=")
+            tokenizer.skipWhitespace()
+            if tokenizer.pos >= length or content[tokenizer.pos] != '"':
+                raise tokenizer.error("expected a quoted value")
+            #end if
+            value = tokenizer.quoted()
+            tokenizer.expect(";")
+        except StringsSyntaxError as e:
+            if strict:
+                raise
+            #end if
+
+            print("Invalid syntax: %s" % (e))
+            if errors is not None:
+                errors.append(e)
+            #end if
+
+            # Errors are raised at the position of the tokenizer. When it already moved past the line the entry
+            # started on, e.g. looking for the ";" missing at the end of the entry, the line it is on is parsed again
+            # rather than skipped
+            errorLineStart = content.rfind("\n", 0, tokenizer.pos) + 1
+            if errorLineStart > pos:
+                tokenizer.pos = errorLineStart
+            else:
+                tokenizer.skipToNextLine()
+            #end if
+            continue
+        #end try
+
+        yield {'key': key, 'value': value, 'comment': comment if pos == commentAttachPos else ''}
+    #end while
+#end def
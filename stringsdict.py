@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+import os.path
+import plistlib
+import re
+
+from functions import outputPathForTarget, writeFileAtomically
+from metrics import RunMetrics
+
+# Reads and writes .stringsdict files. Every string of a file (each variant of the variables of an entry) becomes a
+# translation of its own, keyed by its path in the file, e.g. "items_count/items/few", so it goes through the same
+# planning, caching and checks as the keys of .strings files. Values are escaped the way they are in .strings files
+# while they are translated.
+
+FORMAT_KEY = "NSStringLocalizedFormatKey"
+SPEC_TYPE_KEY = "NSStringFormatSpecTypeKey"
+VALUE_TYPE_KEY = "NSStringFormatValueTypeKey"
+PLURAL_RULE_TYPE = "NSStringPluralRuleType"
+KEY_SEPARATOR = "/"
+
+PLURAL_ORDER = ["zero", "one", "two", "few", "many", "other"]
+
+# CLDR plural categories of integer counts, by language. Languages not listed use one and other.
+PLURAL_CATEGORIES = {
+    'ar': ["zero", "one", "two", "few", "many", "other"],
+    'be': ["one", "few", "many", "other"],
+    'bs': ["one", "few", "other"],
+    'cs': ["one", "few", "many", "other"],
+    'cy': ["zero", "one", "two", "few", "many", "other"],
+    'ga': ["one", "two", "few", "many", "other"],
+    'he': ["one", "two", "other"],
+    'hr': ["one", "few", "other"],
+    'id': ["other"],
+    'ja': ["other"],
+    'km': ["other"],
+    'ko': ["other"],
+    'lo': ["other"],
+    'lt': ["one", "few", "many", "other"],
+    'lv': ["zero", "one", "other"],
+    'ms': ["other"],
+    'my': ["other"],
+    'pl': ["one", "few", "many", "other"],
+    'ro': ["one", "few", "other"],
+    'ru': ["one", "few", "many", "other"],
+    'sk': ["one", "few", "many", "other"],
+    'sl': ["one", "two", "few", "other"],
+    'sr': ["one", "few", "other"],
+    'th': ["other"],
+    'uk': ["one", "few", "many", "other"],
+    'vi': ["other"],
+    'zh': ["other"],
+}
+DEFAULT_PLURAL_CATEGORIES = ["one", "other"]
+
+_ESCAPE_PATTERN = re.compile(r'[\\"\n]')
+_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n'}
+_UNESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+_UNESCAPES = {'n': '\n', 'r': '\r', 't': '\t'}
+
+def isStringsdict(fileName):
+    return fileName.endswith(".stringsdict")
+#end def
+
+def escapeValue(value):
+    return _ESCAPE_PATTERN.sub(lambda match: _ESCAPES[match.group(0)], value)
+#end def
+
+def unescapeValue(value):
+    return _UNESCAPE_PATTERN.sub(lambda match: _UNESCAPES.get(match.group(1), match.group(1)), value)
+#end def
+
+def pluralCategories(outputTargetCode):
+    """
+    :return: plural categories used by a language, e.g. ["one", "few", "many", "other"] for "ru"
+    """
+    return PLURAL_CATEGORIES.get(outputTargetCode.split("-")[0].lower(), DEFAULT_PLURAL_CATEGORIES)
+#end def
+
+def isPluralRule(value):
+    return isinstance(value, dict) and value.get(SPEC_TYPE_KEY) == PLURAL_RULE_TYPE
+#end def
+
+def pluralComment(category):
+    return "Plural category: " + category
+#end def
+
+def loadStringsdict(fileName, metrics=None):
+    """
+    Read the plist of a .stringsdict file.
+
+    :param metrics: optional RunMetrics the timings are collected in
+    :return: dict of the file, empty if there is no such file
+    """
+    if not os.path.exists(fileName):
+        print(" ... no file found, returning empty translation")
+        return {}
+    #end if
+
+    with (metrics if metrics is not None else RunMetrics()).timed("read"):
+        with open(fileName, "rb") as stringsdictFile:
+            return plistlib.load(stringsdictFile)
+        #end with
+    #end with
+#end def
+
+def stringsdictTranslations(plist):
+    """
+    Flatten the strings of a .stringsdict plist into key / value / comment translations, in the order of the file.
+    The NSStringLocalizedFormatKey of an entry, which only references its variables, is copied to the outputs as is.
+    """
+    translations = []
+    for (entryKey, entry) in plist.items():
+        if not isinstance(entry, dict):
+            continue
+        #end if
+
+        for (name, value) in entry.items():
+            if name == FORMAT_KEY:
+                continue
+            elif isinstance(value, str):
+                translations.append({'key': entryKey + KEY_SEPARATOR + name, 'value': escapeValue(value),
+                                     'comment': None})
+            elif isinstance(value, dict):
+                for (variant, variantValue) in value.items():
+                    if variant in (SPEC_TYPE_KEY, VALUE_TYPE_KEY) or not isinstance(variantValue, str):
+                        continue
+                    #end if
+
+                    comment = pluralComment(variant) if isPluralRule(value) else None
+                    translations.append({'key': KEY_SEPARATOR.join([entryKey, name, variant]),
+                                         'value': escapeValue(variantValue), 'comment': comment})
+                #end for
+            #end if
+        #end for
+    #end for
+
+    return translations
+#end def
+
+def readStringsdict(fileName, metrics=None):
+    """
+    Read the strings of a .stringsdict file, see stringsdictTranslations.
+    """
+    return stringsdictTranslations(loadStringsdict(fileName, metrics=metrics))
+#end def
+
+def targetVariants(rule, outputTargetCode):
+    """
+    Plural categories written for a target language: the ones the language uses, and zero when the source has it
+    since iOS uses it for a count of 0 in every language.
+    """
+    categories = set(pluralCategories(outputTargetCode))
+    if "zero" in rule:
+        categories.add("zero")
+    #end if
+
+    return [category for category in PLURAL_ORDER if category in categories]
+#end def
+
+def translationsForTarget(plist, outputTargetCode):
+    """
+    Strings of a .stringsdict plist to translate for a target language. The plural variants of each variable are
+    the categories of the target language, a category missing from the source is translated from its "other" string.
+    """
+    translations = []
+    for translation in stringsdictTranslations(plist):
+        path = translation['key'].split(KEY_SEPARATOR)
+        if len(path) != 3 or not isPluralRule(plist[path[0]][path[1]]):
+            translations.append(translation)
+        #end if
+    #end for
+
+    # Put the plural variants back after the other strings of their entry, in the order of the file
+    expanded = []
+    byEntry = {}
+    for translation in translations:
+        byEntry.setdefault(translation['key'].split(KEY_SEPARATOR)[0], []).append(translation)
+    #end for
+    for (entryKey, entry) in plist.items():
+        if not isinstance(entry, dict):
+            continue
+        #end if
+
+        expanded += byEntry.get(entryKey, [])
+        for (name, rule) in entry.items():
+            if not isPluralRule(rule) or not isinstance(rule.get("other"), str):
+                continue
+            #end if
+
+            for category in targetVariants(rule, outputTargetCode):
+                value = rule.get(category)
+                if not isinstance(value, str):
+                    value = rule["other"]
+                #end if
+                expanded.append({'key': KEY_SEPARATOR.join([entryKey, name, category]), 'value': escapeValue(value),
+                                 'comment': pluralComment(category)})
+            #end for
+        #end for
+    #end for
+
+    return expanded
+#end def
+
+class StringsdictWriter:
+    """
+    Collects the translations of one output .stringsdict file and writes them, in the structure of the source file,
+    when closed. Entries missing their format key or the "other" string of a plural variable are left out, iOS can't
+    use them. Same interface as StringsWriter.
+    """
+
+    def __init__(self, stringsFileName, outputTargetCode, template, fileName=None, metrics=None):
+        self.fileName = fileName or outputPathForTarget(stringsFileName, outputTargetCode)
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.outputTargetCode = outputTargetCode
+        self.template = template
+        self.totalTranslations = 0
+        self._values = {}
+    #end def
+
+    def writeComment(self, comment):
+        # .stringsdict files have no comments
+        pass
+    #end def
+
+    def writeTranslation(self, sourceText, translatedText, comment, needsReview=False):
+        self._values[sourceText] = unescapeValue(translatedText)
+        self.totalTranslations += 1
+    #end def
+
+    def plist(self):
+        """
+        :return: dict of the output file
+        """
+        output = {}
+        for (entryKey, entry) in self.template.items():
+            if not isinstance(entry, dict):
+                continue
+            #end if
+
+            outputEntry = {}
+            complete = True
+            for (name, value) in entry.items():
+                path = entryKey + KEY_SEPARATOR + name
+                if name == FORMAT_KEY:
+                    outputEntry[name] = value
+                elif isinstance(value, str):
+                    if path not in self._values:
+                        complete = False
+                        break
+                    #end if
+                    outputEntry[name] = self._values[path]
+                elif isinstance(value, dict):
+                    outputRule = dict((key, ruleValue) for (key, ruleValue) in value.items()
+                                      if key in (SPEC_TYPE_KEY, VALUE_TYPE_KEY))
+                    variants = targetVariants(value, self.outputTargetCode) if isPluralRule(value) else \
+                        [key for key in value if key not in outputRule]
+                    for variant in variants:
+                        if path + KEY_SEPARATOR + variant in self._values:
+                            outputRule[variant] = self._values[path + KEY_SEPARATOR + variant]
+                        #end if
+                    #end for
+                    if isPluralRule(value) and "other" not in outputRule:
+                        complete = False
+                        break
+                    #end if
+                    outputEntry[name] = outputRule
+                else:
+                    outputEntry[name] = value
+                #end if
+            #end for
+
+            if complete:
+                output[entryKey] = outputEntry
+            #end if
+        #end for
+
+        return output
+    #end def
+
+    def getvalue(self):
+        return plistlib.dumps(self.plist(), fmt=plistlib.FMT_XML, sort_keys=False).decode("utf-8")
+    #end def
+
+    def close(self):
+        with self.metrics.timed("write"):
+            writeFileAtomically(self.fileName, self.getvalue())
+        #end with
+        self._values = {}
+    #end def
+
+    def discard(self):
+        self._values = {}
+    #end def
+#end class
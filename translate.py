@@ -1,344 +1,254 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 import argparse
+import cProfile
 import os
 import os.path
+import pstats
+import time
 
-import deepl
-from googletrans import Translator
-import openai
+from parse_cache import ParseCache
+from pipeline import TranslationPipeline, readLanguageCodes
+from providers import ProviderPluginError, createProvider, registerProvider
+from rate_limiter import AdaptiveRateLimiter, parseRateLimits
+from scheduler import DEFAULT_PROVIDER_CONCURRENCY, TranslationScheduler, parseConcurrencyLimits
+from translation_cache import DEFAULT_CACHE_DIR, TranslationCache
 
-# from googletrans import Translator
+# Command line interface of the translation pipeline, see pipeline.py to translate from another program
 
-from functions import readTranslations, writeTranslationToFile, clearContentsOfFile, read_open_ai_token
 parser = argparse.ArgumentParser()
 parser.add_argument("-t", default="google",
-                    help="set the translator to use. -t deepl for DeepL, -t google for Google Translate, -t openai for OpenAI. Defaults to google. For DeepL must also specify auth key with -a ")
+                    help="set the translator to use. -t deepl for DeepL, -t google for Google Translate, -t openai for OpenAI, -t http for a LibreTranslate compatible server (see --http-url), or the name of a translator plugin (see --plugin). Defaults to google. For DeepL must also specify auth key with -a ")
 parser.add_argument("-a", default="", help="set auth key to use for DeepL")
 parser.add_argument("-f", default="Localizable.strings",
                     help="set the path to the original Localizable.strings to read keys from")
+parser.add_argument("-p", default="",
+                    help="set the path to the root directory of a project to translate every .strings and .stringsdict file of the origin locale found under it (i.e. in `en.lproj` directories), instead of the single file given with -f")
 parser.add_argument("-o", default="en",
                     help="set the origin locale for auto translation, default is english")
-parser.add_argument("-d", default="", help="For delta translations. Set the path to the root directory where existing localized translations exist. If specified, this path will be used to check if a line / key has already been translated and skip translating that line. This way only the keys that do not exist in the existing destination file will be translated.")
+parser.add_argument("-d", default="", help="For delta translations. Set the path to the root directory where existing localized translations exist. If specified, this path will be used to check if a line / key has already been translated and skip translating that line. This way only the keys that do not exist in the existing destination file, or whose source changed since they were translated, will be translated. Existing translations of the other keys are carried over to the output.")
 parser.add_argument(
     "-e", default="0", help="emulate only. This will not perform any translation but instead emulate and print out details of strings that would need to be translated.")
 parser.add_argument("-v", default="0", help="Verbose")
-args = parser.parse_args()
-
-
-def translate_text_with_openai(text, source_lang, target_lang, context=None):
-    openai.api_key = read_open_ai_token()
-    prompt = f" Translate the following text from {source_lang} to {target_lang}: {text}."
-    adPrompt = f" Your goal is to translate text, but not to change it's meaning. You can use the following context to help you: {context}. All your answers strictly target language. don't add a period at the end and don't capitalize it if it's the original text not with a capital letter"
-    if context:
-        prompt = f"{adPrompt}\n\n{prompt}"
-
-    if args.v == "2":
-        print("---------------------------------------------")
-        print("  ..... OpenAI Prompt: %s" % (prompt))
-        print("---------------------------------------------")
-    # end if
-
-    response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        temperature=0,
-        max_tokens=1000,
-        stream=False,
-    )
-    if args.v == "2":
-        print("---------------------------------------------")
-        print("  ..... OpenAI response: %s" % (response))
-        print("---------------------------------------------")
+parser.add_argument("-j", default="",
+                    help="set the number of translation requests kept in flight across all languages. Either a single number applied to every translator (-j 1 translates sequentially) or per translator limits such as -j deepl=8,google=4. Defaults to a conservative limit per translator.")
+parser.add_argument("-b", default="0",
+                    help="set the maximum number of strings sent in one request to the translator. Defaults to the request limits of the translator, -b 1 sends one string per request.")
+parser.add_argument("--rate", default="",
+                    help="set the number of requests per second each translator starts at, adjusted while running when the translator throttles requests. Either a single number applied to every translator or per translator rates such as --rate deepl=10,google=2.5, 0 disables rate limiting. Defaults to a conservative rate per translator.")
+parser.add_argument("--retries", default="5",
+                    help="set the number of times a throttled or failed request is retried, with exponential backoff, before its strings are reported as failed")
+parser.add_argument("--plugin", action="append", default=[],
+                    help="add a translator plugin, given as module:Class or path/to/file.py:Class, selectable with -t by its name. Can be repeated")
+parser.add_argument("--http-url", default="",
+                    help="set the translate endpoint of the LibreTranslate compatible server used with -t http, default is http://localhost:5000/translate")
+parser.add_argument("--openai-batch", action="store_true",
+                    help="with -t openai, send many strings per chat request and ask for the translations as a JSON object, instead of one completion request per string")
+parser.add_argument("--openai-model", default="",
+                    help="set the chat model used with --openai-batch, default is gpt-4o-mini")
+parser.add_argument("--openai-tokens", default="",
+                    help="set the approximate number of prompt tokens per request with --openai-batch, default is 3000")
+parser.add_argument("--no-masking", action="store_true",
+                    help="send format specifiers and escape sequences to the translator as they are, instead of masking them with tokens it leaves alone")
+parser.add_argument("--batch-export", default="",
+                    help="with -t openai, write every string that needs translating to the given file as requests for the OpenAI Batch API (JSON lines), instead of translating them, then exit")
+parser.add_argument("--batch-ingest", default="",
+                    help="with -t openai, translate using the given results file of an OpenAI Batch API job exported with --batch-export, instead of sending requests")
+parser.add_argument("--resume", action="store_true",
+                    help="resume an interrupted run: strings it already translated are taken from its journal instead of being translated again")
+parser.add_argument("--watch", action="store_true",
+                    help="after translating, keep running and translate the keys changed in the source files as soon as they are saved, until stopped with Ctrl-C")
+parser.add_argument("--watch-interval", default="1",
+                    help="set the number of seconds between checks of the source files for changes with --watch, default is 1")
+parser.add_argument("--metrics", default="",
+                    help="set the file the JSON performance report of the run is written to, default is a new file under reports/ in the cache directory")
+parser.add_argument("--profile", default="",
+                    help="profile the run with cProfile, including the translation threads, and write the stats to the given file (read them with python3 -m pstats)")
+parser.add_argument("--encoding", default="",
+                    help="set the encoding of the .strings files read (e.g. utf-8 or utf-16). Detected from their contents by default")
+parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                    help="set the directory where the translation memory and other caches shared across runs are kept")
+parser.add_argument("--no-cache", action="store_true",
+                    help="bypass the translation memory, every string is sent to the translator and nothing is stored")
+parser.add_argument("--cache-warm", default="",
+                    help="warm the translation memory from the existing translations in the given root directory (i.e. directory with `fr.lproj` etc), then exit")
+parser.add_argument("--cache-prune", default="",
+                    help="remove translations not used for the given number of days from the translation memory, then exit")
+parser.add_argument("--cache-export", default="",
+                    help="export the translation memory to the given file as JSON lines, then exit")
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+
+    # Profile the main thread here, the translation threads are profiled by the scheduler
+    mainProfiler = None
+    if len(args.profile.strip()) != 0:
+        mainProfiler = cProfile.Profile()
+        mainProfiler.enable()
     # end if
 
-    if response.choices:
-        return response.choices[0].text.strip()
-    else:
-        return None
-    # end if
-# end def
-
-
-def translateSourceText(sourceText, translateTargetCode, context=None):
-    """
-    Return translation for source text using Google / DeepL
-    :param sourceText: source text to translate
-    :param translateTargetCode: target language (google translation code)
-    :return:
-    """
-
-    translatedText = sourceText
+    cacheDir = os.path.expanduser(args.cache_dir.strip())
+    parseCache = ParseCache(os.path.join(cacheDir, "parsed"))
 
     try:
-        if str(args.e).strip().lower() == "1":
-            if args.v == "1":
-                print("  ..... Translating in Emulation: %s" % (sourceText))
-            # end if
-
-            pass
-
-        elif str(args.t).strip().lower() == "openai":
-            result = translate_text_with_openai(
-                sourceText, "English", target_lang=translateTargetCode, context=context)
-            translatedText = result
-            if args.v == "1":
-                print("  ..... Translated with OpenAI: %s => %s" %
-                      (sourceText, translatedText))
-            # end if
-
-        elif str(args.t).strip().lower() == "deepl":
-            deeplTranslator = deepl.Translator(args.a)
-            result = deeplTranslator.translate_text(
-                sourceText, source_lang=args.o, target_lang=translateTargetCode)
-
-            translatedText = result.text
-
-            if args.v == "1":
-                print("  ..... Translated with DeepL: %s => %s" %
-                      (sourceText, translatedText))
-            # end if
-        else:
-            googleTranslator = Translator()
-            obj = googleTranslator.translate(
-                sourceText, src=args.o, dest=translateTargetCode)
-
-            translatedText = obj.text
-
-            if args.v == "1":
-                print("  ..... Translated with Google: %s => %s" %
-                      (sourceText, translatedText))
-            # end if
-        # end if
-    except Exception as e:
-        print("\n  ..... !! FAILED !! to translate for %s: %s = %s\n" %
-              (translateTargetCode, sourceText, e))
-
-        return (sourceText, False, False)
+        for pluginPath in args.plugin:
+            registerProvider(pluginPath)
+        # end for
+        provider = createProvider(args.t, authKey=args.a, verbose=args.v, options={
+            'openaiBatch': args.openai_batch,
+            'openaiModel': args.openai_model.strip(),
+            'openaiTokenBudget': args.openai_tokens.strip(),
+            'httpUrl': args.http_url.strip(),
+            'maskPlaceholders': not args.no_masking,
+        })
+    except ProviderPluginError as error:
+        print("ERROR: %s" % (error))
+        exit(1)
     # end try
 
-    # Deepl can produce translations with double quotes, we need to escape those properly
-    translatedText = translatedText.replace('\\N', '\\n')
-    translatedText = translatedText.replace('\\"', '"')
-    translatedText = translatedText.replace("\"", "\\\"")
-    translatedText = translatedText.replace("％", "%")
-    translatedText = translatedText.replace("% @", "%@")
-    translatedText = translatedText.replace("（", " (")
-    translatedText = translatedText.replace("）", ") ")
-    translatedText = translatedText.replace("% @", "%@")
-    translatedText = translatedText.replace("\\ n", "\n")
-    translatedText = translatedText.strip(' ')
-
-    # Some basic validation to confirm translation did not get rid of formatters in source text
-    totalFormattersInSource = sourceText.count('%')
-    totalFormattersInOutput = translatedText.count('%')
-
-    formatterFailed = False
-    if totalFormattersInSource != totalFormattersInOutput:
-        formatterFailed = True
-        print("\n  ..... !! WARNING !! Formatters don't match in: %s => %s (lang: %s)\n" % (
-            sourceText, translatedText, translateTargetCode))
-    elif translatedText.count('% ') != sourceText.count('% '):
-        formatterFailed = True
-        print("\n  ..... !! WARNING !! Formatters have an invalid space: %s => %s (lang: %s)\n" % (
-            sourceText, translatedText, translateTargetCode))
+    concurrencyDefaults = dict(DEFAULT_PROVIDER_CONCURRENCY)
+    concurrencyDefaults.setdefault(provider.name, provider.defaultConcurrency)
+    concurrencyLimits = parseConcurrencyLimits(args.j, concurrencyDefaults)
+    provider.concurrency = concurrencyLimits.get(provider.name, 1)
+    providerRate = parseRateLimits(args.rate).get(provider.name, 0)
+    if providerRate > 0:
+        provider.rateLimiter = AdaptiveRateLimiter(providerRate, burst=provider.concurrency)
+    # endif
+    if provider.name != "google":
+        print("Using %s translator" % (provider.friendlyName))
+    # endif
+
+    if (len(args.batch_export.strip()) != 0 or len(args.batch_ingest.strip()) != 0) and provider.name != "openai":
+        print("ERROR: --batch-export and --batch-ingest are only supported with -t openai")
+        exit(1)
+    # endif
+
+    if args.watch and (len(args.batch_export.strip()) != 0 or len(args.batch_ingest.strip()) != 0):
+        print("ERROR: --watch can't be used with --batch-export or --batch-ingest")
+        exit(1)
+    # endif
+
+    translationCache = None
+    if not args.no_cache or len(args.cache_warm.strip()) != 0 or len(args.cache_prune.strip()) != 0 \
+            or len(args.cache_export.strip()) != 0:
+        translationCache = TranslationCache(os.path.join(cacheDir, "translations.sqlite"))
     # end if
-    percent_index = translatedText.find('%')
-    if percent_index != -1 \
-            and len(translatedText) > percent_index + 1 \
-            and translatedText[translatedText.find('%') + 1] not in ['u', 'l', '@', 'f', '1', '2', '3', 'd', '.']:
-        formatterFailed = True
 
-        print("\n  ..... !! WARNING !! Invalid formatter: %s => %s (lang: %s)\n" % (
-            sourceText, translatedText, translateTargetCode))
+    scheduler = TranslationScheduler(concurrencyLimits, profile=mainProfiler is not None)
+    pipeline = TranslationPipeline(provider, readLanguageCodes('LanguageCodes.txt'), sourceLang=args.o,
+                                   cacheDir=cacheDir, translationCache=translationCache, parseCache=parseCache,
+                                   scheduler=scheduler, existingPath=args.d.strip() or None,
+                                   emulate=str(args.e).strip().lower() == "1", maxBatchItems=int(args.b),
+                                   retries=int(args.retries), encoding=args.encoding, verbose=args.v)
+
+    # Read and cache origin language once, for the single file given with -f or every file of the project given with -p
+    projectPath = None
+    if len(args.p.strip()) != 0:
+        projectPath = os.path.expanduser(args.p.strip())
+        sources = pipeline.readProject(projectPath)
+    else:
+        sources = pipeline.readSources([args.f.strip()])
     # end if
 
-    return (translatedText, True, formatterFailed)
-# end def
-
-
-def translationNeeded(translationTuple, translateTargetCode, existingTranslations):
-    """
-    Check if translation is required for a given source key. If not delta-translating, this will always return True
-    other wise False if translation key found in original target Localizable.strings file.
-
-    :param translationTuple: key / value
-    :param translateTargetCode:  target language
-    :param existingTranslations:  existing target translations
-    :return: True if needed, False if translation was found in the original target.
-    """
-    stringName = translationTuple['key']
-    sourceText = translationTuple['value']
-
-    for existingTranslation in existingTranslations:
-        existingKey = existingTranslation['key']
-        if existingKey == stringName:
-            return False
-        # end if
-    # end for
-
-    return True
-# end def
-
-
-def translateLineInFile(translationTuple, translateTargetCode, outputTargetCode):
-    """
-    Translate a given key / value tuple to a target language.
-
-    :param translationTuple: key / value
-    :param translateTargetCode:  target language
-    :param outputTargetCode:  output target code
-    """
-    stringName = translationTuple['key']
-    sourceText = translationTuple['value']
-    stringComment = translationTuple['comment']
-
-    if not stringComment:
-        stringComment = ""
+    if len(args.cache_warm.strip()) != 0:
+        pipeline.warmCache(sources, os.path.expanduser(args.cache_warm.strip()))
     # end if
 
-    (translation, success, warning) = translateSourceText(
-        sourceText, translateTargetCode, context=stringComment)
-
-    if success:
-        # Only save translated lines
-        if str(args.e).strip().lower() == "1":
-            # Emulating only
-            pass
-        else:
-            writeTranslationToFile(
-                stringsFileName, stringName, translation, stringComment, outputTargetCode)
-        # end if
+    if len(args.cache_prune.strip()) != 0:
+        print("Pruned translations from translation memory: %s" % (translationCache.prune(args.cache_prune.strip())))
     # end if
 
-    return (success, warning)
-# end def
-
-
-def translateFile(stringsFileName, translateFriendlyName, translateTargetCode, outputTargetCode):
-    """
-    Translate source language for the given target language / output file
-    :param stringsFileName: The .strings file name
-    :param translateFriendlyName: friendly name for printing
-    :param translateTargetCode: google translation target code
-    :param outputTargetCode: output target code
-    :return:
-    """
-    print("Translating for: " + translateFriendlyName)
-    if len(args.d.strip()) == 0:
-        clearContentsOfFile(stringsFileName, outputTargetCode)
+    if len(args.cache_export.strip()) != 0:
+        print("Exported translations from translation memory: %s" % (
+            translationCache.export(os.path.expanduser(args.cache_export.strip()))))
     # end if
 
-    # When delta-translating, pre-load existing translations to compare against
-    existingOutputTranslations = []
-    if len(args.d.strip()) != 0:
-        fullExistingPath = os.path.expanduser(args.d.strip())
-
-        pathToExistingFile = os.path.join(
-            fullExistingPath, outputTargetCode + os.path.join(".lproj", stringsFileName))
-
-        print("Reading existing Localizable.strings from path: %s" %
-              (pathToExistingFile))
-
-        existingOutputTranslations = readTranslations(pathToExistingFile)
-
-        print("  ... will only translate new keys. Existing translations found: %s keys" % (
-            len(existingOutputTranslations)))
+    if len(args.cache_warm.strip()) != 0 or len(args.cache_prune.strip()) != 0 or len(args.cache_export.strip()) != 0:
+        translationCache.close()
+        exit(0)
     # end if
 
-    totalLinesTranslated = 0
-    totalLinesNeeded = 0
-    totalSkipped = 0
-    totalWarnings = 0
-    for translationTuple in originLines:
-        if translationNeeded(translationTuple, translateTargetCode, existingOutputTranslations):
-            totalLinesNeeded += 1
-
-            (success, warning) = translateLineInFile(
-                translationTuple, translateTargetCode, outputTargetCode)
-            if success:
-                totalLinesTranslated += 1
-            # end if
-            if warning:
-                totalWarnings += 1
-            # end if
-        else:
-            totalSkipped += 1
-            if args.v == "1":
-                print("  ........... skipping already translated key: %s" %
-                      (translationTuple['key']))
-            # end if
+    if len(args.batch_export.strip()) != 0:
+        # Write the requests for every language to a single job file, to be run with the Batch API and ingested later
+        batchExportPath = os.path.expanduser(args.batch_export.strip())
+        print("Wrote %s batch requests to %s" % (pipeline.exportBatchRequests(sources, batchExportPath),
+                                                 batchExportPath))
+        if translationCache is not None:
+            translationCache.close()
         # end if
-    # end for
-
-    if totalWarnings != 0:
-        print("ERROR: CHECK WARNINGS. Total reported %s" % (totalWarnings))
+        exit(0)
     # end if
 
-    if totalLinesNeeded != totalLinesTranslated:
-        print("ERROR: NOT ALL LINES TRANSLATED. Total lines translated for %s: %s. Original source count: %s" % (
-            translateFriendlyName, totalLinesTranslated, totalLinesNeeded))
-    else:
-        if len(args.d.strip()) != 0:
-            print("SUCCESS: New lines translated for %s: %s, skipped: %s" %
-                  (translateFriendlyName, totalLinesTranslated, totalSkipped))
-        else:
-            print("SUCCESS: Total lines translated for %s: %s" %
-                  (translateFriendlyName, totalLinesTranslated))
-        # endif
+    if len(args.batch_ingest.strip()) != 0:
+        batchIngestPath = os.path.expanduser(args.batch_ingest.strip())
+        print("Read %s batch results from %s\n" % (pipeline.ingestBatchResults(batchIngestPath), batchIngestPath))
     # end if
-# end def
-
 
-if str(args.t).strip().lower() == "deepl":
-    print("Using DeepL translator")
-# endif
-
-if str(args.t).strip().lower() == "openai":
-    print("Using OpenAI translator")
-# endif
-
-# Read and cache origin language once
-originPath = os.path.expanduser(args.f.strip())
-dirName, stringsFileName = os.path.split(originPath)
-print("Reading source language: %s" % (originPath))
-print("Will use filename: %s" % (stringsFileName))
-
-originLines = readTranslations(originPath)
-
-print("Total lines in source: %s\n" % (len(originLines)))
+    try:
+        for result in pipeline.translate(sources, resume=args.resume):
+            pass
+        # end for
 
-with open('LanguageCodes.txt', 'r') as supportedLangCodeFile:
-    for targetLine in supportedLangCodeFile:
+        if args.watch:
+            # Keep the translator, the scheduler and the translation memory around for the changes to come
+            for result in pipeline.watch(sources, float(args.watch_interval)):
+                pass
+            # end for
+        # end if
 
-        if targetLine.strip().startswith("#"):
-            continue
+        scheduler.shutdown()
+        provider.close()
+    except KeyboardInterrupt:
+        scheduler.shutdown(cancelPending=True)
+        exit(1)
+    finally:
+        # Record the translations used so far, also when interrupted, once no request is running anymore
+        if translationCache is not None:
+            translationCache.close()
         # end if
+    # end try
 
-        targetArray = targetLine.split()
-        translateFriendlyName = targetArray[0]
-        googleTranslateTargetCode = targetArray[1]
-        deeplTranslateTargetCode = targetArray[2]
-        outputTargetCode = targetArray[3]
+    if provider.rateLimiter is not None and provider.rateLimiter.throttled != 0:
+        print("Throttled by %s %s times, request rate settled at %.1f per second" % (
+            provider.friendlyName, provider.rateLimiter.throttled, provider.rateLimiter.rate))
+    # end if
 
-        if deeplTranslateTargetCode.strip() == "-" and str(args.t).strip().lower() == "deepl":
-            print("Ignoring non-supported language for DeepL: %s" %
-                  (translateFriendlyName))
-            continue
-        # endif
+    if translationCache is not None:
+        print("Translation memory hits: %s, misses: %s" % (translationCache.hits, translationCache.misses))
+    # end if
 
-        useLangCode = googleTranslateTargetCode
-        if str(args.t).strip().lower() == "deepl":
-            useLangCode = deeplTranslateTargetCode
-        # end if
+    # Report where the run spent its time, kept per run so regressions can be tracked over time
+    metrics = pipeline.metrics
+    if translationCache is not None:
+        metrics.setCounter("translationMemoryHits", translationCache.hits)
+        metrics.setCounter("translationMemoryMisses", translationCache.misses)
+    # end if
+    metrics.setCounter("parseCacheHits", parseCache.hits)
+    metrics.setCounter("parseCacheMisses", parseCache.misses)
+    if provider.rateLimiter is not None:
+        metrics.setCounter("throttled", provider.rateLimiter.throttled)
+    # end if
 
-        if str(args.t).strip().lower() == "openai":
-            useLangCode = translateFriendlyName
-        # end if
+    metricsPath = os.path.expanduser(args.metrics.strip()) or os.path.join(
+        cacheDir, "reports", "translate-%s.json" % (time.strftime("%Y%m%d-%H%M%S")))
+    metrics.writeReport(metricsPath, {'translator': provider.name, 'source': projectPath or sources[0]['originPath'],
+                                      'files': len(sources), 'emulated': pipeline.emulate,
+                                      'targetLanguages': len(pipeline.targetLanguages)})
+    print("Wrote performance report to %s" % (metricsPath))
+
+    if mainProfiler is not None:
+        mainProfiler.disable()
+        profileStats = pstats.Stats(mainProfiler)
+        for workerProfiler in scheduler.profiles:
+            profileStats.add(workerProfiler)
+        # end for
+        profileStats.dump_stats(os.path.expanduser(args.profile.strip()))
+        print("Wrote profile to %s" % (args.profile.strip()))
+    # end if
+# end def
 
-        translateFile(stringsFileName, translateFriendlyName,
-                      useLangCode, outputTargetCode)
 
-        print("\n")
-    # end for
-# end def
+if __name__ == "__main__":
+    main()
+# end if
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+import hashlib
+import json
+import os
+import os.path
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = ".auto_localize_cache"
+
+def contextHash(context):
+    """
+    Hash of the comment / context a string was translated with.
+    """
+    return hashlib.sha1((context or "").strip().encode("utf-8")).hexdigest()
+#end def
+
+class TranslationCache:
+    """
+    Local translation memory stored in SQLite, shared across runs. Translations are keyed on the translator, source
+    language, target language code, source text and a hash of the context they were translated with, so a string
+    is only sent to the translator again when one of these changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        #end if
+
+        self._lock = threading.Lock()
+        self._usedRows = set()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " provider TEXT NOT NULL,"
+            " source_lang TEXT NOT NULL,"
+            " target TEXT NOT NULL,"
+            " source_text TEXT NOT NULL,"
+            " context_hash TEXT NOT NULL,"
+            " translation TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used_at REAL NOT NULL,"
+            " PRIMARY KEY (provider, source_lang, target, source_text, context_hash))")
+        self._connection.commit()
+    #end def
+
+    def getMany(self, provider, sourceLang, target, sourceTexts, contexts):
+        """
+        Look up cached translations for a list of source texts.
+
+        :return: list with the cached translation, or None, for each source text
+        """
+        results = []
+        with self._lock:
+            for (sourceText, context) in zip(sourceTexts, contexts):
+                row = (provider, sourceLang, target, sourceText, contextHash(context))
+                found = self._connection.execute(
+                    "SELECT translation FROM translations WHERE provider = ? AND source_lang = ? AND target = ?"
+                    " AND source_text = ? AND context_hash = ?", row).fetchone()
+
+                if found is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    self._usedRows.add(row)
+                    results.append(found[0])
+                #end if
+            #end for
+        #end with
+
+        return results
+    #end def
+
+    def get(self, provider, sourceLang, target, sourceText, context=""):
+        return self.getMany(provider, sourceLang, target, [sourceText], [context])[0]
+    #end def
+
+    def putMany(self, provider, sourceLang, target, entries):
+        """
+        Store translations in the cache.
+
+        :param entries: list of (sourceText, context, translation) tuples
+        """
+        now = time.time()
+        rows = [(provider, sourceLang, target, sourceText, contextHash(context), translation, now, now)
+                for (sourceText, context, translation) in entries]
+        if not rows:
+            return
+        #end if
+
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO translations"
+                " (provider, source_lang, target, source_text, context_hash, translation, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._connection.commit()
+        #end with
+    #end def
+
+    def put(self, provider, sourceLang, target, sourceText, context, translation):
+        self.putMany(provider, sourceLang, target, [(sourceText, context, translation)])
+    #end def
+
+    def prune(self, olderThanDays):
+        """
+        Remove translations that have not been used for the given number of days.
+
+        :return: number of translations removed
+        """
+        cutoff = time.time() - float(olderThanDays) * 24 * 60 * 60
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM translations WHERE last_used_at < ?", (cutoff,))
+            self._connection.commit()
+            removed = cursor.rowcount
+            self._connection.execute("VACUUM")
+        #end with
+
+        return removed
+    #end def
+
+    def export(self, fileName):
+        """
+        Export every cached translation as JSON lines.
+
+        :return: number of translations exported
+        """
+        total = 0
+        with self._lock, open(fileName, "w", encoding="utf-8") as exportFile:
+            for row in self._connection.execute(
+                    "SELECT provider, source_lang, target, source_text, context_hash, translation"
+                    " FROM translations ORDER BY provider, source_lang, target, source_text"):
+                exportFile.write(json.dumps({
+                    'provider': row[0],
+                    'source_lang': row[1],
+                    'target': row[2],
+                    'source_text': row[3],
+                    'context_hash': row[4],
+                    'translation': row[5],
+                }, ensure_ascii=False) + "\n")
+                total += 1
+            #end for
+        #end with
+
+        return total
+    #end def
+
+    def close(self):
+        """
+        Record when the translations read during this run were last used, then close the database.
+        """
+        with self._lock:
+            if self._usedRows:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE translations SET last_used_at = ? WHERE provider = ? AND source_lang = ? AND target = ?"
+                    " AND source_text = ? AND context_hash = ?", [(now,) + row for row in self._usedRows])
+                self._connection.commit()
+                self._usedRows = set()
+            #end if
+            self._connection.close()
+        #end with
+    #end def
+#end class
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+class TranslationPlan:
+    """
+    Every string a run needs translated, for every language, merged into unique work items before any request is
+    sent. Keys sharing the same source text and context for the same target language (e.g. twenty keys with the
+    value "OK") are translated once, and the result is handed to each key.
+    """
+
+    def __init__(self):
+        self.totalStrings = 0
+        self._items = {}
+        self._itemsByCode = {}
+    #end def
+
+    def add(self, translateTargetCode, translationTuple, context, outputTargetCode, sourceName):
+        """
+        Add a key needing translation to the plan.
+
+        :param translateTargetCode: target language code of the translator
+        :param translationTuple: key / value / comment of the key in the source language
+        :param context: context sent with the source text, strings only merge when it is the same
+        :param outputTargetCode: output target code of the language needing the key
+        :param sourceName: name of the source file of the key
+        :return: work key to look the translation up with resultOf
+        """
+        workKey = (translateTargetCode, translationTuple['value'], context)
+        self.totalStrings += 1
+
+        item = self._items.get(workKey)
+        if item is None:
+            # The first key needing a text represents it in requests
+            item = {'workKey': workKey, 'translationTuple': translationTuple, 'outputTargetCode': outputTargetCode,
+                    'sourceName': sourceName, 'uses': 0, 'future': None, 'position': None, 'result': None}
+            self._items[workKey] = item
+            self._itemsByCode.setdefault(translateTargetCode, []).append(item)
+        #end if
+        item['uses'] += 1
+
+        return workKey
+    #end def
+
+    def uniqueItems(self, translateTargetCode):
+        """
+        :return: unique work items for a target language, in the order they were first needed
+        """
+        return self._itemsByCode.get(translateTargetCode, [])
+    #end def
+
+    def targetCodes(self):
+        return list(self._itemsByCode)
+    #end def
+
+    def totalUnique(self):
+        return len(self._items)
+    #end def
+
+    def setPending(self, items, future):
+        """
+        Record the future returning the results of a request for the given work items, in the same order.
+        """
+        for (position, item) in enumerate(items):
+            item['future'] = future
+            item['position'] = position
+        #end for
+    #end def
+
+    def setResult(self, item, result):
+        """
+        Record the result of a work item known without sending a request, e.g. resumed from a journal.
+        """
+        item['result'] = result
+    #end def
+
+    def cancelPending(self):
+        """
+        Cancel the requests of the plan not started yet.
+
+        :return: set of the futures of the requests still running
+        """
+        running = set()
+        for item in self._items.values():
+            future = item['future']
+            if future is not None and not future.cancel() and not future.done():
+                running.add(future)
+            #end if
+        #end for
+
+        return running
+    #end def
+
+    def resultOf(self, workKey):
+        """
+        Wait for the result of a work item.
+        """
+        item = self._items[workKey]
+        if item['result'] is not None:
+            return item['result']
+        #end if
+
+        return item['future'].result()[item['position']]
+    #end def
+#end class
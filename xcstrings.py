@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+import json
+import os.path
+
+from functions import openFileAtomically
+from metrics import RunMetrics
+from stringsdict import KEY_SEPARATOR, escapeValue, pluralComment, targetVariants, unescapeValue
+
+# Reads and writes Xcode String Catalogs (.xcstrings), which keep every language of a table in one JSON file. A
+# catalog is parsed once and shared by every language of the run: each string unit of the source language (plain,
+# plural / device variations and substitutions) becomes a translation of its own keyed by its path in the catalog,
+# e.g. "items_count/plural/few", and the translations of every language are put back into the same catalog, written
+# once at the end of the run. Units of a language already in the "translated" state are carried over without being
+# translated again, translations with formatter warnings are written in the "needs_review" state.
+
+STATE_NEW = "new"
+STATE_TRANSLATED = "translated"
+STATE_NEEDS_REVIEW = "needs_review"
+
+SUBSTITUTIONS_KEY = "substitutions"
+SUBSTITUTION_FIELDS = ("argNum", "formatSpecifier")
+
+def isCatalog(fileName):
+    return fileName.endswith(".xcstrings")
+#end def
+
+def loadCatalog(fileName, metrics=None):
+    """
+    Parse a String Catalog, streaming it from the file.
+
+    :param metrics: optional RunMetrics the timings are collected in
+    :return: dict of the catalog, empty if there is no such file
+    """
+    if not os.path.exists(fileName):
+        print(" ... no file found, returning empty translation")
+        return {'sourceLanguage': "en", 'strings': {}, 'version': "1.0"}
+    #end if
+
+    with (metrics if metrics is not None else RunMetrics()).timed("read"):
+        with open(fileName, "r", encoding="utf-8") as catalogFile:
+            return json.load(catalogFile)
+        #end with
+    #end with
+#end def
+
+def translatable(entry):
+    """
+    Whether an entry of the catalog is translated: entries marked as not to be translated, and stale ones no longer
+    found in the code, are left alone.
+    """
+    return entry.get('shouldTranslate', True) and entry.get('extractionState') != "stale"
+#end def
+
+def _walkLocalization(localization, path, outputTargetCode, units):
+    """
+    Collect (path, string unit) of a localization and its variations and substitutions. With a target language,
+    plural variations get the categories of that language, a category missing from the localization being taken
+    from its "other" variant.
+    """
+    if 'stringUnit' in localization:
+        units.append((path, localization['stringUnit']))
+    #end if
+
+    for (name, substitution) in localization.get(SUBSTITUTIONS_KEY, {}).items():
+        _walkVariations(substitution.get('variations', {}), path + (SUBSTITUTIONS_KEY, name), outputTargetCode, units)
+    #end for
+    _walkVariations(localization.get('variations', {}), path, outputTargetCode, units)
+#end def
+
+def _walkVariations(variations, path, outputTargetCode, units):
+    for (kind, variants) in variations.items():
+        names = list(variants)
+        if kind == "plural" and outputTargetCode is not None and "other" in variants:
+            names = targetVariants(variants, outputTargetCode)
+        #end if
+
+        for name in names:
+            _walkLocalization(variants.get(name, variants.get("other")), path + (kind, name), outputTargetCode, units)
+        #end for
+    #end for
+#end def
+
+def unitKey(catalogKey, path):
+    return KEY_SEPARATOR.join((catalogKey,) + path)
+#end def
+
+def catalogTranslations(catalog, outputTargetCode=None):
+    """
+    Flatten the string units of the source language into key / value / comment translations, in the order of the
+    catalog. Each translation also has its catalogKey and unitPath, used to write it back.
+
+    :param catalog: dict of the catalog
+    :param outputTargetCode: optional target language, plural variations then get the categories of that language
+    """
+    sourceLanguage = catalog.get('sourceLanguage', "en")
+    translations = []
+    for (catalogKey, entry) in catalog.get('strings', {}).items():
+        if not translatable(entry):
+            continue
+        #end if
+
+        # Entries without a localization of the source language are translated from their key
+        sourceLocalization = entry.get('localizations', {}).get(sourceLanguage)
+        if sourceLocalization is None:
+            sourceLocalization = {'stringUnit': {'state': STATE_TRANSLATED, 'value': catalogKey}}
+        #end if
+
+        units = []
+        _walkLocalization(sourceLocalization, (), outputTargetCode, units)
+        for (path, stringUnit) in units:
+            comment = entry.get('comment')
+            if len(path) >= 2 and path[-2] == "plural":
+                comment = "%s. %s" % (comment, pluralComment(path[-1])) if comment else pluralComment(path[-1])
+            #end if
+
+            translations.append({'key': unitKey(catalogKey, path), 'value': escapeValue(stringUnit.get('value', "")),
+                                 'comment': comment, 'catalogKey': catalogKey, 'unitPath': path})
+        #end for
+    #end for
+
+    return translations
+#end def
+
+def translatedUnits(catalog, outputTargetCode):
+    """
+    Existing translations of a language in the "translated" state, which don't need translating again.
+    """
+    translations = []
+    for (catalogKey, entry) in catalog.get('strings', {}).items():
+        localization = entry.get('localizations', {}).get(outputTargetCode)
+        if localization is None:
+            continue
+        #end if
+
+        units = []
+        _walkLocalization(localization, (), None, units)
+        for (path, stringUnit) in units:
+            if stringUnit.get('state') == STATE_TRANSLATED:
+                translations.append({'key': unitKey(catalogKey, path), 'value': escapeValue(stringUnit.get('value', "")),
+                                     'comment': entry.get('comment')})
+            #end if
+        #end for
+    #end for
+
+    return translations
+#end def
+
+class CatalogLanguageWriter:
+    """
+    Collects the translations of one language of a catalog and puts them into the catalog when closed. Same
+    interface as StringsWriter.
+    """
+
+    def __init__(self, catalogWriter, outputTargetCode, translations):
+        self.catalogWriter = catalogWriter
+        self.outputTargetCode = outputTargetCode
+        self.totalTranslations = 0
+        self._units = dict((translation['key'], translation) for translation in translations)
+        self._values = []
+    #end def
+
+    def writeComment(self, comment):
+        pass
+    #end def
+
+    def writeTranslation(self, sourceText, translatedText, comment, needsReview=False):
+        self._values.append((self._units[sourceText], unescapeValue(translatedText), needsReview))
+        self.totalTranslations += 1
+    #end def
+
+    def close(self):
+        for (translation, value, needsReview) in self._values:
+            self.catalogWriter.setUnit(translation['catalogKey'], self.outputTargetCode, translation['unitPath'], value,
+                                       STATE_NEEDS_REVIEW if needsReview else STATE_TRANSLATED)
+        #end for
+        self._values = []
+    #end def
+
+    def discard(self):
+        self._values = []
+    #end def
+#end class
+
+class CatalogWriter:
+    """
+    Puts the translations of every language into a catalog, and writes it once all languages are done.
+    """
+
+    def __init__(self, catalog, fileName, metrics=None):
+        self.catalog = catalog
+        self.fileName = fileName
+        self.metrics = metrics if metrics is not None else RunMetrics()
+    #end def
+
+    def languageWriter(self, outputTargetCode, translations):
+        """
+        :param translations: translations of the language, as returned by catalogTranslations
+        """
+        return CatalogLanguageWriter(self, outputTargetCode, translations)
+    #end def
+
+    def setUnit(self, catalogKey, outputTargetCode, path, value, state):
+        """
+        Set the string unit of a language at the given path, creating its variations and substitutions. A unit
+        already holding the same value keeps its state.
+        """
+        entry = self.catalog['strings'][catalogKey]
+        sourceLocalization = entry.get('localizations', {}).get(self.catalog.get('sourceLanguage', "en"), {})
+        node = entry.setdefault('localizations', {}).setdefault(outputTargetCode, {})
+        for index in range(0, len(path), 2):
+            if path[index] == SUBSTITUTIONS_KEY:
+                substitution = node.setdefault(SUBSTITUTIONS_KEY, {}).setdefault(path[index + 1], {})
+                sourceSubstitution = sourceLocalization.get(SUBSTITUTIONS_KEY, {}).get(path[index + 1], {})
+                for field in SUBSTITUTION_FIELDS:
+                    if field in sourceSubstitution:
+                        substitution.setdefault(field, sourceSubstitution[field])
+                    #end if
+                #end for
+                node = substitution
+            else:
+                node = node.setdefault('variations', {}).setdefault(path[index], {}).setdefault(path[index + 1], {})
+            #end if
+        #end for
+
+        stringUnit = node.get('stringUnit')
+        if stringUnit is not None and stringUnit.get('value') == value:
+            return
+        #end if
+        node['stringUnit'] = {'state': state, 'value': value}
+    #end def
+
+    def close(self):
+        """
+        Write the catalog in the layout written by Xcode, streamed to the file rather than built in memory first.
+        """
+        with self.metrics.timed("write"):
+            with openFileAtomically(self.fileName) as catalogFile:
+                json.dump(self.catalog, catalogFile, ensure_ascii=False, indent=2, separators=(",", " : "),
+                          sort_keys=True)
+                catalogFile.write("\n")
+            #end with
+        #end with
+    #end def
+#end class